@@ -0,0 +1,11 @@
+import os
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings")
+
+django.setup(set_prefix=False)
+
+from weather.asgi import ASGIHandler  # noqa: E402, needs the apps loaded by django.setup
+
+application = ASGIHandler()
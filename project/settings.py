@@ -1,4 +1,5 @@
 import os
+from urllib.parse import quote
 
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -25,6 +26,7 @@ INSTALLED_APPS = [
 ] + PROJECT_APPS
 
 MIDDLEWARE = [
+    'weather.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,6 +76,89 @@ USE_TZ = True
 STATIC_URL = '/static/'
 
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Responses of the weather API, keyed on the dataset version so entries never need to expire. Set the backend to
+    # django.core.cache.backends.filebased.FileBasedCache and the location to a directory to share it between workers.
+    'weather': {
+        'BACKEND': os.environ.get('WEATHER_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('WEATHER_CACHE_LOCATION', 'weather'),
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('WEATHER_CACHE_MAX_ENTRIES', 1000)),
+        },
+    },
+}
+
+# Runs the tests with their own dataset version file and without the response cache.
+TEST_RUNNER = 'weather.tests.runner.WeatherTestRunner'
+
+
+# Weather dataset settings
+
+WEATHER_DATASET_VERSION_FILE = os.path.join(BASE_DIR, 'weather_db.version')
+
+WEATHER_RESPONSE_CACHE = True
+
+WEATHER_CACHE_ALIAS = 'weather'
+
+# Identical concurrent requests in a worker wait for one run of the view, for at most the timeout in seconds.
+WEATHER_COALESCE_REQUESTS = True
+
+WEATHER_COALESCE_TIMEOUT = 30
+
+# Threads running the views under project.asgi, bytes per body message and chunks of a streamed body buffered
+# ahead of a slow client.
+WEATHER_ASGI_THREADS = int(os.environ.get('WEATHER_ASGI_THREADS', min(32, (os.cpu_count() or 1) + 4)))
+
+WEATHER_ASGI_CHUNK_SIZE = 64 * 1024
+
+WEATHER_ASGI_STREAM_BUFFER = 8
+
+# Directory of the export files, threads writing them, 0 to export within the request, and seconds after which an
+# export still in progress is taken as lost and started again.
+WEATHER_EXPORT_DIR = os.environ.get('WEATHER_EXPORT_DIR', os.path.join(BASE_DIR, 'exports'))
+
+WEATHER_EXPORT_WORKERS = int(os.environ.get('WEATHER_EXPORT_WORKERS', 2))
+
+WEATHER_EXPORT_TIMEOUT = 60 * 60
+
+# Answers the weather list from per city arrays held in memory, needs numpy.
+WEATHER_TIMESERIES_STORE = os.environ.get('WEATHER_TIMESERIES_STORE', '') == '1'
+
+# Memory mapped by every worker process, written by build_snapshot and load_data.
+WEATHER_SNAPSHOT_FILE = os.path.join(BASE_DIR, 'weather_db.snapshot')
+
+# Times each request in a Server-Timing header, a log line and the /api/stats/ percentiles. The middleware removes
+# itself when this is off.
+WEATHER_INSTRUMENTATION = os.environ.get('WEATHER_INSTRUMENTATION', '') == '1'
+
+# Pragmas run on each new SQLite connection, set by the production profile.
+WEATHER_SQLITE_PRAGMAS = {}
+
+# WEATHER_DB_PROFILE=production keeps the connections open between requests, runs the DB in WAL mode with memory
+# mapped reads and a larger page cache, and sends the reads to a read only connection so that load_data and the API
+# do not block each other.
+WEATHER_DB_PROFILE = os.environ.get('WEATHER_DB_PROFILE', '')
+
+if WEATHER_DB_PROFILE == 'production':
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('WEATHER_CONN_MAX_AGE', 600))
+    DATABASES['readonly'] = dict(
+        DATABASES['default'], NAME='file:{}?mode=ro'.format(quote(DATABASES['default']['NAME'])),
+        OPTIONS={'uri': True}, TEST={'MIRROR': 'default'},
+    )
+    DATABASE_ROUTERS = ['weather.database.ReadOnlyRouter']
+    WEATHER_SQLITE_PRAGMAS = {
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+        'busy_timeout': 5000,
+        'mmap_size': int(os.environ.get('WEATHER_SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        'cache_size': -int(os.environ.get('WEATHER_SQLITE_CACHE_KB', 64 * 1024)),
+    }
+
+
 # DRF settings
 
 REST_FRAMEWORK = {
@@ -110,3 +195,27 @@ SWAGGER_SETTINGS = {
     ],
     'VALIDATOR_URL': None,
 }
+
+# Lean mode
+
+# WEATHER_LEAN=1 runs the read only JSON API without the admin, sessions, messages, static files and Swagger UI, or
+# their middleware, and serves the OpenAPI schema written by build_schema from WEATHER_SCHEMA_FILE.
+WEATHER_LEAN = os.environ.get('WEATHER_LEAN', '') == '1'
+
+WEATHER_SCHEMA_FILE = os.path.join(BASE_DIR, 'weather_schema.json')
+
+if WEATHER_LEAN:
+    INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in (
+        'django.contrib.admin', 'django.contrib.sessions', 'django.contrib.messages', 'django.contrib.staticfiles',
+        'rest_framework_swagger',
+    )]
+    MIDDLEWARE = [middleware for middleware in MIDDLEWARE if middleware not in (
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.middleware.csrf.CsrfViewMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'django.contrib.messages.middleware.MessageMiddleware',
+        'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    )]
+    TEMPLATES[0]['OPTIONS']['context_processors'] = ['django.template.context_processors.request']
+    # Without the authentication middleware and classes, the requests have no user to build.
+    REST_FRAMEWORK['UNAUTHENTICATED_USER'] = None
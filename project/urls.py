@@ -1,19 +1,20 @@
 """URL configuration for the application. Maps URLs to Views."""
 
+from django.conf import settings
 from django.conf.urls import url, include
-from django.contrib import admin
 from django.views.generic import RedirectView
 
-from rest_framework_swagger.views import get_swagger_view
-
 from weather import urls as api_urls
+from weather.instrumentation import stats_view
+from weather.schema import schema_view
 
 urls_documented = [
-    url(r'^admin/', admin.site.urls),
     url(r'^api/', include(api_urls.urlpatterns)),
     url(r'^$', RedirectView.as_view(url='/api/schema/', permanent=False), name='index')
 ]
 
-schema_view = get_swagger_view(title='Weather API documentation', patterns=urls_documented)
+if 'django.contrib.admin' in settings.INSTALLED_APPS:
+    from django.contrib import admin
+    urls_documented.insert(0, url(r'^admin/', admin.site.urls))
 
-urlpatterns = urls_documented + [url(r'^api/schema/$', schema_view)]
+urlpatterns = urls_documented + [url(r'^api/schema/$', schema_view), url(r'^api/stats/$', stats_view, name='stats')]
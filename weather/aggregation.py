@@ -0,0 +1,123 @@
+"""Database side aggregation of the daily weather into weekly, monthly or yearly periods."""
+
+from collections import OrderedDict
+from itertools import groupby
+from operator import itemgetter
+
+from django.db.models import Count, DateField, F, Func, IntegerField, Sum
+
+
+class WeekStart(Func):
+    """Truncates a date to the monday starting its week."""
+    template = "CAST(DATE_TRUNC('week', %(expressions)s) AS DATE)"
+    output_field = DateField()
+
+    def as_sqlite(self, compiler, connection):
+        """SQLite has no DATE_TRUNC, move to the next sunday and go back six days instead."""
+        return super(WeekStart, self).as_sql(
+            compiler, connection, template="DATE(%(expressions)s, 'weekday 0', '-6 days')"
+        )
+
+
+class MonthStart(Func):
+    """Truncates a date to the first day of its month."""
+    template = "CAST(DATE_TRUNC('month', %(expressions)s) AS DATE)"
+    output_field = DateField()
+
+    def as_sqlite(self, compiler, connection):
+        """SQLite has no DATE_TRUNC, format the date with the day fixed to 01 instead."""
+        return super(MonthStart, self).as_sql(
+            compiler, connection, template="STRFTIME('%%%%Y-%%%%m-01', %(expressions)s)"
+        )
+
+
+class YearStart(Func):
+    """Truncates a date to the first day of its year."""
+    template = "CAST(DATE_TRUNC('year', %(expressions)s) AS DATE)"
+    output_field = DateField()
+
+    def as_sqlite(self, compiler, connection):
+        """SQLite has no DATE_TRUNC, format the date with the month and day fixed to 01 instead."""
+        return super(YearStart, self).as_sql(
+            compiler, connection, template="STRFTIME('%%%%Y-01-01', %(expressions)s)"
+        )
+
+
+class FahrenheitToCelsius(Func):
+    """Converts a temperature in fahrenheit to a rounded temperature in celsius."""
+    template = 'CAST(ROUND((%(expressions)s - 32) * 5.0 / 9) AS INTEGER)'
+    output_field = IntegerField()
+
+
+class PresentTemperature(Func):
+    """
+    Temperature taking part in an average, NULL otherwise.
+    Zero and missing readings are skipped, same as the original python aggregation.
+    """
+    template = 'NULLIF(%(expressions)s, 0)'
+    output_field = IntegerField()
+
+
+PERIOD_FUNCTIONS = {
+    'weekly': WeekStart,
+    'monthly': MonthStart,
+    'yearly': YearStart,
+}
+
+TEMP_FORMATS = ('fahrenheit', 'celsius')
+
+
+def aggregate_totals(queryset, frequency, temp_format='fahrenheit', group_by=()):
+    """
+    Groups the daily rows by week, month or year start and totals the temperatures in the database.
+    :param queryset: Queryset of WeatherDetail objects, already filtered.
+    :param frequency: Frequency requested ie weekly, monthly or yearly.
+    :param temp_format: fahrenheit or celsius, celsius is applied per day before totalling.
+    :param group_by: Extra fields to group on e.g ('city',)
+    :return: Values queryset of dicts with the group_by fields, period, tmax_total, tmin_total, tmax_days and tmin_days.
+    """
+    convert = FahrenheitToCelsius if temp_format == 'celsius' else F
+    tmax, tmin = PresentTemperature(convert('tmax')), PresentTemperature(convert('tmin'))
+
+    fields = tuple(group_by) + ('period',)
+    return queryset.annotate(period=PERIOD_FUNCTIONS[frequency]('date')).order_by().values(*fields).annotate(
+        tmax_total=Sum(tmax), tmin_total=Sum(tmin), tmax_days=Count(tmax), tmin_days=Count(tmin),
+    ).order_by(*fields)
+
+
+def get_totals_by_period(queryset, frequency, temp_format='fahrenheit', descending=False):
+    """
+    Computes the total min and max temperatures for each week, month or year in the database.
+    :param queryset: Queryset of WeatherDetail objects, already filtered.
+    :param frequency: Frequency requested ie weekly, monthly or yearly.
+    :param temp_format: fahrenheit or celsius.
+    :param descending: True to return the latest period first.
+    :return: Ordered map of start_date as key and (total_tmax, total_tmin, days_tmax, days_tmin) as value, where
+    start_date is the start of the week, month or year depending on frequency.
+    """
+    rows = aggregate_totals(queryset, frequency, temp_format)
+    if descending:
+        rows = rows.reverse()
+    return OrderedDict(get_period_totals(row) for row in rows)
+
+
+def get_totals_by_city_and_period(queryset, frequency, temp_format='fahrenheit', descending=False):
+    """
+    Computes the total min and max temperatures for each week, month or year of several cities in one query.
+    :param queryset: Queryset of WeatherDetail objects, already filtered.
+    :param frequency: Frequency requested ie weekly, monthly or yearly.
+    :param temp_format: fahrenheit or celsius.
+    :param descending: True to return the latest period first.
+    :return: Generator of (city, totals) in city order, totals being the same ordered map as get_totals_by_period.
+    """
+    rows = aggregate_totals(queryset, frequency, temp_format, group_by=('city',))
+    if descending:
+        rows = rows.order_by('city', '-period')
+    for city, city_rows in groupby(rows, itemgetter('city')):
+        yield city, OrderedDict(get_period_totals(row) for row in city_rows)
+
+
+def get_period_totals(row):
+    """Returns the start_date and (total_tmax, total_tmin, days_tmax, days_tmin) of a row of aggregate_totals"""
+    return row['period'].strftime('%Y-%m-%d'), \
+        (row['tmax_total'] or 0, row['tmin_total'] or 0, row['tmax_days'], row['tmin_days'])
@@ -1,11 +1,22 @@
-from collections import defaultdict
+import json
+from collections import OrderedDict, defaultdict
 from datetime import datetime, timedelta
+from itertools import groupby, islice
+from operator import itemgetter
 
-from django.http import HttpResponseBadRequest
+from django.db.models import TextField
+from django.db.models.functions import Cast
+from django.http import FileResponse, HttpResponseBadRequest, StreamingHttpResponse
 from django_filters import rest_framework as rest_filters
-from rest_framework import viewsets, serializers, response, status
+from rest_framework import viewsets, mixins, serializers, response, status, filters, exceptions
+from rest_framework.decorators import detail_route, list_route
+from rest_framework.renderers import JSONRenderer
+from rest_framework.reverse import reverse
 
-from . import models
+from . import aggregation, dataset, exports, instrumentation, models, rollups, spatial, summaries, timeseries, windows
+from .caching import cached_response
+from .pagination import LocationPagination, WeatherDetailPagination
+from .renderers import ColumnarRenderer, StreamingJSONRenderer, get_weather_renderers
 
 
 class LocationSerializer(serializers.ModelSerializer):
@@ -16,6 +27,17 @@ class LocationSerializer(serializers.ModelSerializer):
         model = models.Location
 
 
+class NearestLocationQuerySerializer(serializers.Serializer):
+    """Validates the query params of the nearest cities lookup."""
+    lat = serializers.FloatField(min_value=-90, max_value=90, help_text='latitude in degrees (e.g) 52.63')
+    lon = serializers.FloatField(min_value=-180, max_value=180, help_text='longitude in degrees (e.g) 4.75')
+    k = serializers.IntegerField(
+        min_value=1, max_value=1000, required=False,
+        help_text='number of cities. Default is 1, or every city in the radius when a radius is given'
+    )
+    radius = serializers.FloatField(min_value=0, required=False, help_text='maximum distance in km')
+
+
 class WeatherDetailSerializer(serializers.ModelSerializer):
     """Serializer for WeatherDetail model."""
 
@@ -30,14 +52,101 @@ class WeatherDetailSerializer(serializers.ModelSerializer):
         return super(WeatherDetailSerializer, self).to_representation(instance, *args, **kwargs)
 
 
+class WeatherDetailRowSerializer(object):
+    """
+    Lean serializer for lists of WeatherDetail, giving the same output as WeatherDetailSerializer.
+    Rows are read as tuples from the queryset instead of model instances and converted a column at a time.
+    """
+    fields = ('id', 'date', 'tmax', 'tmin')
+
+    def __init__(self, queryset, temp_format='fahrenheit'):
+        """
+        :param queryset: Filtered and ordered queryset of WeatherDetail objects.
+        :param temp_format: fahrenheit or celsius.
+        """
+        self.queryset = queryset
+        self.temp_format = temp_format
+
+    def get_rows(self):
+        """
+        Returns the rows of the queryset with the date already formatted by the database.
+        :return: Values list queryset of (id, date, tmax, tmin) tuples.
+        """
+        return self.queryset.annotate(date_text=Cast('date', TextField())).values_list(
+            'id', 'date_text', 'tmax', 'tmin'
+        )
+
+    def to_values(self, rows):
+        """
+        Converts the temperatures of the rows to the requested format.
+        :param rows: List of (id, date, tmax, tmin) tuples.
+        :return: List of (id, date, tmax, tmin) tuples.
+        """
+        if not rows or self.temp_format != 'celsius':
+            return rows
+        ids, dates, tmax, tmin = zip(*rows)
+        return list(zip(ids, dates, models.WeatherDetail.convert_column_to_celsius(tmax),
+                        models.WeatherDetail.convert_column_to_celsius(tmin)))
+
+    def to_representation(self, rows):
+        """
+        Converts the rows to a serializable format.
+        :param rows: List of (id, date, tmax, tmin) tuples.
+        :return: List of maps with the id, date, tmax and tmin of each row.
+        """
+        fields = self.fields
+        return [dict(zip(fields, row)) for row in self.to_values(rows)]
+
+    @classmethod
+    def get_value(cls, row, name):
+        """Returns the value of a field from a (id, date, tmax, tmin) tuple, pk being the id"""
+        return row[0] if name == 'pk' else row[cls.fields.index(name)]
+
+    @property
+    def data(self):
+        """Returns the serialized rows of the queryset"""
+        return self.to_representation(list(self.get_rows()))
+
+    def iter_chunks(self, chunk_size):
+        """
+        Reads the rows of the queryset a chunk at a time, through a server side cursor.
+        :param chunk_size: Number of rows per chunk.
+        :return: Generator of lists of (id, date, tmax, tmin) tuples.
+        """
+        rows = self.get_rows().iterator()
+        chunk = list(islice(rows, chunk_size))
+        while chunk:
+            yield chunk
+            chunk = list(islice(rows, chunk_size))
+
+    def iter_data(self, chunk_size):
+        """
+        Serializes the rows of the queryset a chunk at a time.
+        :param chunk_size: Number of rows per chunk.
+        :return: Generator of lists of serialized rows.
+        """
+        for chunk in self.iter_chunks(chunk_size):
+            yield self.to_representation(chunk)
+
+    def iter_values(self, chunk_size):
+        """
+        Converts the rows of the queryset a chunk at a time, for the renderers writing values without field names.
+        :param chunk_size: Number of rows per chunk.
+        :return: Generator of lists of (id, date, tmax, tmin) tuples.
+        """
+        for chunk in self.iter_chunks(chunk_size):
+            yield self.to_values(chunk)
+
+
 class WeatherDetailFilterSet(rest_filters.FilterSet):
     """Custom filterset for WeatherDetail"""
 
-    FREQUENCY_CHOICES = (('daily', 'Daily'), ('weekly', 'Weekly'), ('monthly', 'Monthly'))
     FORMAT_CHOICES = (('fahrenheit', 'Temperature in fahrenheit'), ('celsius', 'Temperature in celsius'))
 
-    frequency = rest_filters.ChoiceFilter(
-        method='filter_frequency', choices=FREQUENCY_CHOICES, help_text='daily/weekly/monthly. Default is daily'
+    frequency = rest_filters.CharFilter(
+        method='filter_frequency', validators=[windows.validate_frequency],
+        help_text='daily/weekly/monthly/yearly, N-day for periods of N days or rolling-N-day for moving averages over '
+                  'N days (e.g) rolling-30-day. Default is daily'
     )
     start_date = rest_filters.DateFilter(name='date', lookup_expr='gte', help_text='start date (e.g) 2017-06-24')
     end_date = rest_filters.DateFilter(name='date', lookup_expr='lte', help_text='end date (e.g) 2017-06-26')
@@ -45,6 +154,11 @@ class WeatherDetailFilterSet(rest_filters.FilterSet):
     temp_format = rest_filters.ChoiceFilter(
         method='filter_temp_format', choices=FORMAT_CHOICES, help_text='fahrenheit/celsius. Default is fahrenheit'
     )
+    stream = rest_filters.BooleanFilter(
+        method='filter_stream',
+        help_text='true to stream the daily list for large date ranges, other frequencies are sent whole. Default is '
+                  'false'
+    )
 
     class Meta:
         model = models.WeatherDetail
@@ -60,6 +174,77 @@ class WeatherDetailFilterSet(rest_filters.FilterSet):
         """Returns the queryset based on the format as fahrenheit or celsius"""
         return queryset
 
+    @staticmethod
+    def filter_stream(queryset, name, value):
+        """Returns the queryset, streaming is handled by the view"""
+        return queryset
+
+
+class WeatherMapQuerySerializer(serializers.Serializer):
+    """Validates the query params of the weather of every city over a date or short date range."""
+    max_days = 31
+
+    date = serializers.DateField(required=False, help_text='date (e.g) 2017-06-24')
+    start_date = serializers.DateField(required=False, help_text='start date (e.g) 2017-06-24')
+    end_date = serializers.DateField(required=False, help_text='end date (e.g) 2017-06-26')
+    temp_format = serializers.ChoiceField(
+        choices=WeatherDetailFilterSet.FORMAT_CHOICES, default='fahrenheit',
+        help_text='fahrenheit/celsius. Default is fahrenheit'
+    )
+
+    def validate(self, attrs):
+        """Reads a single date as a range of one day and limits the length of the range"""
+        if attrs.get('date'):
+            attrs['start_date'] = attrs['end_date'] = attrs['date']
+        if not attrs.get('start_date') or not attrs.get('end_date'):
+            raise serializers.ValidationError('Expected a date, or a start_date and an end_date.')
+        if not 0 <= (attrs['end_date'] - attrs['start_date']).days < self.max_days:
+            raise serializers.ValidationError('Expected a range of 1 to {} days.'.format(self.max_days))
+        return attrs
+
+
+class ExportQuerySerializer(serializers.Serializer):
+    """Validates the query of an export of the daily weather."""
+    city = serializers.ListField(
+        child=serializers.CharField(), required=False, help_text='city names (e.g) BERKHOUT, NL. Default is every city'
+    )
+    start_date = serializers.DateField(required=False, help_text='start date (e.g) 2017-06-24')
+    end_date = serializers.DateField(required=False, help_text='end date (e.g) 2017-06-26')
+    temp_format = serializers.ChoiceField(
+        choices=WeatherDetailFilterSet.FORMAT_CHOICES, default='fahrenheit',
+        help_text='fahrenheit/celsius. Default is fahrenheit'
+    )
+    format = serializers.ChoiceField(
+        choices=list(exports.EXPORT_FORMATS), default='csv',
+        help_text='csv for gzip compressed CSV, columns for gzip compressed JSON arrays per field. Default is csv'
+    )
+
+    def validate(self, attrs):
+        """Checks the order of the date range"""
+        if attrs.get('start_date') and attrs.get('end_date') and attrs['start_date'] > attrs['end_date']:
+            raise serializers.ValidationError('Expected a start_date before the end_date.')
+        return attrs
+
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    """Serializer for ExportJob model, with the link to the file once the export is done."""
+    query = serializers.SerializerMethodField()
+    download = serializers.SerializerMethodField()
+
+    class Meta:
+        fields = ('id', 'status', 'format', 'query', 'version', 'rows', 'size', 'error', 'created', 'finished',
+                  'download')
+        model = models.ExportJob
+
+    @staticmethod
+    def get_query(obj):
+        return json.loads(obj.query)
+
+    def get_download(self, obj):
+        if obj.status != models.ExportJob.DONE:
+            return None
+        return reverse('export_job-download', args=[obj.pk], request=self.context['request'])
+
 
 class WeatherDetailViewSet(viewsets.ModelViewSet):
     """
@@ -68,12 +253,25 @@ class WeatherDetailViewSet(viewsets.ModelViewSet):
 
     list:
         Return weather for all days between a range for a city
+
+    batch:
+        Return weather for all days between a range for each city given, or for all cities
+
+    summary:
+        Return the average, lowest and highest temperatures of a city between a range
+
+    weather_map:
+        Return weather of every city with its coordinates for a date or a range of up to 31 days
     """
     filter_class = WeatherDetailFilterSet
     serializer_class = WeatherDetailSerializer
+    pagination_class = WeatherDetailPagination
     ordering_fields = '__all__'
     ordering = ('date',)
     http_method_names = ['get', ]
+    stream_chunk_size = 1000
+    cache_defaults = {'frequency': 'daily', 'temp_format': 'fahrenheit', 'stream': 'false'}
+    columnar_actions = ('list', 'weather_map')
 
     def get_queryset(self, *args, **kwargs):
         """
@@ -82,6 +280,43 @@ class WeatherDetailViewSet(viewsets.ModelViewSet):
         """
         return models.WeatherDetail.objects.all()
 
+    def get_streaming_response(self, chunks):
+        """
+        Streams a JSON array to the client a chunk of rows at a time.
+        :param chunks: Iterable of lists of serialized rows.
+        :return: StreamingHttpResponse object.
+        """
+        return StreamingHttpResponse(StreamingJSONRenderer().stream(chunks), content_type='application/json')
+
+    def is_streamed(self, request):
+        """
+        Checks whether the daily list is to be streamed, from the cleaned value of the stream filter.
+        :param request: HttpRequest object from the client.
+        :return: True when streaming is asked for and the response is rendered as JSON.
+        """
+        form = self.filter_class(request.query_params, queryset=self.get_queryset(), request=request).form
+        return form.is_valid() and bool(form.cleaned_data['stream']) and \
+            isinstance(request.accepted_renderer, JSONRenderer)
+
+    def get_renderers(self):
+        """Offers the CSV and columnar formats on the lists of rows, the other end points are JSON only"""
+        if self.action in self.columnar_actions:
+            return [renderer() for renderer in get_weather_renderers()]
+        return super(WeatherDetailViewSet, self).get_renderers()
+
+    def get_columnar_response(self, renderer, serializer):
+        """
+        Streams the rows in a columnar format a chunk at a time, without building a map per row.
+        :param renderer: ColumnarRenderer object picked by the content negotiation.
+        :param serializer: WeatherDetailRowSerializer object of the rows.
+        :return: StreamingHttpResponse object.
+        """
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = '{}; charset={}'.format(content_type, renderer.charset)
+        chunks = serializer.iter_values(self.stream_chunk_size)
+        return StreamingHttpResponse(renderer.stream_columns(serializer.fields, chunks), content_type=content_type)
+
     @staticmethod
     def get_start_of_week_and_month(date_object):
         """
@@ -97,11 +332,11 @@ class WeatherDetailViewSet(viewsets.ModelViewSet):
     @staticmethod
     def get_total_min_and_max_temps(data, frequency):
         """
-        Computes the total min and max temperatures for each week or month.
+        Computes the total min and max temperatures for each week, month or year.
         :param data: data ie a list of maps of temperatures over days between a range
-        :param frequency: Frequency requested ie weekly or monthly.
+        :param frequency: Frequency requested ie weekly, monthly or yearly.
         :return: Map of start_date as key and (total_tmax, total_tmin, days_tmax, days_tmin) as value, where start_date
-        is either start of week or month depending on frequency.
+        is either start of week, month or year depending on frequency.
         """
         dates_and_temps = defaultdict(lambda: (0, 0, 0, 0))
 
@@ -110,6 +345,8 @@ class WeatherDetailViewSet(viewsets.ModelViewSet):
             start_of_week, start_of_month = \
                 WeatherDetailViewSet.get_start_of_week_and_month(datetime.strptime(current_date, '%Y-%m-%d'))
             key = start_of_week if frequency == 'weekly' else start_of_month
+            if frequency == 'yearly':
+                key = current_date[:4] + '-01-01'
             tmax_total, tmin_total, max_days, min_days = dates_and_temps[key]
             dates_and_temps[key] = (
                 tmax_total+tmax if tmax else tmax_total,
@@ -121,7 +358,7 @@ class WeatherDetailViewSet(viewsets.ModelViewSet):
 
     def get_avg_min_and_max_temps(self, dates_and_temps):
         """
-        Computes the average min and max temperatures for each week or month.
+        Computes the average min and max temperatures for each period.
         :param dates_and_temps: Map of start_date as key and (total_tmax, total_tmin, days_tmax, days_tmin) as value.
         :return: List of maps of start_date and computed average for that period
         """
@@ -157,17 +394,300 @@ class WeatherDetailViewSet(viewsets.ModelViewSet):
         frequency = request.query_params.get('frequency', 'daily')
         return response.data if frequency == 'daily' else self.get_updated_response(response.data, frequency)
 
+    def get_aggregated_ordering(self, request, queryset):
+        """
+        Finds the direction in which the periods are to be listed.
+        :param request: HttpRequest object from the client.
+        :param queryset: Queryset of WeatherDetail objects.
+        :return: False for oldest period first, True for latest period first, None when not ordered by date.
+        """
+        ordering = filters.OrderingFilter().get_ordering(request, queryset, self) or []
+        return {'date': False, '-date': True}.get(ordering[0] if ordering else 'date')
+
+    def get_aggregated_response(self, request, frequency):
+        """
+        Calculates the average of temperatures for each period with the grouping done in the database.
+        :param request: HttpRequest object from the client.
+        :param frequency: Frequency requested e.g 'monthly'.
+        :return: List of maps of start_date and computed average for that period, None when the database
+        aggregation can not reproduce the requested ordering.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        descending = self.get_aggregated_ordering(request, queryset)
+        if frequency not in aggregation.PERIOD_FUNCTIONS or descending is None:
+            return None
+        temp_format = request.query_params.get('temp_format', 'fahrenheit')
+        dates_and_temps = self.get_totals_by_period(request, queryset, frequency, temp_format, descending)
+        return self.get_avg_min_and_max_temps(dates_and_temps)
+
+    @staticmethod
+    def get_window_queryset(queryset, window, start_date, end_date):
+        """
+        Restricts the queryset to the date range, plus the days before it that are in the first rolling window.
+        :param queryset: Queryset of WeatherDetail objects filtered on the cities.
+        :param window: Tuple of 'periods' or 'rolling' and the number of days.
+        :param start_date: First day of the range, None for no lower bound.
+        :param end_date: Last day of the range, None for no upper bound.
+        :return: Filtered queryset of WeatherDetail objects.
+        """
+        if start_date:
+            queryset = queryset.filter(date__gte=windows.get_first_date(window, start_date))
+        if end_date:
+            queryset = queryset.filter(date__lte=end_date)
+        return queryset
+
+    def get_window_response(self, request, frequency):
+        """
+        Calculates the average of temperatures for each N-day period or rolling N-day window in one pass over the days.
+        :param request: HttpRequest object from the client.
+        :param frequency: Frequency requested e.g 'rolling-30-day'.
+        :return: List of maps of start_date and computed average for that period, None for the other frequencies.
+        :exception: ValidationError if the ordering is not on date.
+        """
+        window = windows.parse_frequency(frequency)
+        if window is None:
+            return None
+        queryset = self.get_queryset()
+        form = self.filter_class(request.query_params, queryset=queryset, request=request).form
+        if not form.is_valid():
+            return []
+        descending = self.get_aggregated_ordering(request, queryset)
+        if descending is None:
+            raise exceptions.ValidationError({'ordering': 'N-day frequencies can only be ordered by date.'})
+        start_date, end_date = form.cleaned_data['start_date'], form.cleaned_data['end_date']
+        queryset = self.get_window_queryset(
+            queryset.filter(city=form.cleaned_data['city']), window, start_date, end_date
+        )
+        rows = queryset.order_by('date').values_list('date', 'tmax', 'tmin').iterator()
+        return self.get_avg_min_and_max_temps(windows.get_totals_by_window(
+            rows, window, form.cleaned_data['temp_format'] or 'fahrenheit', start_date, descending
+        ))
+
+    def get_totals_by_period(self, request, queryset, frequency, temp_format, descending):
+        """
+        Computes the total min and max temperatures for each period, from the rollups when they are built for the
+        current dataset version and from the daily weather otherwise.
+        :param request: HttpRequest object from the client.
+        :param queryset: Filtered queryset of WeatherDetail objects.
+        :param frequency: Frequency requested e.g 'monthly'.
+        :param temp_format: fahrenheit or celsius.
+        :param descending: True to return the latest period first.
+        :return: Ordered map of start_date as key and (total_tmax, total_tmin, days_tmax, days_tmin) as value.
+        """
+        form = self.filter_class(request.query_params, queryset=queryset, request=request).form
+        if form.is_valid() and rollups.rollups_are_current(dataset.get_version(), frequency):
+            return rollups.get_totals_by_period(
+                queryset, form.cleaned_data['city'], frequency, temp_format,
+                form.cleaned_data['start_date'], form.cleaned_data['end_date'], descending
+            )
+        return aggregation.get_totals_by_period(queryset, frequency, temp_format, descending)
+
+    def get_store_response(self, request, frequency):
+        """
+        Answers the list from the in-process time series store when it is enabled.
+        :param request: HttpRequest object from the client.
+        :param frequency: Frequency requested e.g 'monthly'.
+        :return: List of maps of the daily weather or of the averages for each period, None when the store is
+        disabled or can not answer the request.
+        """
+        store, version = timeseries.get_store()
+        if store is None or self.paginator.page_size_query_param in request.query_params:
+            return None
+        queryset = self.get_queryset()
+        form = self.filter_class(request.query_params, queryset=queryset, request=request).form
+        descending = self.get_aggregated_ordering(request, queryset)
+        if not form.is_valid() or descending is None or \
+                (frequency != 'daily' and frequency not in aggregation.PERIOD_FUNCTIONS):
+            return None
+        series = store.get_series(form.cleaned_data['city'], version)
+        temp_format = form.cleaned_data['temp_format'] or 'fahrenheit'
+        start_date, end_date = form.cleaned_data['start_date'], form.cleaned_data['end_date']
+        if frequency == 'daily':
+            return series.get_daily(start_date, end_date, temp_format, descending)
+        return self.get_avg_min_and_max_temps(
+            series.get_totals_by_period(start_date, end_date, frequency, temp_format, descending)
+        )
+
+    @cached_response
     def list(self, request, *args, **kwargs):
         """
         Returns a list of temperature objects for a given city.
         :param request: HttpRequest object.
         :return: HttpResponse with temperature date in daily or weekly or monthly formats.
         :exception: HttpResponseBadRequest if 'city' attribute is not in query params.
+        :exception: ValidationError if pages are requested for a frequency other than daily.
         """
         if 'city' not in request.query_params:
             return HttpResponseBadRequest("API can support at most one city's weather data per request")
-        api_response = super(WeatherDetailViewSet, self).list(request, *args, **kwargs)
-        return response.Response(data=self.update_for_frequency(api_response, request), status=status.HTTP_200_OK)
+        frequency = request.query_params.get('frequency', 'daily')
+        if frequency != 'daily' and self.paginator.page_size_query_param in request.query_params:
+            raise exceptions.ValidationError(
+                {self.paginator.page_size_query_param: 'Pages are only available for the daily frequency.'}
+            )
+        # Only the daily list grows with the range, the aggregated lists hold one row per period and are sent whole.
+        stream = frequency == 'daily' and self.is_streamed(request)
+        data = None if stream else self.get_store_response(request, frequency)
+        if data is not None:
+            return response.Response(data, status.HTTP_200_OK)
+        if frequency == 'daily':
+            temp_format = request.query_params.get('temp_format', 'fahrenheit')
+            queryset = self.filter_queryset(self.get_queryset())
+            page_queryset = self.paginator.get_page_queryset(queryset, request, self)
+            if page_queryset is not None:
+                serializer = WeatherDetailRowSerializer(page_queryset, temp_format)
+                with instrumentation.phase('serialize'):
+                    rows = self.paginator.paginate_rows(serializer.get_rows(), serializer.get_value)
+                    data = serializer.to_representation(rows)
+                return self.paginator.get_paginated_response(data)
+            serializer = WeatherDetailRowSerializer(queryset, temp_format)
+            if isinstance(request.accepted_renderer, ColumnarRenderer):
+                return self.get_columnar_response(request.accepted_renderer, serializer)
+            if stream:
+                return self.get_streaming_response(serializer.iter_data(self.stream_chunk_size))
+            with instrumentation.phase('serialize'):
+                data = serializer.data
+            return response.Response(data=data, status=status.HTTP_200_OK)
+        with instrumentation.phase('aggregate'):
+            data = self.get_aggregated_response(request, frequency)
+            if data is None:
+                data = self.get_window_response(request, frequency)
+        if data is None:
+            with instrumentation.phase('serialize'):
+                api_response = super(WeatherDetailViewSet, self).list(request, *args, **kwargs)
+            with instrumentation.phase('aggregate'):
+                data = self.update_for_frequency(api_response, request)
+        return response.Response(data=data, status=status.HTTP_200_OK)
+
+    def get_batch_data(self, queryset, frequency, temp_format, descending, start_date=None):
+        """
+        Reads the weather of several cities in one query.
+        :param queryset: Filtered queryset of WeatherDetail objects.
+        :param frequency: Frequency requested e.g 'monthly'.
+        :param temp_format: fahrenheit or celsius.
+        :param descending: True to return the latest day or period first.
+        :param start_date: First day of the range, for the N-day frequencies.
+        :return: Generator of (city, list of maps of temperature data) in city order.
+        """
+        window = windows.parse_frequency(frequency)
+        if window is not None:
+            rows = queryset.order_by('city', 'date').values_list('city', 'date', 'tmax', 'tmin')
+            for city, city_rows in groupby(rows, itemgetter(0)):
+                yield city, self.get_avg_min_and_max_temps(windows.get_totals_by_window(
+                    (row[1:] for row in city_rows), window, temp_format, start_date, descending
+                ))
+            return
+        if frequency != 'daily':
+            for city, dates_and_temps in aggregation.get_totals_by_city_and_period(
+                    queryset, frequency, temp_format, descending):
+                yield city, self.get_avg_min_and_max_temps(dates_and_temps)
+            return
+        serializer = WeatherDetailRowSerializer(queryset, temp_format)
+        rows = queryset.order_by('city', '-date' if descending else 'date').annotate(
+            date_text=Cast('date', TextField())
+        ).values_list('city', 'id', 'date_text', 'tmax', 'tmin')
+        for city, city_rows in groupby(rows, itemgetter(0)):
+            yield city, serializer.to_representation([row[1:] for row in city_rows])
+
+    @list_route(methods=['get'])
+    @cached_response
+    def batch(self, request, *args, **kwargs):
+        """
+        Returns the weather of several cities with one query, all cities when no 'city' is given.
+        :param request: HttpRequest object, with the 'city' query param repeated for each city.
+        :return: HttpResponse with a map of city name to its temperature data in daily or weekly or monthly formats.
+        :exception: ValidationError if a filter is invalid or the ordering is not on date.
+        """
+        cities = request.query_params.getlist('city')
+        query_params = request.query_params.copy()
+        query_params.pop('city', None)
+        queryset = self.get_queryset().filter(city__in=cities) if cities else self.get_queryset()
+        filterset = self.filter_class(query_params, queryset=queryset, request=request)
+        if not filterset.form.is_valid():
+            raise exceptions.ValidationError(filterset.form.errors)
+        descending = self.get_aggregated_ordering(request, queryset)
+        if descending is None:
+            raise exceptions.ValidationError({'ordering': 'Batches can only be ordered by date.'})
+
+        frequency = filterset.form.cleaned_data['frequency'] or 'daily'
+        temp_format = filterset.form.cleaned_data['temp_format'] or 'fahrenheit'
+        start_date, window = filterset.form.cleaned_data['start_date'], windows.parse_frequency(frequency)
+        if window is None:
+            queryset = filterset.qs
+        else:
+            queryset = self.get_window_queryset(queryset, window, start_date, filterset.form.cleaned_data['end_date'])
+        data = OrderedDict((city, []) for city in sorted(set(cities)))
+        data.update(self.get_batch_data(queryset, frequency, temp_format, descending, start_date))
+        return response.Response(data=data, status=status.HTTP_200_OK)
+
+    @list_route(methods=['get'])
+    @cached_response
+    def summary(self, request, *args, **kwargs):
+        """
+        Returns the average, extremes and number of days of the temperatures of a city over a date range, in the same
+        time for any length of the range.
+        :param request: HttpRequest object, with the same filters as the list.
+        :return: HttpResponse with the city, date range and a summary of tmax and tmin.
+        :exception: ValidationError if a filter is invalid, 'city' is not in query params or the range is inverted.
+        """
+        queryset = self.get_queryset()
+        filterset = self.filter_class(request.query_params, queryset=queryset, request=request)
+        if not filterset.form.is_valid():
+            raise exceptions.ValidationError(filterset.form.errors)
+        cleaned_data = filterset.form.cleaned_data
+        if not cleaned_data['city']:
+            raise exceptions.ValidationError({'city': 'This field is required.'})
+
+        start_date, end_date = cleaned_data['start_date'], cleaned_data['end_date']
+        if start_date and end_date and start_date > end_date:
+            raise exceptions.ValidationError({'start_date': 'Expected a start_date before the end_date.'})
+        summary = summaries.get_summary(
+            filterset.qs, cleaned_data['city'], cleaned_data['temp_format'] or 'fahrenheit', start_date, end_date,
+            use_prefix_sums=summaries.prefix_sums_are_current(dataset.get_version())
+        )
+        data = OrderedDict([
+            ('city', cleaned_data['city']),
+            ('start_date', start_date and start_date.strftime('%Y-%m-%d')),
+            ('end_date', end_date and end_date.strftime('%Y-%m-%d')),
+        ])
+        for name in ('tmax', 'tmin'):
+            values = summary[name]
+            data[name] = OrderedDict([
+                ('average', round(values['total'] / values['days']) if values['days'] else 'N/A'),
+                ('min', 'N/A' if values['min'] is None else values['min']),
+                ('max', 'N/A' if values['max'] is None else values['max']),
+                ('days', values['days']),
+            ])
+        return response.Response(data=data, status=status.HTTP_200_OK)
+
+    @list_route(methods=['get'], url_path='map')
+    @cached_response
+    def weather_map(self, request, *args, **kwargs):
+        """
+        Returns the weather of every city over a date or short date range with the city coordinates, read with one
+        query on the date first index joined with the cities.
+        :param request: HttpRequest object, with date or start_date and end_date in the query params.
+        :return: HttpResponse with the date, city, latitude, longitude, tmax and tmin of each day of each city.
+        :exception: ValidationError if the date range is missing, invalid or too long.
+        """
+        query = WeatherMapQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        rows = self.get_queryset().filter(
+            date__gte=query.validated_data['start_date'], date__lte=query.validated_data['end_date']
+        ).order_by('date', 'city').annotate(date_text=Cast('date', TextField())).values_list(
+            'date_text', 'city', 'city__latitude', 'city__longitude', 'tmax', 'tmin'
+        )
+        if not rows:
+            return response.Response(data=[], status=status.HTTP_200_OK)
+        dates, cities, latitudes, longitudes, tmax, tmin = zip(*rows)
+        if query.validated_data['temp_format'] == 'celsius':
+            tmax, tmin = models.WeatherDetail.convert_column_to_celsius(tmax), \
+                models.WeatherDetail.convert_column_to_celsius(tmin)
+        coordinate = LocationSerializer().fields['latitude']
+        latitudes = [coordinate.to_representation(value) for value in latitudes]
+        longitudes = [coordinate.to_representation(value) for value in longitudes]
+        fields = ('date', 'city', 'latitude', 'longitude', 'tmax', 'tmin')
+        data = [dict(zip(fields, row)) for row in zip(dates, cities, latitudes, longitudes, tmax, tmin)]
+        return response.Response(data=data, status=status.HTTP_200_OK)
 
 
 class LocationViewSet(viewsets.ModelViewSet):
@@ -177,8 +697,12 @@ class LocationViewSet(viewsets.ModelViewSet):
 
     list:
         Return list of cities with their data.
+
+    nearest:
+        Return the cities closest to a position, with their distance in km.
     """
     serializer_class = LocationSerializer
+    pagination_class = LocationPagination
     ordering_fields = '__all__'
     ordering = ('name', )
     http_method_names = ['get', ]
@@ -189,3 +713,88 @@ class LocationViewSet(viewsets.ModelViewSet):
         :return: queryset of Location objects.
         """
         return models.Location.objects.all()
+
+    @cached_response
+    def list(self, request, *args, **kwargs):
+        """
+        Returns the list of cities.
+        :param request: HttpRequest object.
+        :return: HttpResponse with the cities and their data.
+        """
+        return super(LocationViewSet, self).list(request, *args, **kwargs)
+
+    @list_route(methods=['get'])
+    def nearest(self, request, *args, **kwargs):
+        """
+        Returns the cities closest to a position from the in-memory spatial index, without reading the DB.
+        :param request: HttpRequest object, with lat, lon and optionally k and radius in the query params.
+        :return: HttpResponse with the cities and their distance in km, closest first.
+        :exception: ValidationError if a query param is missing or out of range.
+        """
+        query = NearestLocationQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        radius = query.validated_data.get('radius')
+        k = query.validated_data.get('k', 1 if radius is None else None)
+        index = spatial.get_location_index(lambda locations: self.get_serializer(locations, many=True).data)
+        data = [
+            OrderedDict(location, distance=round(distance, 3))
+            for distance, location in index.search(query.validated_data['lat'], query.validated_data['lon'], k, radius)
+        ]
+        return response.Response(data=data, status=status.HTTP_200_OK)
+
+
+class ExportJobViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    create:
+        Start an export of the daily weather to a compressed file, or return the export of an identical query
+
+    retrieve:
+        Return the status of an export
+
+    download:
+        Return the compressed file of a finished export
+    """
+    serializer_class = ExportJobSerializer
+    http_method_names = ['get', 'post', ]
+
+    def get_queryset(self, *args, **kwargs):
+        """
+        Returns the export jobs.
+        :return: queryset of ExportJob objects.
+        """
+        return models.ExportJob.objects.all()
+
+    def create(self, request, *args, **kwargs):
+        """
+        Submits an export to the worker pool. An identical query of the current dataset version reuses its job.
+        :param request: HttpRequest object, with the query in the body.
+        :return: HttpResponse with the job, 202 while the export runs and 200 once it is done.
+        :exception: ValidationError if the query is invalid.
+        """
+        query = ExportQuerySerializer(data=request.data)
+        query.is_valid(raise_exception=True)
+        job = exports.submit_export(exports.normalize_query(**query.validated_data))
+        done = job.status == models.ExportJob.DONE
+        return response.Response(
+            data=self.get_serializer(job).data, status=status.HTTP_200_OK if done else status.HTTP_202_ACCEPTED,
+            headers={'Location': reverse('export_job-detail', args=[job.pk], request=request)}
+        )
+
+    @detail_route(methods=['get'])
+    def download(self, request, *args, **kwargs):
+        """
+        Returns the file of an export, read from disk in blocks.
+        :param request: HttpRequest object.
+        :return: HttpResponse with the gzip compressed file as an attachment, 409 while the export is not done.
+        """
+        job = self.get_object()
+        if job.status != models.ExportJob.DONE:
+            return response.Response(
+                data={'detail': 'The export is {}.'.format(job.status)}, status=status.HTTP_409_CONFLICT
+            )
+        file_response = FileResponse(open(job.path, 'rb'), content_type='application/gzip')
+        file_response['Content-Length'] = job.size
+        file_response['Content-Disposition'] = 'attachment; filename="weather_export_{}.{}"'.format(
+            job.pk, exports.EXPORT_FORMATS[job.format][1]
+        )
+        return file_response
@@ -2,7 +2,13 @@
 from __future__ import unicode_literals
 
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class WeatherConfig(AppConfig):
     name = 'weather'
+
+    def ready(self):
+        """Tunes each new SQLite connection with the pragmas of the DB profile"""
+        from .database import configure_sqlite
+        connection_created.connect(configure_sqlite, dispatch_uid='weather.configure_sqlite')
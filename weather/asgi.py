@@ -0,0 +1,178 @@
+"""
+ASGI server entry point running the Django views in a bounded thread pool.
+Django 1.11 views and queries are synchronous, so each view runs on a pool thread while the reading of the request
+and the sending of the response, which wait on the client, run on the event loop. A slow client then holds a
+coroutine instead of a thread.
+"""
+
+import asyncio
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+
+END = object()
+
+
+def get_environ(scope, body):
+    """
+    Builds the WSGI environ of an ASGI HTTP request.
+    :param scope: ASGI connection scope.
+    :param body: Bytes of the request body.
+    :return: Map of the WSGI environ.
+    """
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        # WSGI gives the path as bytes decoded as latin-1, which Django encodes back.
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': 'HTTP/{}'.format(scope.get('http_version', '1.1')),
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else 'HTTP_' + name
+        value = value.decode('latin-1')
+        environ[key] = '{},{}'.format(environ[key], value) if key in environ else value
+    return environ
+
+
+def get_headers(response):
+    """Returns the headers and cookies of a Django response as a list of ASGI header tuples"""
+    headers = [(name.encode('latin-1'), value.encode('latin-1')) for name, value in response.items()]
+    headers.extend(
+        (b'set-cookie', cookie.output(header='').strip().encode('latin-1')) for cookie in response.cookies.values()
+    )
+    return headers
+
+
+class ASGIHandler(object):
+    """
+    ASGI 3 application serving the Django project.
+    The body of a response is sent from the event loop in slices, the pool thread being free once the view has
+    returned. A streamed body is produced on one pool thread, as its queries use that thread's connection, into a
+    bounded buffer, so its thread only waits on a slow client once the buffer is full.
+    """
+
+    def __init__(self, max_workers=None, chunk_size=None, stream_buffer=None):
+        """
+        :param max_workers: Number of pool threads running the views, WEATHER_ASGI_THREADS by default.
+        :param chunk_size: Bytes per body message, WEATHER_ASGI_CHUNK_SIZE by default.
+        :param stream_buffer: Number of chunks of a streamed body buffered ahead of the client,
+        WEATHER_ASGI_STREAM_BUFFER by default.
+        """
+        self.wsgi_handler = WSGIHandler()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or settings.WEATHER_ASGI_THREADS)
+        self.chunk_size = chunk_size or settings.WEATHER_ASGI_CHUNK_SIZE
+        self.stream_buffer = stream_buffer or settings.WEATHER_ASGI_STREAM_BUFFER
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.handle_lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.handle_http(scope, receive, send)
+        else:
+            raise ValueError('Unsupported ASGI scope type {}'.format(scope['type']))
+
+    async def handle_lifespan(self, receive, send):
+        """Acknowledges the server startup and shuts the thread pool down with it"""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def read_body(receive):
+        """Reads the whole request body, None when the client disconnects first"""
+        body = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            body.append(message.get('body', b''))
+            if not message.get('more_body', False):
+                return b''.join(body)
+
+    def get_response(self, environ):
+        """
+        Runs the view of a request on a pool thread.
+        :return: Tuple of the response and its body, the body being None for a streamed response.
+        """
+        response = self.wsgi_handler(environ, lambda status, headers: None)
+        if response.streaming:
+            return response, None
+        try:
+            return response, response.content
+        finally:
+            response.close()
+
+    async def handle_http(self, scope, receive, send):
+        """Answers an HTTP request"""
+        body = await self.read_body(receive)
+        if body is None:
+            return
+        loop = asyncio.get_event_loop()
+        response, content = await loop.run_in_executor(self.executor, self.get_response, get_environ(scope, body))
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': get_headers(response)})
+        if content is not None:
+            for start in range(0, len(content), self.chunk_size):
+                await send({'type': 'http.response.body', 'body': content[start:start + self.chunk_size],
+                            'more_body': start + self.chunk_size < len(content)})
+            if not content:
+                await send({'type': 'http.response.body', 'body': b''})
+            return
+        await self.send_stream(response, send, loop)
+
+    def produce(self, response, queue, stopped, loop):
+        """
+        Reads the chunks of a streamed response on a pool thread into the queue, waiting while it is full.
+        :param response: StreamingHttpResponse object.
+        :param queue: asyncio.Queue bounded to the stream buffer.
+        :param stopped: threading.Event set by the event loop when the client is gone.
+        :param loop: Event loop of the queue.
+        """
+        try:
+            for chunk in response:
+                if stopped.is_set():
+                    break
+                if chunk:
+                    asyncio.run_coroutine_threadsafe(queue.put(chunk), loop).result()
+        finally:
+            response.close()
+            asyncio.run_coroutine_threadsafe(queue.put(END), loop).result()
+
+    async def send_stream(self, response, send, loop):
+        """Sends the chunks of a streamed response as the pool thread produces them"""
+        queue, stopped, chunk = asyncio.Queue(maxsize=self.stream_buffer), threading.Event(), None
+        producer = loop.run_in_executor(self.executor, self.produce, response, queue, stopped, loop)
+        try:
+            chunk = await queue.get()
+            while chunk is not END:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await queue.get()
+            await send({'type': 'http.response.body', 'body': b''})
+        except BaseException:
+            stopped.set()
+            while chunk is not END:
+                chunk = await queue.get()
+            raise
+        finally:
+            await producer
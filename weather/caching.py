@@ -0,0 +1,175 @@
+"""
+Response cache and conditional GET for the weather API, invalidated by the dataset version, and coalescing of
+identical concurrent requests.
+"""
+
+import copy
+import hashlib
+import threading
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponseNotModified
+from rest_framework import response, status
+
+from . import dataset
+
+
+def get_query_key(request, defaults=None):
+    """
+    Normalizes the query of a request so that equivalent requests share a key.
+    :param request: HttpRequest object from the client.
+    :param defaults: Map of query param to its default value, params given with their default are dropped.
+    :return: Hex digest of the host, path, sorted query params and accepted media type.
+    """
+    defaults = defaults or {}
+    params = sorted(
+        (name, sorted(values)) for name, values in request.query_params.lists()
+        if [value for value in values if value] and values != [defaults.get(name)]
+    )
+    query = '{}{}?{}|{}'.format(
+        request.get_host(), request.path, params, getattr(request, 'accepted_media_type', '')
+    )
+    return hashlib.sha1(query.encode('utf-8')).hexdigest()
+
+
+def get_etag(version, query_key):
+    """Returns the ETag of a response for a dataset version"""
+    return '"{}-{}"'.format(version, query_key[:20])
+
+
+def etag_matches(request, etag):
+    """Checks if the client already has the response with this ETag"""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags or 'W/' + etag in tags
+
+
+class Flight(object):
+    """One computation shared by the concurrent callers of a key."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = self.error = None
+
+    def wait(self, timeout=None):
+        """Waits for the run to be done, returns False after the timeout"""
+        return self.done.wait(timeout)
+
+    def get_error(self):
+        """
+        Returns an exception to raise in a waiting caller: a copy of the one of the run, so that each thread raises
+        an instance of its own instead of adding to the traceback of the shared one.
+        """
+        try:
+            error = copy.copy(self.error)
+        except Exception:
+            error = RuntimeError('The shared run failed with {!r}.'.format(self.error))
+        return error
+
+
+class SingleFlight(object):
+    """
+    Runs a function once for concurrent callers of the same key: the first caller runs it and the others wait for
+    its result, or get its exception. Only calls in flight are shared, nothing is kept once they are done.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+
+    def do(self, key, function, timeout=None):
+        """
+        Runs the function, or waits for the run already in flight for the key.
+        :param key: Key of the computation.
+        :param function: Function without arguments.
+        :param timeout: Maximum wait in seconds for a run in flight, the caller then runs the function itself.
+        :return: Tuple of the result and True when it came from another caller.
+        :exception: The exception raised by the function, a copy of it chained to the original in the waiting callers.
+        """
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is None:
+                flight = self.flights[key] = Flight()
+                leader = True
+            else:
+                leader = False
+        if not leader:
+            if not flight.wait(timeout):
+                return function(), False
+            if flight.error is not None:
+                raise flight.get_error() from flight.error
+            return flight.result, True
+        try:
+            flight.result = function()
+        except Exception as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+        return flight.result, False
+
+
+SINGLE_FLIGHT = SingleFlight()
+
+
+def get_coalesced_response(key, compute):
+    """
+    Runs a view once for identical concurrent requests when WEATHER_COALESCE_REQUESTS is set.
+    The waiting requests get a response of their own with the data of the shared one. A response that can not be
+    shared, such as a streamed one, is computed again by each waiting request.
+    :param key: Key of the normalized query.
+    :param compute: Function without arguments returning the response of the view.
+    :return: HttpResponse object.
+    """
+    if not settings.WEATHER_COALESCE_REQUESTS:
+        return compute()
+    api_response, shared = SINGLE_FLIGHT.do(key, compute, settings.WEATHER_COALESCE_TIMEOUT)
+    if not shared:
+        return api_response
+    if not isinstance(api_response, response.Response):
+        return compute()
+    return response.Response(data=api_response.data, status=api_response.status_code)
+
+
+def cached_response(view_method):
+    """
+    Caches the data of the successful responses of a view method for the current dataset version and answers
+    conditional GETs with a 304, neither of which touches the DB.
+    Nothing is cached until load_data has recorded a dataset version, as the data may change without one.
+    Identical requests arriving while the view runs wait for its response instead of running it again.
+    """
+    @wraps(view_method)
+    def wrapper(view, request, *args, **kwargs):
+        version = dataset.get_version()
+        query_key = get_query_key(request, getattr(view, 'cache_defaults', None))
+        flight_key = 'weather:{}:{}'.format(version, query_key)
+        if not version or not settings.WEATHER_RESPONSE_CACHE:
+            return get_coalesced_response(flight_key, lambda: view_method(view, request, *args, **kwargs))
+
+        etag = get_etag(version, query_key)
+        if etag_matches(request, etag):
+            not_modified = HttpResponseNotModified()
+            not_modified['ETag'] = etag
+            return not_modified
+
+        cache = caches[settings.WEATHER_CACHE_ALIAS]
+        data = cache.get(flight_key)
+
+        def compute():
+            computed = view_method(view, request, *args, **kwargs)
+            if computed.status_code == status.HTTP_200_OK and isinstance(computed, response.Response):
+                cache.set(flight_key, computed.data)
+            return computed
+
+        if data is not None:
+            api_response = response.Response(data=data, status=status.HTTP_200_OK)
+        else:
+            api_response = get_coalesced_response(flight_key, compute)
+        if api_response.status_code == status.HTTP_200_OK:
+            api_response['ETag'] = etag
+        return api_response
+    return wrapper
@@ -0,0 +1,78 @@
+"""SQLite connection tuning and the routing of reads to a read only connection, for the production profile."""
+
+import sqlite3
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+
+READ_ONLY_ALIAS = 'readonly'
+
+
+def is_read_only(connection):
+    """Checks whether a connection opens the DB file with the mode=ro URI"""
+    settings_dict = connection.settings_dict
+    return bool(settings_dict.get('OPTIONS', {}).get('uri')) and 'mode=ro' in settings_dict['NAME']
+
+
+def set_journal_mode(connection, mode):
+    """
+    Sets the journal mode of the DB file of a read only connection, through a short lived connection that can write.
+    The mode is stored in the DB file, so it is kept by every later connection.
+    """
+    timeout = settings.WEATHER_SQLITE_PRAGMAS.get('busy_timeout', 5000) / 1000
+    writer = sqlite3.connect(connection.settings_dict['NAME'].replace('mode=ro', 'mode=rw'), timeout, uri=True)
+    try:
+        writer.execute('PRAGMA journal_mode = {}'.format(mode))
+    finally:
+        writer.close()
+
+
+def get_journal_mode(cursor):
+    """Returns the journal mode of the DB file, asked after a read so that the header of the file is loaded"""
+    cursor.execute('SELECT COUNT(*) FROM sqlite_master')
+    cursor.execute('PRAGMA journal_mode')
+    return cursor.fetchone()[0].lower()
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    Runs the WEATHER_SQLITE_PRAGMAS on each new SQLite connection, connected to the connection_created signal.
+    A read only connection cannot set the journal mode, so it is set once on the DB file when missing, and the
+    connection fails if the DB file is still in another mode.
+    :exception: ImproperlyConfigured if a read only connection cannot get the journal mode of the settings.
+    """
+    if connection.vendor != 'sqlite' or not settings.WEATHER_SQLITE_PRAGMAS:
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.WEATHER_SQLITE_PRAGMAS.items():
+            if name == 'journal_mode' and is_read_only(connection):
+                if get_journal_mode(cursor) != value:
+                    set_journal_mode(connection, value)
+                    if get_journal_mode(cursor) != value:
+                        raise ImproperlyConfigured('The DB file {} is not in {} journal mode.'.format(
+                            connection.settings_dict['NAME'], value
+                        ))
+                continue
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
+
+
+class ReadOnlyRouter(object):
+    """
+    Sends the reads to the read only connection and the writes to the default one. Reads made inside a transaction
+    of the default connection stay on it, so that a data load sees its own rows.
+    """
+
+    def db_for_read(self, model, **hints):
+        if READ_ONLY_ALIAS not in settings.DATABASES or connections['default'].in_atomic_block:
+            return 'default'
+        return READ_ONLY_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != READ_ONLY_ALIAS
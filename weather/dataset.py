@@ -0,0 +1,54 @@
+"""Version of the imported weather dataset, changed by every data load."""
+
+import os
+
+from django.conf import settings
+
+from . import models
+
+
+def get_version():
+    """
+    Reads the dataset version from the version file.
+    :return: Version of the dataset, 0 when no data load has recorded one yet.
+    """
+    try:
+        with open(settings.WEATHER_DATASET_VERSION_FILE) as version_file:
+            return int(version_file.read().strip() or 0)
+    except (IOError, ValueError):
+        return 0
+
+
+def set_version(version):
+    """
+    Writes the dataset version, replacing the version file atomically.
+    :param version: New version of the dataset.
+    :return: The version written.
+    """
+    path = settings.WEATHER_DATASET_VERSION_FILE
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temp_path, 'w') as version_file:
+        version_file.write(str(version))
+    os.replace(temp_path, path)
+    return version
+
+
+def set_built_version(names, version):
+    """
+    Records that tables built from the daily weather are current for a dataset version.
+    :param names: Names of the built tables e.g. ['rollups:weekly'].
+    :param version: Dataset version the tables were built for.
+    """
+    for name in names:
+        models.BuiltVersion.objects.update_or_create(name=name, defaults={'version': version})
+
+
+def is_built_for(names, version):
+    """
+    Checks whether tables built from the daily weather are current for a dataset version.
+    :param names: Names of the built tables.
+    :param version: Current dataset version.
+    :return: True if every table was built for the version, False when one is missing or stale.
+    """
+    names = set(names)
+    return bool(version) and models.BuiltVersion.objects.filter(name__in=names, version=version).count() == len(names)
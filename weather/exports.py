@@ -0,0 +1,249 @@
+"""
+Background exports of the daily weather to gzip compressed CSV or columnar JSON files, run by a local thread pool.
+An export of the same query is reused until load_data changes the dataset version, once a version is recorded.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import TextField
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from . import dataset, models
+from .renderers import ColumnarJSONRenderer, CSVRenderer
+
+logger = logging.getLogger(__name__)
+
+# Format to the media type and file extension of its export.
+EXPORT_FORMATS = OrderedDict([
+    ('csv', (CSVRenderer.media_type, 'csv.gz')),
+    ('columns', (ColumnarJSONRenderer.media_type, 'json.gz')),
+])
+
+FIELDS = ('city', 'date', 'tmax', 'tmin')
+
+CHUNK_SIZE = 5000
+
+# Number of cities read per query, keeping the parameters of the query under the limit of 999 of SQLite.
+CITY_CHUNK_SIZE = 500
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_query_key(query):
+    """Returns the hex digest of a normalized export query, identical queries sharing a key"""
+    return hashlib.sha1(json.dumps(query, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def normalize_query(city=None, start_date=None, end_date=None, temp_format='fahrenheit', format='csv'):
+    """
+    Builds the stored form of an export query.
+    :param city: List of city names, empty or None for every city.
+    :param start_date: First day, None for no lower bound.
+    :param end_date: Last day, None for no upper bound.
+    :param temp_format: fahrenheit or celsius.
+    :param format: csv or columns.
+    :return: Map of the query, serializable as JSON.
+    """
+    return {
+        'city': sorted(set(city or [])), 'start_date': start_date and start_date.isoformat(),
+        'end_date': end_date and end_date.isoformat(), 'temp_format': temp_format, 'format': format,
+    }
+
+
+def iter_rows(query):
+    """
+    Reads the daily weather of a query through server side cursors, ordered by city and date.
+    The sorted city list is read CITY_CHUNK_SIZE cities at a time, so the rows keep their order across the queries.
+    :param query: Map of the query, as given by normalize_query.
+    :return: Generator of (city, date, tmax, tmin) tuples, the date as text and the temperatures in fahrenheit.
+    """
+    queryset = models.WeatherDetail.objects.all()
+    if query['start_date']:
+        queryset = queryset.filter(date__gte=query['start_date'])
+    if query['end_date']:
+        queryset = queryset.filter(date__lte=query['end_date'])
+    querysets = [
+        queryset.filter(city__in=query['city'][start:start + CITY_CHUNK_SIZE])
+        for start in range(0, len(query['city']), CITY_CHUNK_SIZE)
+    ] or [queryset]
+    for city_queryset in querysets:
+        yield from city_queryset.order_by('city', 'date').annotate(date_text=Cast('date', TextField())).values_list(
+            'city', 'date_text', 'tmax', 'tmin'
+        ).iterator()
+
+
+def iter_chunks(query, chunk_size=CHUNK_SIZE):
+    """
+    Reads the daily weather of a query in chunks, ordered by city and date.
+    :param query: Map of the query, as given by normalize_query.
+    :param chunk_size: Number of rows per chunk.
+    :return: Generator of lists of (city, date, tmax, tmin) tuples, in the temperature format of the query.
+    """
+    rows = iter_rows(query)
+    chunk = list(islice(rows, chunk_size))
+    while chunk:
+        if query['temp_format'] == 'celsius':
+            cities, dates, tmax, tmin = zip(*chunk)
+            chunk = list(zip(cities, dates, models.WeatherDetail.convert_column_to_celsius(tmax),
+                             models.WeatherDetail.convert_column_to_celsius(tmin)))
+        yield chunk
+        chunk = list(islice(rows, chunk_size))
+
+
+def write_csv(output, chunks):
+    """Writes the rows as CSV with a header line, a chunk at a time"""
+    for content in CSVRenderer().stream_columns(FIELDS, chunks):
+        output.write(content)
+
+
+def write_columns(output, chunks):
+    """
+    Writes the rows as a JSON object of one array per field, in the format of the columns renderer.
+    Each column is spooled to a temporary file of the export directory while the rows are read once.
+    """
+    renderer = ColumnarJSONRenderer()
+    renderer.spool_dir = settings.WEATHER_EXPORT_DIR
+    for content in renderer.stream_columns(FIELDS, chunks):
+        output.write(content)
+
+
+def count_rows(chunks, counter):
+    """Passes the chunks through, adding their number of rows to counter[0]"""
+    for chunk in chunks:
+        counter[0] += len(chunk)
+        yield chunk
+
+
+def run_export(job_id):
+    """
+    Writes the file of an export job and records its outcome on the job.
+    The file is written next to its final path and renamed once complete, so a download never sees a partial file.
+    :param job_id: Primary key of the ExportJob object.
+    """
+    job = models.ExportJob.objects.get(pk=job_id)
+    models.ExportJob.objects.filter(pk=job_id).update(status=models.ExportJob.RUNNING)
+    path = os.path.join(
+        settings.WEATHER_EXPORT_DIR, 'weather_export_{}.{}'.format(job.pk, EXPORT_FORMATS[job.format][1])
+    )
+    temp_path = '{}.tmp'.format(path)
+    try:
+        os.makedirs(settings.WEATHER_EXPORT_DIR, exist_ok=True)
+        counter = [0]
+        with gzip.open(temp_path, 'wb') as output:
+            chunks = count_rows(iter_chunks(json.loads(job.query)), counter)
+            (write_columns if job.format == 'columns' else write_csv)(output, chunks)
+        os.replace(temp_path, path)
+    except Exception as exc:
+        logger.exception('Export job %s failed', job_id)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        models.ExportJob.objects.filter(pk=job_id).update(
+            status=models.ExportJob.FAILED, error=str(exc), finished=timezone.now()
+        )
+        return
+    models.ExportJob.objects.filter(pk=job_id).update(
+        status=models.ExportJob.DONE, rows=counter[0], size=os.path.getsize(path), path=path, finished=timezone.now()
+    )
+
+
+def run_pooled_export(job_id):
+    """Runs an export job on a pool thread, closing the DB connections of the thread once done"""
+    try:
+        run_export(job_id)
+    finally:
+        connections.close_all()
+
+
+def get_executor():
+    """Returns the thread pool running the export jobs, created on its first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.WEATHER_EXPORT_WORKERS)
+    return _executor
+
+
+def expire_lost_jobs(query_key):
+    """
+    Marks the jobs of a query in progress for longer than WEATHER_EXPORT_TIMEOUT as failed, taken as lost with their
+    worker. As the first statement of the transaction of submit_export, this write also takes the write lock of the
+    SQLite DB, so an identical query submitted at the same time waits for the job of this one before its lookup.
+    """
+    started_before = timezone.now() - timedelta(seconds=settings.WEATHER_EXPORT_TIMEOUT)
+    models.ExportJob.objects.filter(
+        query_key=query_key, status__in=(models.ExportJob.PENDING, models.ExportJob.RUNNING),
+        created__lt=started_before
+    ).update(status=models.ExportJob.FAILED, error='The export was lost with its worker.', finished=timezone.now())
+
+
+def find_reusable_job(query_key, version):
+    """
+    Finds a job of an identical query for the dataset version, either done with its file still on disk or still in
+    progress. Until a data load has recorded a dataset version the data may change without one, so no job is reused.
+    :return: ExportJob object, None when the query has to be exported again.
+    """
+    if not version:
+        return None
+    jobs = models.ExportJob.objects.filter(query_key=query_key, version=version).exclude(
+        status=models.ExportJob.FAILED
+    ).order_by('-created')
+    for job in jobs:
+        if job.status != models.ExportJob.DONE or os.path.exists(job.path):
+            return job
+    return None
+
+
+def prune_exports(query_key, version):
+    """
+    Deletes the finished jobs of the earlier dataset versions and their files. Until a data load has recorded a
+    dataset version every query is exported again, so the finished jobs of the same query are deleted instead.
+    """
+    finished_jobs = models.ExportJob.objects.filter(status__in=(models.ExportJob.DONE, models.ExportJob.FAILED))
+    if version:
+        old_jobs = finished_jobs.filter(version__lt=version)
+    else:
+        old_jobs = finished_jobs.filter(query_key=query_key, version=0)
+    for path in old_jobs.exclude(path='').values_list('path', flat=True):
+        if os.path.exists(path):
+            os.remove(path)
+    old_jobs.delete()
+
+
+def submit_export(query):
+    """
+    Creates an export job for a query and hands it to the worker pool, or returns the job of an identical query
+    already exported or in progress for the current dataset version.
+    With WEATHER_EXPORT_WORKERS set to 0 the export runs before this returns.
+    :param query: Map of the query, as given by normalize_query.
+    :return: ExportJob object.
+    """
+    version, query_key = dataset.get_version(), get_query_key(query)
+    with transaction.atomic():
+        expire_lost_jobs(query_key)
+        job = find_reusable_job(query_key, version)
+        if job is not None:
+            return job
+        prune_exports(query_key, version)
+        job = models.ExportJob.objects.create(
+            query_key=query_key, query=json.dumps(query, sort_keys=True), format=query['format'], version=version
+        )
+        if settings.WEATHER_EXPORT_WORKERS:
+            # The pool thread reads the job with a connection of its own, so it is only started once it is stored.
+            transaction.on_commit(lambda: get_executor().submit(run_pooled_export, job.pk))
+    if not settings.WEATHER_EXPORT_WORKERS:
+        run_export(job.pk)
+        job.refresh_from_db()
+    return job
@@ -0,0 +1,192 @@
+"""Reading and validation of the weather TSV files, in this process or in a pool of worker processes."""
+
+import csv
+import glob
+import multiprocessing
+import os
+import queue as queue_module
+import time
+from itertools import islice
+
+import django
+from django.apps import apps
+from django.core.exceptions import ValidationError
+
+# Seconds the writer waits on the queue before checking that the worker processes are still alive.
+WORKER_POLL_SECONDS = 1
+
+
+def find_files(path):
+    """
+    Lists the files to load for a path.
+    :param path: A file, a directory holding the files or a glob pattern e.g 'data/*.tsv'
+    :return: Sorted list of file paths.
+    """
+    pattern = os.path.join(path, '*') if os.path.isdir(path) else path
+    return sorted(file_path for file_path in glob.glob(pattern) if os.path.isfile(file_path))
+
+
+def get_fields():
+    """
+    Returns the model fields converting the TSV values. The models are imported on first use, so that a worker process
+    started with the spawn method can import this module before Django is set up.
+    :return: Tuple of the coordinate, elevation, date and temperature fields.
+    """
+    from . import models
+    return (
+        models.Location._meta.get_field('latitude'), models.Location._meta.get_field('elevation'),
+        models.WeatherDetail._meta.get_field('date'), models.WeatherDetail._meta.get_field('tmax'),
+    )
+
+
+def parse_row(row, fields):
+    """
+    Validates a TSV row and converts its values.
+    :param row: List of strings (station, city, latitude, longitude, elevation, date, tmax, tmin)
+    :param fields: Tuple of the model fields, as given by get_fields.
+    :return: Tuple of the converted values, with None for a missing temperature.
+    """
+    coordinate_field, elevation_field, date_field, temperature_field = fields
+    station, city, latitude, longitude, elevation, date, tmax, tmin = row[:8]
+    return (
+        station, city, coordinate_field.to_python(latitude), coordinate_field.to_python(longitude),
+        elevation_field.to_python(elevation), date_field.to_python(date),
+        temperature_field.to_python(tmax or None), temperature_field.to_python(tmin or None)
+    )
+
+
+def read_batches(path, batch_size):
+    """
+    Reads and validates the rows of a file after the header.
+    :param path: Path of the TSV file.
+    :param batch_size: Maximum number of rows per batch.
+    :return: Generator of lists of parsed rows.
+    :exception: ValueError naming the file and line of the first invalid row, or the file when it cannot be read.
+    """
+    fields = get_fields()
+    try:
+        with open(path, 'r') as csvfile:
+            reader = csv.reader(csvfile, delimiter='\t')
+            next(reader, None)
+            # The line number is read as each row is, a row can span several lines when it holds a quoted newline.
+            numbered_rows = ((reader.line_num, row) for row in reader)
+            batch = list(islice(numbered_rows, batch_size))
+            while batch:
+                parsed = []
+                for line_num, row in batch:
+                    try:
+                        parsed.append(parse_row(row, fields))
+                    except (ValueError, ValidationError) as exc:
+                        raise ValueError('{}:{}: invalid row, {}'.format(path, line_num, exc))
+                yield parsed
+                batch = list(islice(numbered_rows, batch_size))
+    except (OSError, UnicodeError, csv.Error) as exc:
+        raise ValueError('{}: unreadable file, {}'.format(path, exc))
+
+
+def read_file(path, batch_size):
+    """
+    Reads a file into the messages for the writer, the same in a worker process and in the process of the command.
+    :param path: Path of the TSV file.
+    :param batch_size: Maximum number of rows per batch.
+    :return: Generator of ('batch', path, rows) followed by ('done', path, row_count, seconds), or by
+        ('error', path, message) at the first error.
+    """
+    started, rows = time.time(), 0
+    try:
+        for batch in read_batches(path, batch_size):
+            rows += len(batch)
+            yield 'batch', path, batch
+    except Exception as exc:
+        yield 'error', path, str(exc)
+    else:
+        yield 'done', path, rows, time.time() - started
+
+
+def setup_worker():
+    """Sets Django up in a worker process started with the spawn method, a forked worker already has it set up"""
+    if not apps.ready:
+        django.setup()
+
+
+def parse_file(path, batch_size, queue):
+    """
+    Sends the batches of a file followed by a done or error message on the queue.
+    :param path: Path of the TSV file.
+    :param batch_size: Maximum number of rows per batch.
+    :param queue: Queue shared with the writer.
+    """
+    for message in read_file(path, batch_size):
+        queue.put(message)
+
+
+def read_files(paths, batch_size, queue):
+    """
+    Worker process entry point, reads the files handed out on the paths queue until it hands out None.
+    :param paths: Queue of the file paths shared by the workers.
+    :param batch_size: Maximum number of rows per batch.
+    :param queue: Queue shared with the writer.
+    """
+    setup_worker()
+    for path in iter(paths.get, None):
+        parse_file(path, batch_size, queue)
+
+
+def parse_files(paths, batch_size, workers=1):
+    """
+    Reads the files, in worker processes when there is more than one file and worker.
+    The batches are handed back to the caller one at a time, so a single writer stores them. The workers send them on
+    a plain queue, each batch being pickled once and read straight from the pipe.
+    :param paths: List of file paths.
+    :param batch_size: Maximum number of rows per batch.
+    :param workers: Number of worker processes.
+    :return: Generator of ('batch', path, rows), ('done', path, row_count, seconds) and ('error', path, message).
+    """
+    if workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield from read_file(path, batch_size)
+        return
+
+    paths_queue, queue = multiprocessing.Queue(), multiprocessing.Queue(maxsize=workers * 2)
+    for path in list(paths) + [None] * workers:
+        paths_queue.put(path)
+    processes = [
+        multiprocessing.Process(target=read_files, args=(paths_queue, batch_size, queue), daemon=True)
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    remaining = len(paths)
+    try:
+        while remaining:
+            message = get_message(queue, processes)
+            if message[0] != 'batch':
+                remaining -= 1
+            yield message
+    finally:
+        # Workers block on a full queue once the writer stops reading, so the unfinished ones are stopped.
+        for process in processes:
+            if remaining and process.is_alive():
+                process.terminate()
+            process.join()
+        paths_queue.close()
+        queue.close()
+
+
+def get_message(queue, processes):
+    """
+    Waits for the next message of the worker processes.
+    :param queue: Queue shared with the workers.
+    :param processes: List of the worker processes.
+    :return: Next message on the queue, or an error message when a worker process died before finishing its files.
+    """
+    while True:
+        # Read before waiting, every message a process sent before exiting is then on the queue.
+        exit_codes = [process.exitcode for process in processes]
+        try:
+            return queue.get(timeout=WORKER_POLL_SECONDS)
+        except queue_module.Empty:
+            pass
+        failed = [exit_code for exit_code in exit_codes if exit_code]
+        if failed or None not in exit_codes:
+            return 'error', None, 'worker process failed with exit code {}'.format(failed[0] if failed else 0)
@@ -0,0 +1,249 @@
+"""
+Opt-in per request timings: wall time of each phase, SQL query count, time and rows, sent back in a Server-Timing
+header, written as a log line and kept in rolling per end point histograms.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.utils import CursorDebugWrapper, CursorWrapper
+from django.http import Http404, JsonResponse
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (50, 95, 99)
+
+_local = threading.local()
+
+
+class CountingCursorWrapper(CursorDebugWrapper):
+    """Cursor logging its queries like the debug cursor and counting the rows fetched from them."""
+
+    def count_rows(self, name, *args):
+        """Calls a fetch method of the cursor and adds the rows it returned to the current request"""
+        rows = CursorWrapper.__getattr__(self, name)(*args)
+        profile = get_profile()
+        if profile is not None:
+            profile.rows += len(rows) if name != 'fetchone' else rows is not None
+        return rows
+
+    def fetchone(self):
+        return self.count_rows('fetchone')
+
+    def fetchmany(self, *args):
+        return self.count_rows('fetchmany', *args)
+
+    def fetchall(self):
+        return self.count_rows('fetchall')
+
+    def __iter__(self):
+        with self.db.wrap_database_errors:
+            for row in self.cursor:
+                profile = get_profile()
+                if profile is not None:
+                    profile.rows += 1
+                yield row
+
+
+class RequestProfile(object):
+    """Timings of one request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = OrderedDict()
+        self.rows = 0
+        self.queries = 0
+        self.query_time = 0.0
+
+    def add_phase(self, name, duration):
+        """Adds the wall time in seconds of a phase, a phase entered several times being summed"""
+        self.phases[name] = self.phases.get(name, 0.0) + duration
+
+    def get_metrics(self, total):
+        """
+        Gathers the timings of the request.
+        :param total: Wall time of the request in seconds.
+        :return: Ordered map of metric name to a map of its duration in ms and optional description.
+        """
+        metrics = OrderedDict()
+        metrics['db'] = {
+            'dur': self.query_time * 1000, 'desc': '{} queries / {} rows'.format(self.queries, self.rows)
+        }
+        for name, duration in self.phases.items():
+            metrics[name] = {'dur': duration * 1000}
+        metrics['total'] = {'dur': total * 1000}
+        return metrics
+
+    @staticmethod
+    def get_server_timing(metrics):
+        """Formats the metrics as a Server-Timing header value"""
+        entries = []
+        for name, metric in metrics.items():
+            entry = '{};dur={:.2f}'.format(name, metric['dur'])
+            entries.append(entry + ';desc="{}"'.format(metric['desc']) if 'desc' in metric else entry)
+        return ', '.join(entries)
+
+
+def get_profile():
+    """Returns the RequestProfile of the request handled by this thread, None when it is not instrumented"""
+    return getattr(_local, 'profile', None)
+
+
+@contextmanager
+def phase(name):
+    """
+    Records the wall time of a block as a phase of the current request, doing nothing when it is not instrumented.
+    :param name: Name of the phase e.g 'aggregate'.
+    """
+    profile = get_profile()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_phase(name, time.perf_counter() - start)
+
+
+class LatencyHistograms(object):
+    """Wall times of the last requests of each end point, for rolling percentiles."""
+
+    def __init__(self, size=1000):
+        """
+        :param size: Number of requests kept per end point.
+        """
+        self.size = size
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def add(self, endpoint, metrics):
+        """
+        Records the metrics of a request.
+        :param endpoint: Name of the end point.
+        :param metrics: Map of metric name to a map holding its duration in ms.
+        """
+        with self.lock:
+            samples = self.samples.setdefault(endpoint, deque(maxlen=self.size))
+            samples.append({name: metric['dur'] for name, metric in metrics.items()})
+
+    def get_stats(self):
+        """
+        Computes the percentiles of each metric of each end point over its last requests.
+        :return: Map of end point to the number of requests and a map of metric name to the p50, p95 and p99 in ms.
+        """
+        with self.lock:
+            samples = {endpoint: list(values) for endpoint, values in self.samples.items()}
+        stats = OrderedDict()
+        for endpoint in sorted(samples):
+            names = OrderedDict((name, None) for sample in samples[endpoint] for name in sample)
+            stats[endpoint] = {'count': len(samples[endpoint]), 'metrics': OrderedDict(
+                (name, get_percentiles([sample.get(name, 0.0) for sample in samples[endpoint]])) for name in names
+            )}
+        return stats
+
+    def clear(self):
+        """Drops the recorded requests"""
+        with self.lock:
+            self.samples.clear()
+
+
+def get_percentiles(values):
+    """Returns the p50, p95 and p99 of a list of values by the nearest rank method, rounded to 0.01"""
+    values = sorted(values)
+    return OrderedDict(
+        ('p{}'.format(percentile), round(values[max(0, -(-percentile * len(values) // 100) - 1)], 2))
+        for percentile in PERCENTILES
+    )
+
+
+HISTOGRAMS = LatencyHistograms()
+
+
+class InstrumentationMiddleware(object):
+    """
+    Times the requests when WEATHER_INSTRUMENTATION is set, and is removed from the middleware chain otherwise.
+    The view and render phases are split where the view returns its response. A streamed body is sent after the
+    middleware has run, so only the time to its first byte is counted.
+    """
+
+    def __init__(self, get_response):
+        if not settings.WEATHER_INSTRUMENTATION:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = _local.profile = RequestProfile()
+        debug_cursors = self.enable_query_log()
+        try:
+            api_response = self.get_response(request)
+        finally:
+            _local.profile = None
+            self.read_query_log(profile, debug_cursors)
+        total = time.perf_counter() - profile.start
+        metrics = profile.get_metrics(total)
+        api_response['Server-Timing'] = profile.get_server_timing(metrics)
+        endpoint = self.get_endpoint(request)
+        HISTOGRAMS.add(endpoint, metrics)
+        logger.info(json.dumps(OrderedDict([
+            ('endpoint', endpoint), ('path', request.get_full_path()), ('status', api_response.status_code),
+            ('queries', profile.queries), ('rows', profile.rows),
+            ('timings', OrderedDict((name, round(metric['dur'], 2)) for name, metric in metrics.items())),
+        ])))
+        return api_response
+
+    @staticmethod
+    def enable_query_log():
+        """
+        Logs the queries of every connection for the request, counting the rows they return.
+        :return: Map of connection alias to its force_debug_cursor before the request and its logged query count.
+        """
+        debug_cursors = {}
+        for connection in connections.all():
+            debug_cursors[connection.alias] = (connection.force_debug_cursor, len(connection.queries_log))
+            connection.force_debug_cursor = True
+            connection.make_debug_cursor = lambda cursor, connection=connection: \
+                CountingCursorWrapper(cursor, connection)
+        return debug_cursors
+
+    @staticmethod
+    def read_query_log(profile, debug_cursors):
+        """Adds the queries logged during the request to the profile, and restores the connections"""
+        for connection in connections.all():
+            force_debug_cursor, logged = debug_cursors.get(connection.alias, (False, 0))
+            queries = list(connection.queries_log)[logged:]
+            profile.queries += len(queries)
+            profile.query_time += sum(float(query['time']) for query in queries)
+            connection.force_debug_cursor = force_debug_cursor
+            connection.__dict__.pop('make_debug_cursor', None)
+
+    def process_template_response(self, request, api_response):
+        """Marks the end of the view and the start of the rendering"""
+        profile = get_profile()
+        if profile is not None:
+            render_start = time.perf_counter()
+            profile.add_phase('view', render_start - profile.start)
+            api_response.add_post_render_callback(
+                lambda rendered: profile.add_phase('render', time.perf_counter() - render_start)
+            )
+        return api_response
+
+    @staticmethod
+    def get_endpoint(request):
+        """Returns the URL name of the request, or its path when it did not resolve"""
+        match = getattr(request, 'resolver_match', None)
+        return match.url_name or match.view_name if match is not None else request.path
+
+
+def stats_view(request):
+    """Returns the rolling percentiles of each end point as JSON, only while the instrumentation is enabled"""
+    if not settings.WEATHER_INSTRUMENTATION:
+        raise Http404('Instrumentation is disabled')
+    return JsonResponse(HISTOGRAMS.get_stats())
@@ -0,0 +1,239 @@
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from io import StringIO
+
+import django
+from django.conf import settings
+from django.core.management import BaseCommand, call_command
+from django.db import connection
+from django.test import Client, override_settings
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from weather import models, synthetic
+from weather.apis import WeatherDetailRowSerializer, WeatherDetailSerializer
+
+API_CASES = (
+    ('daily_range', '/api/weather/?city={city}&start_date={middle_year}-01-01&end_date={middle_year}-12-31'),
+    ('daily_all', '/api/weather/?city={city}'),
+    ('daily_celsius', '/api/weather/?city={city}&temp_format=celsius'),
+    ('weekly', '/api/weather/?city={city}&frequency=weekly'),
+    ('monthly', '/api/weather/?city={city}&frequency=monthly'),
+    ('monthly_celsius', '/api/weather/?city={city}&frequency=monthly&temp_format=celsius'),
+    ('cities_list', '/api/cities/'),
+)
+
+# Run in a new interpreter: loads the project and serves its first request, printing the timings as JSON.
+STARTUP_SCRIPT = '''
+import io, json, sys, time
+started = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+loaded = time.perf_counter()
+statuses = []
+environ = {
+    'REQUEST_METHOD': 'GET', 'PATH_INFO': sys.argv[1], 'QUERY_STRING': '', 'SERVER_NAME': 'localhost',
+    'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(),
+    'wsgi.errors': sys.stderr,
+}
+response = application(environ, lambda status, headers: statuses.append(status))
+b''.join(response)
+response.close()
+served = time.perf_counter()
+print(json.dumps({
+    'status': statuses[0], 'load_seconds': loaded - started, 'first_request_seconds': served - loaded,
+    'modules': len(sys.modules),
+}))
+'''
+
+STARTUP_PATH = '/api/cities/'
+
+
+class Command(BaseCommand):
+    """Management command for timing the data load and the weather API on generated data"""
+
+    help = 'Times the data load and the weather API on a synthetic dataset in a throwaway test DB'
+
+    def add_arguments(self, parser):
+        """Adds the options of the benchmark"""
+        parser.add_argument(
+            '--stations', dest='stations', type=int, default=20,
+            help='the number of stations of the generated dataset',
+        )
+        parser.add_argument(
+            '--years', dest='years', type=int, default=10,
+            help='the number of years of daily weather generated for each station',
+        )
+        parser.add_argument(
+            '--seed', dest='seed', type=int, default=0,
+            help='the seed of the generated dataset',
+        )
+        parser.add_argument(
+            '--workers', dest='workers', type=int, default=1,
+            help='the number of processes reading the files during the load',
+        )
+        parser.add_argument(
+            '--repeat', dest='repeat', type=int, default=5,
+            help='the number of runs of each case, the fastest one and the median are reported',
+        )
+        parser.add_argument(
+            '--output', dest='output',
+            help='the path of a JSON file for the results',
+        )
+
+    @staticmethod
+    def time_calls(function, repeat):
+        """Returns the wall times in seconds of repeat calls of function"""
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - started)
+        return timings
+
+    @classmethod
+    def time_call(cls, function, repeat):
+        """Returns the fastest wall time in seconds of repeat calls of function"""
+        return min(cls.time_calls(function, repeat))
+
+    @staticmethod
+    def get_environment():
+        """Returns the versions the results were measured with"""
+        return {
+            'python': platform.python_version(), 'django': django.get_version(), 'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(), 'cpus': os.cpu_count(),
+        }
+
+    def benchmark_load(self, temp_dir, options):
+        """Generates the dataset as TSV files and times load_data on it"""
+        started = time.perf_counter()
+        paths, rows = synthetic.write_dataset(
+            os.path.join(temp_dir, 'data'), options['stations'], options['years'], seed=options['seed'],
+            files=max(options['workers'], 1)
+        )
+        generate_seconds = time.perf_counter() - started
+        file_pattern = paths[0] if len(paths) == 1 else os.path.join(temp_dir, 'data', '*.tsv')
+        load_seconds = self.time_call(
+            lambda: call_command(
+                'load_data', '--file', file_pattern, '--workers', str(options['workers']), stdout=StringIO()
+            ), 1
+        )
+        self.stdout.write("Loaded {} rows of {} stations in {:.2f}s ({:.0f} rows/s)".format(
+            rows, options['stations'], load_seconds, rows / load_seconds
+        ))
+        return {
+            'rows': rows, 'files': len(paths), 'workers': options['workers'], 'generate_seconds': generate_seconds,
+            'load_seconds': load_seconds, 'rows_per_second': rows / load_seconds,
+        }
+
+    def benchmark_api(self, city, options):
+        """Times each query shape of the API through the full request cycle, with the response cache off"""
+        client, results = Client(), {}
+        middle_year = synthetic.START_YEAR + options['years'] // 2
+        for name, url in API_CASES:
+            url = url.format(city=city.name, middle_year=middle_year)
+            api_response = client.get(url)
+            content = b''.join(api_response) if api_response.streaming else api_response.content
+            timings = self.time_calls(lambda: b''.join(client.get(url)), options['repeat'])
+            results[name] = {
+                'url': url, 'status': api_response.status_code, 'bytes': len(content),
+                'min_seconds': min(timings), 'median_seconds': statistics.median(timings),
+            }
+            self.stdout.write("GET {} in {:.4f}s (median {:.4f}s, {} bytes)".format(
+                url, min(timings), statistics.median(timings), len(content)
+            ))
+        return results
+
+    def benchmark_startup(self, repeat):
+        """
+        Times new processes from their start until their first request is served, in the default and lean modes.
+        The processes run on the project DB, reading its cities.
+        """
+        results = {}
+        for mode, lean in (('default', ''), ('lean', '1')):
+            environment = dict(os.environ, DJANGO_SETTINGS_MODULE='project.settings', WEATHER_LEAN=lean)
+            runs = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                output = subprocess.check_output(
+                    [sys.executable, '-c', STARTUP_SCRIPT, STARTUP_PATH], env=environment, cwd=settings.BASE_DIR
+                )
+                run = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+                run['process_seconds'] = time.perf_counter() - started
+                runs.append(run)
+            results[mode] = {
+                'status': runs[0]['status'], 'modules': runs[0]['modules'],
+                'min_seconds': min(run['process_seconds'] for run in runs),
+                'median_seconds': statistics.median(run['process_seconds'] for run in runs),
+                'median_load_seconds': statistics.median(run['load_seconds'] for run in runs),
+                'median_first_request_seconds': statistics.median(run['first_request_seconds'] for run in runs),
+            }
+            self.stdout.write("Started and served GET {} in {:.3f}s (median {:.3f}s, {} modules) in {} mode".format(
+                STARTUP_PATH, results[mode]['min_seconds'], results[mode]['median_seconds'], runs[0]['modules'], mode
+            ))
+        return results
+
+    def benchmark_serializers(self, city, repeat):
+        """Times the model serializer against the row serializer for the daily list of a city"""
+        # WeatherDetailSerializer can not convert a missing temperature to celsius, so both are given the full days.
+        days = models.WeatherDetail.objects.filter(city=city, tmax__isnull=False, tmin__isnull=False)
+        results = {'rows': days.count()}
+        for temp_format in ('fahrenheit', 'celsius'):
+            request = Request(APIRequestFactory().get('/api/weather/', {'temp_format': temp_format}))
+            queryset = days.order_by('date')
+            model_serializer = self.time_call(
+                lambda: WeatherDetailSerializer(queryset.all(), many=True, context={'request': request}).data, repeat
+            )
+            row_serializer = self.time_call(
+                lambda: WeatherDetailRowSerializer(queryset.all(), temp_format).data, repeat
+            )
+            results[temp_format] = {
+                'model_serializer_seconds': model_serializer,
+                'row_serializer_seconds': row_serializer,
+                'speedup': model_serializer / row_serializer,
+            }
+            self.stdout.write("Serialized {} {} rows in {:.4f}s with WeatherDetailSerializer and {:.4f}s with "
+                              "WeatherDetailRowSerializer, {:.1f}x faster".format(
+                                  results['rows'], temp_format, model_serializer, row_serializer,
+                                  model_serializer / row_serializer))
+        return results
+
+    def handle(self, *args, **options):
+        """Entry point for running the management command"""
+        old_name = connection.settings_dict['NAME']
+        temp_dir = tempfile.mkdtemp()
+        # The load bumps a dataset version of its own, and the responses are timed without the response cache.
+        settings_override = override_settings(
+            WEATHER_DATASET_VERSION_FILE=os.path.join(temp_dir, 'weather_db.version'),
+            WEATHER_SNAPSHOT_FILE=os.path.join(temp_dir, 'weather_db.snapshot'),
+            WEATHER_RESPONSE_CACHE=False,
+        )
+        settings_override.enable()
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = {
+                'environment': self.get_environment(),
+                'dataset': {'stations': options['stations'], 'years': options['years'], 'seed': options['seed']},
+                'load': self.benchmark_load(temp_dir, options),
+            }
+            city = models.Location.objects.order_by('name').first()
+            results['api'] = self.benchmark_api(city, options)
+            results['serializers'] = self.benchmark_serializers(city, options['repeat'])
+            results['startup'] = self.benchmark_startup(options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            settings_override.disable()
+            shutil.rmtree(temp_dir)
+
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump(results, output_file, indent=2, sort_keys=True)
+            self.stdout.write("Wrote the results to `{}`".format(options['output']))
@@ -0,0 +1,28 @@
+import os
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from weather import schema
+
+
+class Command(BaseCommand):
+    """Management command for writing the OpenAPI schema served in lean mode"""
+
+    help = 'Writes the OpenAPI schema of the API to a file, served by /api/schema/ in lean mode'
+
+    def add_arguments(self, parser):
+        """Adds the path of the schema file"""
+        parser.add_argument(
+            '--output', dest='output', default=settings.WEATHER_SCHEMA_FILE,
+            help='the path of the schema file, WEATHER_SCHEMA_FILE by default',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for running the management command"""
+        content = schema.render_schema()
+        temp_path = '{}.{}.tmp'.format(options['output'], os.getpid())
+        with open(temp_path, 'wb') as schema_file:
+            schema_file.write(content)
+        os.replace(temp_path, options['output'])
+        self.stdout.write("Wrote the schema of {} bytes to `{}`".format(len(content), options['output']))
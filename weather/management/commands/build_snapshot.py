@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from weather import dataset, snapshot
+
+
+class Command(BaseCommand):
+    """Management command for writing the memory mapped snapshot of the weather data"""
+
+    help = 'Writes the binary snapshot of the daily weather shared by the API worker processes'
+
+    def add_arguments(self, parser):
+        """Adds the options of the snapshot"""
+        parser.add_argument(
+            '--file', dest='file', default=settings.WEATHER_SNAPSHOT_FILE,
+            help='the path of the snapshot file, the one read by the API by default',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for running the management command"""
+        if snapshot.np is None:
+            raise CommandError("numpy is required to build the snapshot")
+        version = dataset.get_version()
+        if not version:
+            raise CommandError("No dataset version recorded, run load_data first")
+        started = time.time()
+        try:
+            rows = snapshot.write_snapshot(options['file'], version)
+        except ValueError as exc:
+            raise CommandError("Could not write the snapshot, {}".format(exc))
+        self.stdout.write("Wrote {} rows for dataset version {} to `{}` in {:.2f}s".format(
+            rows, version, options['file'], time.time() - started
+        ))
@@ -0,0 +1,58 @@
+import time
+
+from django.core.management import BaseCommand, CommandError
+
+from weather import synthetic
+
+
+class Command(BaseCommand):
+    """Management command for writing a synthetic dataset in the load_data format"""
+
+    help = 'Writes synthetic daily weather of many stations as TSV files for load_data'
+
+    def add_arguments(self, parser):
+        """Adds the options of the dataset"""
+        parser.add_argument(
+            '--output', dest='output', required=True,
+            help='the path of the TSV file, or of a directory of files when --files is more than 1',
+        )
+        parser.add_argument(
+            '--stations', dest='stations', type=int, default=100,
+            help='the number of stations',
+        )
+        parser.add_argument(
+            '--years', dest='years', type=int, default=10,
+            help='the number of years of daily weather per station',
+        )
+        parser.add_argument(
+            '--start-year', dest='start_year', type=int, default=synthetic.START_YEAR,
+            help='the year of the first day',
+        )
+        parser.add_argument(
+            '--seed', dest='seed', type=int, default=0,
+            help='the seed of the random data, the same seed always writes the same dataset',
+        )
+        parser.add_argument(
+            '--missing', dest='missing', type=float, default=0.01,
+            help='the fraction of the temperatures left empty',
+        )
+        parser.add_argument(
+            '--files', dest='files', type=int, default=1,
+            help='the number of files the stations are split over, for the --workers of load_data',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for running the management command"""
+        if options['stations'] < 1 or options['years'] < 1 or options['files'] < 1:
+            raise CommandError("--stations, --years and --files must be at least 1")
+        if not 0 <= options['missing'] <= 1:
+            raise CommandError("--missing must be between 0 and 1")
+        started = time.time()
+        paths, rows = synthetic.write_dataset(
+            options['output'], options['stations'], options['years'], options['start_year'], options['seed'],
+            options['missing'], options['files']
+        )
+        seconds = time.time() - started
+        self.stdout.write("Wrote {} rows of {} stations over {} years to {} files in `{}` in {:.2f}s".format(
+            rows, options['stations'], options['years'], len(paths), options['output'], seconds
+        ))
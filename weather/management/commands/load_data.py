@@ -1,8 +1,15 @@
-import csv
+import os
+import time
+from collections import Counter
 
-from django.core.management import BaseCommand
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import models as db_models, transaction
 
-from weather import models
+from weather import dataset, ingest, models, rollups, snapshot, summaries
+
+# Changed days per UPDATE statement, each day takes five query parameters and SQLite allows 999 per statement.
+UPDATE_BATCH_SIZE = 150
 
 
 class Command(BaseCommand):
@@ -14,7 +21,19 @@ class Command(BaseCommand):
         """Adds the required options to be passed to the file load"""
         parser.add_argument(
             '--file', dest='file', required=True,
-            help='the path for the file to upload',
+            help='the path for the file to upload, a directory of files or a glob pattern e.g "data/*.tsv"',
+        )
+        parser.add_argument(
+            '--workers', dest='workers', type=int, default=os.cpu_count() or 1,
+            help='the number of processes reading the files, the DB is written by this process only',
+        )
+        parser.add_argument(
+            '--batch-size', dest='batch_size', type=int, default=5000,
+            help='the number of rows read and written to the DB at a time',
+        )
+        parser.add_argument(
+            '--incremental', dest='incremental', action='store_true',
+            help='keep the existing data, insert the new days and update the changed ones',
         )
 
     def cleanup_model(self):
@@ -23,33 +42,148 @@ class Command(BaseCommand):
             models.Location.objects.all().delete()
 
     @staticmethod
-    def create_locations(data):
-        """Create the location object ie station or city"""
-        cities = {(row[0], row[1], row[2], row[3], row[4]) for row in data}
+    def get_locations():
+        """Returns the existing locations as a map of city to (station, latitude, longitude, elevation)"""
+        return {
+            name: (station, latitude, longitude, elevation) for name, station, latitude, longitude, elevation in
+            models.Location.objects.values_list('name', 'station', 'latitude', 'longitude', 'elevation')
+        }
+
+    @staticmethod
+    def create_locations(data, known_locations, counts):
+        """Create the location object ie station or city for new cities and update the changed ones"""
+        cities = {row[1]: (row[0], row[2], row[3], row[4]) for row in data}
+        changed = {city: values for city, values in cities.items() if known_locations.get(city, values) != values}
+        for city, (station, latitude, longitude, elevation) in changed.items():
+            models.Location.objects.filter(name=city).update(
+                station=station, latitude=latitude, longitude=longitude, elevation=elevation
+            )
         locations = (
             [models.Location(name=city, station=station, latitude=latitude, longitude=longitude, elevation=elevation)
-                for city_data in cities for (station, city, latitude, longitude, elevation) in (city_data,)]
+                for city, (station, latitude, longitude, elevation) in cities.items() if city not in known_locations]
         )
+        known_locations.update(cities)
+        counts['locations_updated'] += len(changed)
+        counts['locations_inserted'] += len(locations)
         return models.Location.objects.bulk_create(locations)
 
     @staticmethod
     def create_weather_detail(data):
         """Create the weather detail object in the DB"""
-        weather_detail = [models.WeatherDetail(city_id=row[1], date=row[5], tmax=row[6] or None, tmin=row[7] or None)
+        weather_detail = [models.WeatherDetail(city_id=row[1], date=row[5], tmax=row[6], tmin=row[7])
             for row in data]
         return models.WeatherDetail.objects.bulk_create(weather_detail)
 
+    @staticmethod
+    def update_weather_detail(updates):
+        """
+        Updates the temperatures of the changed days, with one UPDATE statement for a chunk of days.
+        :param updates: List of (pk, tmax, tmin) of the changed days.
+        :return: Number of rows updated.
+        """
+        updated = 0
+        for start in range(0, len(updates), UPDATE_BATCH_SIZE):
+            chunk = updates[start:start + UPDATE_BATCH_SIZE]
+            new_values = {
+                name: db_models.Case(
+                    *[db_models.When(pk=row[0], then=db_models.Value(row[index])) for row in chunk],
+                    output_field=db_models.IntegerField()
+                ) for index, name in ((1, 'tmax'), (2, 'tmin'))
+            }
+            updated += models.WeatherDetail.objects.filter(pk__in=[row[0] for row in chunk]).update(**new_values)
+        return updated
+
+    @classmethod
+    def upsert_weather_detail(cls, data, counts, changes):
+        """
+        Inserts the new days and updates the changed days of the batch, leaving the unchanged days untouched.
+        :param data: Parsed rows of the batch.
+        :param counts: Counter of inserted, updated and skipped rows.
+        :param changes: Map of city to the first inserted or updated date, updated in place.
+        """
+        rows = {(row[1], row[5]): (row[6], row[7]) for row in data}
+        cities, dates = {city for city, _ in rows}, [date for _, date in rows]
+        existing = {
+            (city, date): (pk, tmax, tmin) for pk, city, date, tmax, tmin in models.WeatherDetail.objects.filter(
+                city__in=cities, date__gte=min(dates), date__lte=max(dates)
+            ).values_list('id', 'city', 'date', 'tmax', 'tmin')
+        }
+
+        new_rows, updates = [], []
+        for (city, date), (tmax, tmin) in rows.items():
+            pk, old_tmax, old_tmin = existing.get((city, date), (None, None, None))
+            if pk is None:
+                new_rows.append(models.WeatherDetail(city_id=city, date=date, tmax=tmax, tmin=tmin))
+            elif (old_tmax, old_tmin) != (tmax, tmin):
+                updates.append((pk, tmax, tmin))
+            else:
+                counts['skipped'] += 1
+                continue
+            changes[city] = min(changes.get(city, date), date)
+        counts['skipped'] += len(data) - len(rows)
+        counts['updated'] += cls.update_weather_detail(updates)
+        counts['inserted'] += len(models.WeatherDetail.objects.bulk_create(new_rows))
+
     def handle(self, *args, **options):
         """Entry point for running the management command"""
-        print("Starting csv file upload")
-        file_path = options['file']
-
-        with open(file_path, 'r') as csvfile:
-            print("Opened the file `{}` for upload in read mode".format(file_path))
-            self.cleanup_model()
-            print("Removed existing data from DB")
-            csv_data = [row for row in csv.reader(csvfile, delimiter='\t')][1:]
-            self.create_locations(csv_data)
-            self.create_weather_detail(csv_data)
-
-        print("Completed csv file upload successfully")
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1")
+        self.stdout.write("Starting csv file upload")
+        file_path, batch_size, incremental = options['file'], options['batch_size'], options['incremental']
+        file_paths = ingest.find_files(file_path)
+        if not file_paths:
+            raise CommandError("No file found for `{}`".format(file_path))
+        self.stdout.write("Found {} files for upload in `{}`".format(len(file_paths), file_path))
+        started = time.time()
+
+        with transaction.atomic():
+            if not incremental:
+                self.cleanup_model()
+                self.stdout.write("Removed existing data from DB")
+            known_locations, counts, changes = self.get_locations() if incremental else {}, Counter(), {}
+            for message in ingest.parse_files(file_paths, batch_size, min(options['workers'], len(file_paths))):
+                if message[0] == 'error':
+                    raise CommandError(message[2])
+                if message[0] == 'done':
+                    _, path, rows, seconds = message
+                    self.stdout.write("Read {} rows from `{}` in {:.2f}s ({:.0f} rows/s)".format(
+                        rows, path, seconds, rows / seconds if seconds else rows
+                    ))
+                    continue
+                batch = message[2]
+                self.create_locations(batch, known_locations, counts)
+                if incremental:
+                    self.upsert_weather_detail(batch, counts, changes)
+                else:
+                    counts['inserted'] += len(self.create_weather_detail(batch))
+                self.stdout.write("Uploaded {} rows for {} cities".format(
+                    counts['inserted'] + counts['updated'] + counts['skipped'], len(known_locations)
+                ))
+            self.stdout.write("Inserted {inserted}, updated {updated} and skipped {skipped} rows, inserted "
+                              "{locations_inserted} and updated {locations_updated} cities".format_map(counts))
+            changed = not incremental or any(
+                counts[key] for key in ('inserted', 'updated', 'locations_inserted', 'locations_updated')
+            )
+            if changed:
+                version = dataset.get_version() + 1
+                rollups.build_rollups(version, since=changes if incremental else None)
+                summaries.build_prefix_sums(version, since=changes if incremental else None)
+
+        if changed:
+            if settings.WEATHER_TIMESERIES_STORE and snapshot.np is not None:
+                # Written before the version is bumped, so workers switch to the new snapshot and version together.
+                # Without one the workers answer from the DB, as the snapshot left in place is of another version.
+                try:
+                    rows = snapshot.write_snapshot(settings.WEATHER_SNAPSHOT_FILE, version)
+                except ValueError as exc:
+                    self.stdout.write("Skipped the snapshot, {}".format(exc))
+                else:
+                    self.stdout.write(
+                        "Wrote the snapshot of {} rows to `{}`".format(rows, settings.WEATHER_SNAPSHOT_FILE)
+                    )
+            dataset.set_version(version)
+            self.stdout.write(
+                "Built the weekly, monthly and yearly rollups and running totals for dataset version {}".format(version)
+            )
+        total_rows, seconds = sum(counts[key] for key in ('inserted', 'updated', 'skipped')), time.time() - started
+        self.stdout.write("Completed csv file upload of {} rows in {:.2f}s".format(total_rows, seconds))
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.10 on 2026-10-17 04:17
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0002_auto_20180304_0553'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeatherRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('frequency', models.CharField(max_length=10)),
+                ('temp_format', models.CharField(max_length=10)),
+                ('start_date', models.DateField()),
+                ('tmax_total', models.IntegerField()),
+                ('tmin_total', models.IntegerField()),
+                ('tmax_days', models.IntegerField()),
+                ('tmin_days', models.IntegerField()),
+                ('version', models.PositiveIntegerField(db_index=True)),
+                ('city', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='weather.Location')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='weatherrollup',
+            unique_together=set([('city', 'frequency', 'temp_format', 'start_date')]),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.10 on 2026-10-17 04:18
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0003_weatherrollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='weatherdetail',
+            name='city',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='city_name', to='weather.Location'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='weatherdetail',
+            unique_together=set([('city', 'date')]),
+        ),
+        migrations.AddIndex(
+            model_name='weatherdetail',
+            index=models.Index(fields=['city', 'date', 'tmax', 'tmin'], name='weather_city_date_temps_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.10 on 2026-10-17 04:31
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0004_weatherdetail_city_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeatherPrefixSum',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('temp_format', models.CharField(max_length=10)),
+                ('date', models.DateField()),
+                ('tmax_total', models.IntegerField()),
+                ('tmin_total', models.IntegerField()),
+                ('tmax_days', models.IntegerField()),
+                ('tmin_days', models.IntegerField()),
+                ('version', models.PositiveIntegerField(db_index=True)),
+                ('city', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prefix_sums', to='weather.Location')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='weatherprefixsum',
+            unique_together=set([('city', 'temp_format', 'date')]),
+        ),
+    ]
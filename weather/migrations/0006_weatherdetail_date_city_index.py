@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.10 on 2026-10-17 04:36
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0005_weatherprefixsum'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='weatherdetail',
+            index=models.Index(fields=['date', 'city', 'tmax', 'tmin'], name='weather_date_city_temps_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.10 on 2026-10-17 05:25
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def record_built_versions(apps, schema_editor):
+    """Moves the version stamped on every rollup and running total row to one built version row per table"""
+    WeatherRollup = apps.get_model('weather', 'WeatherRollup')
+    WeatherPrefixSum = apps.get_model('weather', 'WeatherPrefixSum')
+    BuiltVersion = apps.get_model('weather', 'BuiltVersion')
+    tables = [('prefix_sums', WeatherPrefixSum.objects.all())] + [
+        ('rollups:{}'.format(frequency), WeatherRollup.objects.filter(frequency=frequency))
+        for frequency in ('weekly', 'monthly', 'yearly')
+    ]
+    for name, rows in tables:
+        versions = list(rows.values_list('version', flat=True).distinct()[:2])
+        if len(versions) == 1:
+            BuiltVersion.objects.create(name=name, version=versions[0])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0007_exportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BuiltVersion',
+            fields=[
+                ('name', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('version', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.RunPython(record_built_versions, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='weatherprefixsum',
+            name='version',
+        ),
+        migrations.RemoveField(
+            model_name='weatherrollup',
+            name='version',
+        ),
+    ]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.10 on 2026-10-17 05:39
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def forget_prefix_sums(apps, schema_editor):
+    """Marks the running totals as not built, the summaries being read from the daily weather until the next load"""
+    apps.get_model('weather', 'BuiltVersion').objects.filter(name='prefix_sums').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0008_builtversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeatherExtreme',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('temp_format', models.CharField(max_length=10)),
+                ('level', models.PositiveSmallIntegerField()),
+                ('block', models.IntegerField()),
+                ('tmax_min', models.IntegerField(null=True)),
+                ('tmax_max', models.IntegerField(null=True)),
+                ('tmin_min', models.IntegerField(null=True)),
+                ('tmin_max', models.IntegerField(null=True)),
+                ('city', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='extremes', to='weather.Location')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='weatherextreme',
+            unique_together=set([('city', 'temp_format', 'level', 'block')]),
+        ),
+        migrations.RunPython(forget_prefix_sums, migrations.RunPython.noop),
+    ]
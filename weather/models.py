@@ -4,16 +4,30 @@ from django.db import models
 
 class WeatherDetail(models.Model):
     """Object for storing the daily weather data."""
-    city = models.ForeignKey('Location', related_name='city_name')
+    city = models.ForeignKey('Location', related_name='city_name', db_index=False)
     date = models.DateField()
     tmax = models.IntegerField(null=True)
     tmin = models.IntegerField(null=True)
 
+    class Meta:
+        unique_together = ('city', 'date')
+        indexes = [
+            # Covers the city and date range lookups ordered by date without reading the table.
+            models.Index(fields=['city', 'date', 'tmax', 'tmin'], name='weather_city_date_temps_idx'),
+            # Covers the lookups of every city on a date or short date range.
+            models.Index(fields=['date', 'city', 'tmax', 'tmin'], name='weather_date_city_temps_idx'),
+        ]
+
     @staticmethod
     def convert_fahrenheit_to_celsius(value):
         """converts fahrenheit to celsius"""
         return round((value - 32) * (5/9))
 
+    @classmethod
+    def convert_column_to_celsius(cls, values):
+        """converts a sequence of fahrenheit values to celsius, keeping the missing values"""
+        return [None if value is None else cls.convert_fahrenheit_to_celsius(value) for value in values]
+
     @property
     def tmin_in_celsius(self):
         """returns the tmin in celsius format"""
@@ -35,3 +49,86 @@ class Location(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class WeatherRollup(models.Model):
+    """Object storing the weekly, monthly or yearly temperature totals of a city, built from the daily weather."""
+    city = models.ForeignKey('Location', related_name='rollups')
+    frequency = models.CharField(max_length=10)
+    temp_format = models.CharField(max_length=10)
+    start_date = models.DateField()
+    tmax_total = models.IntegerField()
+    tmin_total = models.IntegerField()
+    tmax_days = models.IntegerField()
+    tmin_days = models.IntegerField()
+
+    class Meta:
+        unique_together = ('city', 'frequency', 'temp_format', 'start_date')
+
+
+class WeatherPrefixSum(models.Model):
+    """
+    Object storing the running temperature totals of a city up to and including a day, built from the daily weather.
+    The totals of any date range are the difference of two of these rows.
+    """
+    city = models.ForeignKey('Location', related_name='prefix_sums')
+    temp_format = models.CharField(max_length=10)
+    date = models.DateField()
+    tmax_total = models.IntegerField()
+    tmin_total = models.IntegerField()
+    tmax_days = models.IntegerField()
+    tmin_days = models.IntegerField()
+
+    class Meta:
+        unique_together = ('city', 'temp_format', 'date')
+
+
+class WeatherExtreme(models.Model):
+    """
+    Object storing the lowest and highest temperatures of a city over a block of 2 ** level days, numbered from the
+    date ordinal, built from the daily weather. The extremes of any date range come from at most two blocks a level.
+    """
+    city = models.ForeignKey('Location', related_name='extremes')
+    temp_format = models.CharField(max_length=10)
+    level = models.PositiveSmallIntegerField()
+    block = models.IntegerField()
+    tmax_min = models.IntegerField(null=True)
+    tmax_max = models.IntegerField(null=True)
+    tmin_min = models.IntegerField(null=True)
+    tmin_max = models.IntegerField(null=True)
+
+    class Meta:
+        unique_together = ('city', 'temp_format', 'level', 'block')
+
+
+class BuiltVersion(models.Model):
+    """
+    Object recording the dataset version a table built from the daily weather is current for, one row per table.
+    A load only rewrites the changed rows of the built tables and moves this marker.
+    """
+    name = models.CharField(max_length=40, primary_key=True)
+    version = models.PositiveIntegerField()
+
+
+class ExportJob(models.Model):
+    """Object tracking an export of the daily weather to a compressed file, run by the export worker pool."""
+    PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+    STATUS_CHOICES = ((PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed'))
+
+    query_key = models.CharField(max_length=40)
+    query = models.TextField()
+    format = models.CharField(max_length=10)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    version = models.PositiveIntegerField()
+    rows = models.PositiveIntegerField(null=True)
+    size = models.BigIntegerField(null=True)
+    path = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            # Finds the finished export of an identical query for the current dataset version.
+            models.Index(fields=['query_key', 'version'], name='weather_export_query_idx'),
+        ]
@@ -0,0 +1,174 @@
+"""Keyset (cursor) pagination for the weather API."""
+
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework import exceptions, filters, response
+from rest_framework.compat import coreapi, coreschema
+from rest_framework.pagination import BasePagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward only cursor pagination on the first ordering field, with the primary key breaking ties.
+    Each page seeks past the last row of the previous page instead of using an OFFSET, so deep pages cost the same as
+    the first one. Pages are only returned when the client asks for them with the page_size query param.
+    """
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    max_page_size = 10000
+    key_fields = ()
+
+    def __init__(self):
+        self.page_size = self.key_field = self.next_key = self.base_url = None
+
+    def get_page_size(self, request):
+        """
+        Reads the page size requested by the client.
+        :param request: HttpRequest object from the client.
+        :return: Page size, None when the client did not ask for pages.
+        :exception: ValidationError if the page size is not a positive number.
+        """
+        if self.page_size_query_param not in request.query_params:
+            return None
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except ValueError:
+            page_size = 0
+        if page_size < 1:
+            raise exceptions.ValidationError({self.page_size_query_param: 'Expected a positive number.'})
+        return min(page_size, self.max_page_size)
+
+    def get_key_ordering(self, request, queryset, view):
+        """
+        Finds the field the pages are keyed on from the ordering requested.
+        :return: Tuple of the field name and True for a descending ordering.
+        :exception: ValidationError if the field can not be used as a key.
+        """
+        ordering = filters.OrderingFilter().get_ordering(request, queryset, view) or [self.key_fields[0]]
+        field = ordering[0].lstrip('-')
+        if field not in self.key_fields:
+            raise exceptions.ValidationError(
+                {'ordering': 'Pages can only be ordered by {}.'.format(', '.join(self.key_fields))}
+            )
+        return field, ordering[0].startswith('-')
+
+    def decode_cursor(self, request, field, pk_field):
+        """
+        Reads the key of the last row of the previous page from the cursor query param.
+        :param request: HttpRequest object from the client.
+        :param field: Model field the pages are keyed on.
+        :param pk_field: Primary key field of the model.
+        :return: Tuple of the key field value and primary key, None for the first page.
+        :exception: ValidationError if the cursor is not one given by this API.
+        """
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            key = json.loads(urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+            if not isinstance(key, list) or len(key) != 2:
+                raise ValueError('Expected a list of two values.')
+            value, pk = field.to_python(key[0]), pk_field.to_python(key[1])
+            if value is None or pk is None:
+                raise ValueError('Expected values for the key.')
+        except (TypeError, ValueError, UnicodeError, DjangoValidationError):
+            raise exceptions.ValidationError({self.cursor_query_param: 'Invalid cursor.'})
+        return value, pk
+
+    @staticmethod
+    def encode_cursor(key):
+        """Encodes the key of the last row of a page as a cursor"""
+        return urlsafe_b64encode(json.dumps(key, default=str).encode('utf-8')).decode('ascii')
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """
+        Restricts the queryset to the rows of the requested page plus one, to find out if a next page exists.
+        :param queryset: Filtered queryset.
+        :param request: HttpRequest object from the client.
+        :param view: View being paginated.
+        :return: Sliced queryset, None when the client did not ask for pages.
+        """
+        self.page_size = self.get_page_size(request)
+        if self.page_size is None:
+            return None
+        self.base_url = request.build_absolute_uri()
+        field, descending = self.get_key_ordering(request, queryset, view)
+        pk_name = queryset.model._meta.pk.name
+        self.key_field, self.next_key = field, None
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(*OrderedDict.fromkeys(prefix + name for name in (field, pk_name)))
+
+        cursor = self.decode_cursor(request, queryset.model._meta.get_field(field), queryset.model._meta.pk)
+        if cursor is not None:
+            value, pk = cursor
+            after, from_value = ('lt', 'lte') if descending else ('gt', 'gte')
+            if field == pk_name:
+                queryset = queryset.filter(**{'pk__' + after: pk})
+            else:
+                # The redundant range on the key field lets the database seek the index to the start of the page.
+                queryset = queryset.filter(
+                    Q(**{'{}__{}'.format(field, after): value}) | Q(**{field: value, 'pk__' + after: pk}),
+                    **{'{}__{}'.format(field, from_value): value}
+                )
+        return queryset[:self.page_size + 1]
+
+    def paginate_rows(self, rows, get_value):
+        """
+        Trims the rows to the page and keeps the key of its last row for the next page.
+        :param rows: List of the rows returned by the page queryset.
+        :param get_value: Function of a row and a field name returning the value of the field.
+        :return: List of the rows of the page.
+        """
+        rows = list(rows)
+        if len(rows) > self.page_size:
+            rows = rows[:self.page_size]
+            self.next_key = [get_value(rows[-1], self.key_field), get_value(rows[-1], 'pk')]
+        return rows
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Returns the model instances of the requested page, None when the client did not ask for pages"""
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        return self.paginate_rows(page_queryset, getattr)
+
+    def get_next_link(self):
+        """Returns the URL of the next page, None on the last page"""
+        if self.next_key is None:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(self.next_key))
+
+    def get_paginated_response(self, data):
+        """Returns the page with the link to the next one"""
+        return response.Response(OrderedDict([('next', self.get_next_link()), ('results', data)]))
+
+    def get_schema_fields(self, view):
+        """Returns the query params of the pagination for the API documentation"""
+        assert coreapi is not None, 'coreapi must be installed to use `get_schema_fields()`'
+        assert coreschema is not None, 'coreschema must be installed to use `get_schema_fields()`'
+        return [
+            coreapi.Field(
+                name=self.page_size_query_param, required=False, location='query', schema=coreschema.Integer(
+                    title='Page size', description='Number of results per page, not paged if absent'
+                )
+            ),
+            coreapi.Field(
+                name=self.cursor_query_param, required=False, location='query',
+                schema=coreschema.String(title='Cursor', description='Cursor of the page, given by the next link')
+            ),
+        ]
+
+
+class WeatherDetailPagination(KeysetPagination):
+    """Pages of the daily weather keyed on (date, id)"""
+    key_fields = ('date', 'id')
+
+
+class LocationPagination(KeysetPagination):
+    """Pages of the cities keyed on name, or another ordering field"""
+    key_fields = ('name', 'station', 'latitude', 'longitude', 'elevation')
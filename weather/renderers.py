@@ -0,0 +1,183 @@
+"""Renderers writing the weather responses a chunk of rows at a time."""
+
+import csv
+import io
+import json
+import tempfile
+from functools import partial
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class StreamingJSONRenderer(JSONRenderer):
+    """JSON renderer that can also write a list given in chunks, giving the same bytes as rendering the whole list."""
+
+    def stream(self, chunks):
+        """
+        Renders the chunks as the elements of a single JSON array.
+        :param chunks: Iterable of lists of serializable rows.
+        :return: Generator of bytes.
+        """
+        yield b'['
+        separator = b''
+        for chunk in chunks:
+            if chunk:
+                yield separator + self.render(chunk)[1:-1]
+                separator = b','
+        yield b']'
+
+
+class ColumnarRenderer(BaseRenderer):
+    """
+    Base of the renderers writing a list of rows as columns, with each field name written once instead of once a row.
+    The columns can be streamed from chunks of row values without building a map per row. Responses that are not a
+    list of rows, such as errors, are rendered as JSON.
+    """
+    # Directory of the temporary files the columns are spooled to, None for the default one.
+    spool_dir = None
+    spool_read_size = 64 * 1024
+
+    @staticmethod
+    def get_rows(data, renderer_context):
+        """
+        Finds the rows of the response, moving the link to the next page of a paged response to a Link header.
+        :return: List of maps of the rows, None when the response is not a list of rows.
+        """
+        response = (renderer_context or {}).get('response')
+        if isinstance(data, dict) and 'results' in data:
+            if data.get('next') and response is not None:
+                response['Link'] = '<{}>; rel="next"'.format(data['next'])
+            data = data['results']
+        if isinstance(data, list) and all(isinstance(row, dict) for row in data):
+            return data
+        return None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """Renders a list of rows as columns, and any other response as JSON"""
+        rows = self.get_rows(data, renderer_context)
+        if rows is None:
+            response = (renderer_context or {}).get('response')
+            if response is not None:
+                response['Content-Type'] = 'application/json'
+            return JSONRenderer().render(data, accepted_media_type, renderer_context)
+        fields = list(rows[0]) if rows else []
+        return b''.join(self.stream_columns(fields, [[[row[field] for field in fields] for row in rows]]))
+
+    def stream_columns(self, fields, chunks):
+        """
+        Renders the rows given in chunks.
+        :param fields: List of the field names.
+        :param chunks: Iterable of lists of rows, each row being a list of values in the order of the fields.
+        :return: Generator of bytes.
+        """
+        raise NotImplementedError('stream_columns() must be implemented.')
+
+    def spool_columns(self, fields, chunks, encode, separator=b''):
+        """
+        Writes the values of the rows given in chunks to one temporary file per field, reading the rows once, so the
+        memory use does not grow with the number of rows.
+        :param fields: List of the field names.
+        :param chunks: Iterable of lists of rows, each row being a list of values in the order of the fields.
+        :param encode: Function of a tuple of values of a column returning their bytes.
+        :param separator: Bytes written between the values of two chunks.
+        :return: Tuple of the list of temporary files, at their start, and the number of rows.
+        """
+        spools, rows = [tempfile.TemporaryFile(dir=self.spool_dir) for _ in fields], 0
+        try:
+            for chunk in chunks:
+                rows += len(chunk)
+                for spool, values in zip(spools, zip(*chunk)):
+                    spool.write((separator if spool.tell() else b'') + encode(values))
+        except BaseException:
+            for spool in spools:
+                spool.close()
+            raise
+        for spool in spools:
+            spool.seek(0)
+        return spools, rows
+
+    def read_spool(self, spool):
+        """Reads a spooled column a block at a time"""
+        return iter(partial(spool.read, self.spool_read_size), b'')
+
+
+class ColumnarJSONRenderer(ColumnarRenderer):
+    """Writes a list of rows as a JSON object of parallel arrays, e.g {"date": [...], "tmax": [...], "tmin": [...]}"""
+    media_type = 'application/vnd.weather.columns+json'
+    format = 'columns'
+    charset = None
+
+    def stream_columns(self, fields, chunks):
+        """Renders the columns one after the other, once every row was read and spooled"""
+        spools, _ = self.spool_columns(fields, chunks, self.encode_values, separator=b',')
+        try:
+            yield b'{'
+            for position, (field, spool) in enumerate(zip(fields, spools)):
+                yield '{}{}:['.format(',' if position else '', json.dumps(field)).encode('utf-8')
+                for content in self.read_spool(spool):
+                    yield content
+                yield b']'
+            yield b'}'
+        finally:
+            for spool in spools:
+                spool.close()
+
+    @staticmethod
+    def encode_values(values):
+        """Encodes the values of a column as the elements of a JSON array"""
+        return json.dumps(values, separators=(',', ':'), ensure_ascii=False)[1:-1].encode('utf-8')
+
+
+class CSVRenderer(ColumnarRenderer):
+    """Writes a list of rows as CSV with a header line, streaming each chunk of rows as it is read"""
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def stream_columns(self, fields, chunks):
+        """Renders the header line followed by the lines of each chunk"""
+        output = io.StringIO()
+        writer = csv.writer(output, lineterminator='\n')
+        writer.writerow(fields)
+        for chunk in chunks:
+            writer.writerows(chunk)
+            yield output.getvalue().encode('utf-8')
+            output.seek(0)
+            output.truncate()
+        if output.tell():
+            yield output.getvalue().encode('utf-8')
+
+
+class MsgpackRenderer(ColumnarRenderer):
+    """Writes a list of rows as a msgpack map of field name to array of values, needs the msgpack package"""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def stream_columns(self, fields, chunks):
+        """Renders the map header followed by each column, the values being packed and spooled as the rows are read"""
+        packer = msgpack.Packer()
+        spools, rows = self.spool_columns(fields, chunks, lambda values: b''.join(map(packer.pack, values)))
+        try:
+            yield packer.pack_map_header(len(fields))
+            for field, spool in zip(fields, spools):
+                yield packer.pack(field) + packer.pack_array_header(rows)
+                for content in self.read_spool(spool):
+                    yield content
+        finally:
+            for spool in spools:
+                spool.close()
+
+
+def get_weather_renderers():
+    """Returns the renderer classes of the weather list, msgpack being offered only when it is installed"""
+    renderers = [JSONRenderer, ColumnarJSONRenderer, CSVRenderer]
+    if msgpack is not None:
+        renderers.append(MsgpackRenderer)
+    return renderers
@@ -0,0 +1,144 @@
+"""Precomputed weekly, monthly and yearly totals of the daily weather."""
+
+from collections import OrderedDict
+from datetime import timedelta
+from itertools import islice
+
+from django.db import transaction
+
+from . import aggregation, dataset, models
+
+BATCH_SIZE = 5000
+
+
+def get_period_start(date_object, frequency):
+    """
+    Given a date returns the start of its week, month or year.
+    :param date_object: Date object.
+    :param frequency: weekly, monthly or yearly.
+    :return: Date of the monday of the week or of the first day of the month or year.
+    """
+    if frequency == 'weekly':
+        return date_object - timedelta(days=date_object.weekday())
+    if frequency == 'yearly':
+        return date_object.replace(month=1, day=1)
+    return date_object.replace(day=1)
+
+
+def get_next_period_start(date_object, frequency):
+    """
+    Given the start of a week, month or year returns the start of the following one.
+    :param date_object: Date object at the start of a period.
+    :param frequency: weekly, monthly or yearly.
+    :return: Date of the next monday or of the first day of the next month or year.
+    """
+    if frequency == 'weekly':
+        return date_object + timedelta(days=7)
+    if frequency == 'yearly':
+        return date_object.replace(year=date_object.year + 1)
+    return (date_object + timedelta(days=32)).replace(day=1)
+
+
+def get_built_name(frequency):
+    """Returns the name the rollups of a frequency are recorded under in the built versions"""
+    return 'rollups:{}'.format(frequency)
+
+
+def build_rollups(version, since=None):
+    """
+    Rebuilds the weekly, monthly and yearly totals from the daily weather.
+    :param version: Dataset version the rollups are built for.
+    :param since: Map of city name to the first changed date, to rebuild only the periods of those cities from that
+    date onwards. None, or rollups not current for the previous version, to rebuild every city.
+    :return: Number of rollup rows created.
+    """
+    created = 0
+    with transaction.atomic():
+        if since is not None and not rollups_are_current(version - 1):
+            since = None
+        if since is None:
+            models.WeatherRollup.objects.all().delete()
+            for frequency in aggregation.PERIOD_FUNCTIONS:
+                created += create_rollups(models.WeatherDetail.objects.all(), frequency)
+        for city, first_date in (since or {}).items():
+            for frequency in aggregation.PERIOD_FUNCTIONS:
+                start_date = get_period_start(first_date, frequency)
+                models.WeatherRollup.objects.filter(
+                    city=city, frequency=frequency, start_date__gte=start_date
+                ).delete()
+                daily = models.WeatherDetail.objects.filter(city=city, date__gte=start_date)
+                created += create_rollups(daily, frequency)
+        dataset.set_built_version([get_built_name(frequency) for frequency in aggregation.PERIOD_FUNCTIONS], version)
+    return created
+
+
+def create_rollups(daily, frequency):
+    """
+    Creates the rollups of the daily weather for both temperature formats.
+    :param daily: Queryset of WeatherDetail objects to roll up.
+    :param frequency: weekly, monthly or yearly.
+    :return: Number of rollup rows created.
+    """
+    created = 0
+    for temp_format in aggregation.TEMP_FORMATS:
+        rows = aggregation.aggregate_totals(daily, frequency, temp_format, group_by=('city',)).iterator()
+        new_rollups = (
+            models.WeatherRollup(
+                city_id=row['city'], frequency=frequency, temp_format=temp_format, start_date=row['period'],
+                tmax_total=row['tmax_total'] or 0, tmin_total=row['tmin_total'] or 0,
+                tmax_days=row['tmax_days'], tmin_days=row['tmin_days']
+            ) for row in rows
+        )
+        batch = list(islice(new_rollups, BATCH_SIZE))
+        while batch:
+            created += len(models.WeatherRollup.objects.bulk_create(batch))
+            batch = list(islice(new_rollups, BATCH_SIZE))
+    return created
+
+
+def rollups_are_current(version, frequency=None):
+    """
+    Checks whether the rollups were built for the given dataset version.
+    :param version: Current dataset version.
+    :param frequency: Frequency the rollups are needed for, None for every frequency.
+    :return: True if the rollups can answer requests, False when missing or stale.
+    """
+    frequencies = [frequency] if frequency else aggregation.PERIOD_FUNCTIONS
+    return dataset.is_built_for([get_built_name(frequency) for frequency in frequencies], version)
+
+
+def get_totals_by_period(queryset, city, frequency, temp_format, start_date=None, end_date=None, descending=False):
+    """
+    Computes the total min and max temperatures for each week, month or year, reading the periods fully inside the date
+    range from the rollups and the partial periods at the edges of the range from the daily weather.
+    :param queryset: Queryset of WeatherDetail objects filtered on the city and date range.
+    :param city: City name.
+    :param frequency: weekly, monthly or yearly.
+    :param temp_format: fahrenheit or celsius.
+    :param start_date: First day of the range, None for no lower bound.
+    :param end_date: Last day of the range, None for no upper bound.
+    :param descending: True to return the latest period first.
+    :return: Ordered map of start_date as key and (total_tmax, total_tmin, days_tmax, days_tmin) as value.
+    """
+    first_full = start_date and get_next_period_start(
+        get_period_start(start_date - timedelta(days=1), frequency), frequency
+    )
+    after_full = end_date and get_period_start(end_date + timedelta(days=1), frequency)
+    if first_full and after_full and first_full >= after_full:
+        return aggregation.get_totals_by_period(queryset, frequency, temp_format, descending)
+
+    rollups = models.WeatherRollup.objects.filter(city=city, frequency=frequency, temp_format=temp_format)
+    if first_full:
+        rollups = rollups.filter(start_date__gte=first_full)
+    if after_full:
+        rollups = rollups.filter(start_date__lt=after_full)
+    totals = {
+        row[0].strftime('%Y-%m-%d'): row[1:]
+        for row in rollups.values_list('start_date', 'tmax_total', 'tmin_total', 'tmax_days', 'tmin_days')
+    }
+
+    if first_full and start_date < first_full:
+        totals.update(aggregation.get_totals_by_period(queryset.filter(date__lt=first_full), frequency, temp_format))
+    if after_full and after_full <= end_date:
+        totals.update(aggregation.get_totals_by_period(queryset.filter(date__gte=after_full), frequency, temp_format))
+    return OrderedDict(sorted(totals.items(), reverse=descending))
@@ -0,0 +1,63 @@
+"""
+API documentation views. The Swagger stack is only imported when the documentation is first requested, and in lean
+mode the OpenAPI schema is served from the file written by build_schema.
+"""
+
+import threading
+from importlib import import_module
+
+from django.conf import settings
+from django.http import HttpResponse
+
+SCHEMA_TITLE = 'Weather API documentation'
+
+_swagger_view = None
+_schema_content = None
+_schema_lock = threading.Lock()
+
+
+def get_documented_patterns():
+    """Returns the URL patterns shown in the documentation, urls_documented of the root URLconf"""
+    return import_module(settings.ROOT_URLCONF).urls_documented
+
+
+def get_swagger_view():
+    """Returns the Swagger UI view, built on its first use"""
+    global _swagger_view
+    with _schema_lock:
+        if _swagger_view is None:
+            from rest_framework_swagger.views import get_swagger_view as build_swagger_view
+            _swagger_view = build_swagger_view(title=SCHEMA_TITLE, patterns=get_documented_patterns())
+    return _swagger_view
+
+
+def render_schema():
+    """
+    Generates the OpenAPI schema of every documented end point, without a request so it can be written at build time.
+    :return: Bytes of the OpenAPI JSON document, with no host so that it is valid wherever it is served.
+    """
+    from rest_framework.schemas import SchemaGenerator
+    from rest_framework_swagger.renderers import OpenAPICodec
+    generator = SchemaGenerator(title=SCHEMA_TITLE, url='/', patterns=get_documented_patterns())
+    return OpenAPICodec().encode(generator.get_schema(request=None, public=True))
+
+
+def get_schema_content():
+    """Returns the schema written by build_schema, generated once in memory when the file is missing"""
+    global _schema_content
+    with _schema_lock:
+        if _schema_content is None or _schema_content[0] != settings.WEATHER_SCHEMA_FILE:
+            try:
+                with open(settings.WEATHER_SCHEMA_FILE, 'rb') as schema_file:
+                    content = schema_file.read()
+            except IOError:
+                content = render_schema()
+            _schema_content = (settings.WEATHER_SCHEMA_FILE, content)
+    return _schema_content[1]
+
+
+def schema_view(request, *args, **kwargs):
+    """Serves the prebuilt OpenAPI schema in lean mode, and the Swagger UI otherwise"""
+    if settings.WEATHER_LEAN:
+        return HttpResponse(get_schema_content(), content_type='application/openapi+json')
+    return get_swagger_view()(request, *args, **kwargs)
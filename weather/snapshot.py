@@ -0,0 +1,223 @@
+"""
+Binary columnar snapshot of the daily weather, memory mapped read only so that every worker process shares the pages.
+
+Layout, little endian, each section starting on an 8 byte boundary:
+    header      magic, dataset version, city count, row count, index length
+    index       JSON list of the city names, in the order of their rows
+    offsets     int64 array of city count + 1 row positions, the rows of city i are offsets[i]:offsets[i + 1]
+    ids         int32 array of WeatherDetail ids
+    days        int32 array of dates as days since 1970-01-01, sorted within a city
+    tmax, tmin  int16 arrays of temperatures in fahrenheit, MISSING where missing
+"""
+
+import json
+import mmap
+import os
+import struct
+import threading
+
+from django.conf import settings
+
+from . import models
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MAGIC = b'WTHRSNP1'
+HEADER = struct.Struct('<8sQIII')
+ALIGNMENT = 8
+MISSING = -32768
+# Range of each column, the temperatures leaving out the MISSING marker.
+COLUMN_RANGES = {'ids': (-2 ** 31, 2 ** 31 - 1), 'days': (-2 ** 31, 2 ** 31 - 1), 'tmax': (MISSING + 1, 2 ** 15 - 1),
+                 'tmin': (MISSING + 1, 2 ** 15 - 1)}
+CHUNK_SIZE = 50000
+
+
+def get_layout(city_count, row_count, index_length):
+    """
+    Computes the byte offset of each section of a snapshot file.
+    :return: List of (name, offset, dtype, length) of the arrays, the last one being the end of the file.
+    """
+    position, layout = HEADER.size + index_length, []
+    for name, dtype, length in (('offsets', '<i8', city_count + 1), ('ids', '<i4', row_count),
+                                ('days', '<i4', row_count), ('tmax', '<i2', row_count), ('tmin', '<i2', row_count)):
+        position += -position % ALIGNMENT
+        layout.append((name, position, dtype, length))
+        position += np.dtype(dtype).itemsize * length
+    layout.append(('end', position, None, 0))
+    return layout
+
+
+def read_columns():
+    """
+    Reads the daily weather of every city from the DB a chunk at a time.
+    :return: Tuple of the list of city names and the offsets, ids, days, tmax and tmin arrays.
+    """
+    rows = models.WeatherDetail.objects.order_by('city', 'date').values_list('city', 'id', 'date', 'tmax', 'tmin')
+    cities, counts, chunks, chunk = [], [], [], []
+    for row in rows.iterator():
+        if not cities or cities[-1] != row[0]:
+            cities.append(row[0])
+            counts.append(0)
+        counts[-1] += 1
+        chunk.append(row[1:])
+        if len(chunk) == CHUNK_SIZE:
+            chunks.append(to_arrays(chunk))
+            chunk = []
+    chunks.append(to_arrays(chunk))
+    offsets = np.concatenate(([0], np.cumsum(counts, dtype=np.int64))).astype(np.int64)
+    return (cities, offsets) + tuple(np.concatenate(column) for column in zip(*chunks))
+
+
+def to_arrays(rows):
+    """
+    Converts (id, date, tmax, tmin) rows to the id, day, tmax and tmin arrays of the snapshot.
+    :exception: ValueError if a value does not fit the type of its column.
+    """
+    ids, dates, tmax, tmin = zip(*rows) if rows else ((), (), (), ())
+    columns = (
+        ('ids', np.array(ids, dtype=np.int64), np.int32),
+        ('days', np.array(dates, dtype='datetime64[D]').astype(np.int64), np.int32),
+        ('tmax', np.array([value for value in tmax if value is not None], dtype=np.int64), np.int16),
+        ('tmin', np.array([value for value in tmin if value is not None], dtype=np.int64), np.int16),
+    )
+    for name, values, _ in columns:
+        low, high = COLUMN_RANGES[name]
+        if len(values) and (values.min() < low or values.max() > high):
+            raise ValueError('{} values outside {}..{} do not fit the snapshot'.format(name, low, high))
+    return (
+        columns[0][1].astype(np.int32),
+        columns[1][1].astype(np.int32),
+        np.array([MISSING if value is None else value for value in tmax], dtype=np.int16),
+        np.array([MISSING if value is None else value for value in tmin], dtype=np.int16),
+    )
+
+
+def write_snapshot(path, version):
+    """
+    Writes a snapshot of the DB, replacing the file atomically so that readers see the old or new file only.
+    :param path: Path of the snapshot file.
+    :param version: Dataset version the snapshot is taken for.
+    :return: Number of rows written.
+    :exception: ValueError if a value does not fit the type of its column, the file being left as it was.
+    """
+    cities, *columns = read_columns()
+    index = json.dumps(cities).encode('utf-8')
+    layout = get_layout(len(cities), len(columns[1]), len(index))
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temp_path, 'wb') as snapshot_file:
+        snapshot_file.write(HEADER.pack(MAGIC, version, len(cities), len(columns[1]), len(index)))
+        snapshot_file.write(index)
+        for (_, offset, dtype, _), column in zip(layout, columns):
+            snapshot_file.write(b'\0' * (offset - snapshot_file.tell()))
+            snapshot_file.write(column.astype(dtype).tobytes())
+    os.replace(temp_path, path)
+    return len(columns[1])
+
+
+def read_header(path):
+    """
+    Reads the header of a snapshot file without mapping it.
+    :param path: Path of the snapshot file.
+    :return: Tuple of the dataset version, city count, row count and index length.
+    :exception: ValueError if the file is not a snapshot.
+    """
+    with open(path, 'rb') as snapshot_file:
+        magic, *header = HEADER.unpack(snapshot_file.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError('{} is not a weather snapshot'.format(path))
+    return tuple(header)
+
+
+class Snapshot(object):
+    """Read only memory map of a snapshot file"""
+
+    def __init__(self, path):
+        """
+        :param path: Path of the snapshot file.
+        :exception: ValueError if the file is not a snapshot.
+        """
+        self.path = path
+        with open(path, 'rb') as snapshot_file:
+            self.mapping = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, self.version, city_count, row_count, index_length = HEADER.unpack(self.mapping[:HEADER.size])
+            if magic != MAGIC:
+                raise ValueError('{} is not a weather snapshot'.format(path))
+            index = self.mapping[HEADER.size:HEADER.size + index_length].decode('utf-8')
+            self.cities = {city: position for position, city in enumerate(json.loads(index))}
+            for name, offset, dtype, length in get_layout(city_count, row_count, index_length)[:-1]:
+                setattr(self, name, np.frombuffer(self.mapping, dtype=dtype, count=length, offset=offset))
+        except (ValueError, struct.error):
+            self.close()
+            raise
+
+    def close(self):
+        """Unmaps a snapshot no request has read from, its arrays being dropped"""
+        for name in ('offsets', 'ids', 'days', 'tmax', 'tmin'):
+            self.__dict__.pop(name, None)
+        self.mapping.close()
+
+    def get_columns(self, city):
+        """
+        Returns the rows of a city, as views on the mapped pages.
+        :param city: City name.
+        :return: Tuple of the ids, days, tmax and tmin arrays, empty for an unknown city.
+        """
+        position = self.cities.get(city)
+        rows = slice(0, 0) if position is None else slice(self.offsets[position], self.offsets[position + 1])
+        return self.ids[rows], self.days[rows], self.tmax[rows], self.tmin[rows]
+
+
+_snapshot = None
+# Path, dataset version and file identity of the last lookup that found no usable snapshot.
+_missing_key = None
+_snapshot_lock = threading.Lock()
+
+
+def get_file_key(path, version):
+    """
+    Identifies a snapshot file and the dataset version it is looked up for, a file replaced by load_data or
+    build_snapshot giving another key.
+    :return: Tuple of the path, version, and inode, modification time and size of the file, None for a missing file.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return path, version, None
+    return path, version, (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def get_snapshot(version):
+    """
+    Returns the mapped snapshot of a dataset version, mapping the snapshot file again when load_data replaced it.
+    A missing file or a file of another version is remembered, and only looked at again once it changes. The
+    snapshot replaced is unmapped by the release of its last array, requests may still be reading from it.
+    :param version: Current dataset version.
+    :return: Snapshot object, None when there is no snapshot for this version.
+    """
+    global _snapshot, _missing_key
+    snapshot, path = _snapshot, settings.WEATHER_SNAPSHOT_FILE
+    if snapshot is not None and snapshot.version == version and snapshot.path == path:
+        return snapshot
+    key = get_file_key(path, version)
+    if key == _missing_key:
+        return None
+    with _snapshot_lock:
+        snapshot = None
+        try:
+            if read_header(path)[0] == version:
+                snapshot = Snapshot(path)
+        except (IOError, ValueError, struct.error):
+            pass
+        if snapshot is not None and snapshot.version != version:
+            # Replaced by a snapshot of another version between reading the header and mapping the file.
+            snapshot.close()
+            snapshot = None
+        if snapshot is None:
+            _missing_key = key
+            return None
+        _snapshot, _missing_key = snapshot, None
+    return snapshot
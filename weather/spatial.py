@@ -0,0 +1,152 @@
+"""In-memory spatial index of the cities, answering nearest station and radius queries on the sphere."""
+
+import heapq
+import math
+import threading
+
+from django.db import connections, router
+
+from . import dataset, models
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_unit_vector(latitude, longitude):
+    """
+    Converts a position on the sphere to a point in 3D space, so that the straight line (chord) distance between two
+    points orders them the same as the great circle distance, with no special case at the poles or the antimeridian.
+    :param latitude: Latitude in degrees.
+    :param longitude: Longitude in degrees.
+    :return: Tuple of x, y and z on the unit sphere.
+    """
+    latitude, longitude = math.radians(float(latitude)), math.radians(float(longitude))
+    return (math.cos(latitude) * math.cos(longitude), math.cos(latitude) * math.sin(longitude), math.sin(latitude))
+
+
+def chord_to_km(chord):
+    """Converts a chord length on the unit sphere to a great circle distance in km"""
+    return 2 * EARTH_RADIUS_KM * math.asin(min(chord / 2, 1.0))
+
+
+def km_to_chord(distance):
+    """Converts a great circle distance in km to a chord length on the unit sphere"""
+    return 2 * math.sin(min(distance / EARTH_RADIUS_KM, math.pi) / 2)
+
+
+class KDTree(object):
+    """k-d tree over 3D points, splitting on x, y and z in turn at the median point."""
+
+    def __init__(self, points):
+        """
+        :param points: List of (x, y, z) tuples.
+        """
+        self.points = points
+        self.root = self.build(list(range(len(points))), 0)
+
+    def build(self, indexes, depth):
+        """
+        Builds the subtree of a set of points.
+        :return: Tuple of (point index, split axis, left subtree, right subtree), None for no points.
+        """
+        if not indexes:
+            return None
+        axis = depth % 3
+        indexes.sort(key=lambda index: self.points[index][axis])
+        middle = len(indexes) // 2
+        return (
+            indexes[middle], axis, self.build(indexes[:middle], depth + 1), self.build(indexes[middle + 1:], depth + 1)
+        )
+
+    def search(self, point, k=None, max_distance=None):
+        """
+        Finds the points closest to a point, skipping the subtrees that can not hold a closer point.
+        :param point: Tuple of x, y and z.
+        :param k: Maximum number of points, None for no limit.
+        :param max_distance: Maximum distance of the points, None for no limit.
+        :return: List of (distance, point index) sorted by distance.
+        """
+        bound = math.inf if max_distance is None else max_distance ** 2
+        found = []  # Max heap of (-squared distance, -index) holding the closest points so far.
+
+        def get_bound():
+            return -found[0][0] if k is not None and len(found) == k else bound
+
+        def visit(node):
+            if node is None:
+                return
+            index, axis, left, right = node
+            other = self.points[index]
+            distance = (point[0] - other[0]) ** 2 + (point[1] - other[1]) ** 2 + (point[2] - other[2]) ** 2
+            if distance <= get_bound():
+                heapq.heappush(found, (-distance, -index))
+                if k is not None and len(found) > k:
+                    heapq.heappop(found)
+            offset = point[axis] - other[axis]
+            visit(left if offset < 0 else right)
+            if offset ** 2 <= get_bound():
+                visit(right if offset < 0 else left)
+
+        if k != 0:
+            visit(self.root)
+        return sorted((math.sqrt(-distance), -index) for distance, index in found)
+
+
+class LocationIndex(object):
+    """Spatial index of the cities, with the serialized city kept next to each point."""
+
+    def __init__(self, locations):
+        """
+        :param locations: List of maps of the city fields, holding its latitude and longitude.
+        """
+        self.locations = locations
+        self.tree = KDTree([to_unit_vector(location['latitude'], location['longitude']) for location in locations])
+
+    def search(self, latitude, longitude, k=None, radius=None):
+        """
+        Finds the cities closest to a position.
+        :param latitude: Latitude in degrees.
+        :param longitude: Longitude in degrees.
+        :param k: Maximum number of cities, None for no limit.
+        :param radius: Maximum distance in km, None for no limit.
+        :return: List of (distance in km, map of the city fields) sorted by distance.
+        """
+        max_distance = None if radius is None else km_to_chord(radius)
+        return [
+            (chord_to_km(chord), self.locations[index])
+            for chord, index in self.tree.search(to_unit_vector(latitude, longitude), k, max_distance)
+        ]
+
+
+_index = None
+_index_key = None
+_index_lock = threading.Lock()
+
+
+def get_index_key():
+    """
+    Returns what the cached spatial index was built for: the dataset version, or until a data load has recorded one
+    the number of cities and the last rowid of their table, which change when cities are added or deleted.
+    """
+    version = dataset.get_version()
+    if version:
+        return 'version', version
+    with connections[router.db_for_read(models.Location)].cursor() as cursor:
+        cursor.execute('SELECT COUNT(*), MAX(rowid) FROM {}'.format(models.Location._meta.db_table))
+        return ('cities',) + tuple(cursor.fetchone())
+
+
+def get_location_index(serialize):
+    """
+    Returns the spatial index of the cities, built again when load_data has changed the dataset version, or when the
+    cities have changed while no version is recorded.
+    :param serialize: Function of a list of Location objects returning the list of maps kept in the index.
+    :return: LocationIndex object.
+    """
+    global _index, _index_key
+    key = get_index_key()
+    if _index_key == key:
+        return _index
+    index = LocationIndex(serialize(models.Location.objects.order_by('name')))
+    with _index_lock:
+        _index, _index_key = index, key
+    return index
@@ -0,0 +1,345 @@
+"""
+Per city running totals and block extremes of the daily weather, answering the average over any date range with two
+index lookups and its extremes with a lookup of at most two blocks a level.
+"""
+
+from datetime import date
+from functools import reduce
+from itertools import groupby, islice
+from operator import itemgetter, or_
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+
+from . import aggregation, dataset, models
+
+BATCH_SIZE = 5000
+
+BUILT_NAME = 'prefix_sums'
+
+TOTAL_FIELDS = ('tmax_total', 'tmin_total', 'tmax_days', 'tmin_days')
+
+EXTREME_FIELDS = ('tmax_min', 'tmax_max', 'tmin_min', 'tmin_max')
+
+# Blocks of 2 ** level days, the block of a day at a level being its date ordinal shifted right by the level. The days
+# of a range outside the blocks of the lowest level, at most 2 * 7, are read from the daily weather. The top level holds
+# every date in one block.
+MIN_LEVEL = 3
+MAX_LEVEL = date.max.toordinal().bit_length()
+
+
+def build_prefix_sums(version, since=None):
+    """
+    Rebuilds the running totals and block extremes from the daily weather.
+    :param version: Dataset version the running totals are built for.
+    :param since: Map of city name to the first changed date, to extend the running totals of those cities from that
+    date onwards. None, or running totals not current for the previous version, to rebuild every city.
+    :return: Number of running total and block extreme rows created.
+    """
+    created = 0
+    with transaction.atomic():
+        if since is not None and not prefix_sums_are_current(version - 1):
+            since = None
+        if since is None:
+            models.WeatherPrefixSum.objects.all().delete()
+            models.WeatherExtreme.objects.all().delete()
+            created += create_prefix_sums(models.WeatherDetail.objects.all())
+            created += create_extremes(models.WeatherDetail.objects.all())
+        for city, first_date in (since or {}).items():
+            models.WeatherPrefixSum.objects.filter(city=city, date__gte=first_date).delete()
+            daily = models.WeatherDetail.objects.filter(city=city, date__gte=first_date)
+            created += create_prefix_sums(daily, get_last_totals(city, first_date))
+            created += extend_extremes(city, first_date)
+        dataset.set_built_version([BUILT_NAME], version)
+    return created
+
+
+def get_last_totals(city, before_date):
+    """
+    Reads the running totals of a city on its last day before a date.
+    :return: Map of temp_format to (tmax_total, tmin_total, tmax_days, tmin_days), zeros when there is no such day.
+    """
+    totals = {}
+    for temp_format in aggregation.TEMP_FORMATS:
+        last = models.WeatherPrefixSum.objects.filter(
+            city=city, temp_format=temp_format, date__lt=before_date
+        ).order_by('-date').values_list(*TOTAL_FIELDS).first()
+        totals[temp_format] = last or (0, 0, 0, 0)
+    return totals
+
+
+def create_prefix_sums(daily, initial_totals=None):
+    """
+    Creates the running totals of the daily weather for both temperature formats.
+    Zero and missing temperatures are skipped, same as the weekly and monthly averages.
+    :param daily: Queryset of WeatherDetail objects, the days before it being already totalled.
+    :param initial_totals: Map of temp_format to the totals before the first day, for a single city queryset.
+    :return: Number of running total rows created.
+    """
+    rows = daily.order_by('city', 'date').values_list('city', 'date', 'tmax', 'tmin').iterator()
+    prefix_sums = iter_prefix_sums(rows, initial_totals or {})
+    created, batch = 0, list(islice(prefix_sums, BATCH_SIZE))
+    while batch:
+        created += len(models.WeatherPrefixSum.objects.bulk_create(batch))
+        batch = list(islice(prefix_sums, BATCH_SIZE))
+    return created
+
+
+def iter_prefix_sums(rows, initial_totals):
+    """
+    Accumulates the temperatures of the daily rows city by city.
+    :param rows: Iterator of (city, date, tmax, tmin) tuples ordered by city and date.
+    :param initial_totals: Map of temp_format to the totals before the first row.
+    :return: Generator of WeatherPrefixSum objects.
+    """
+    current_city, totals = None, {}
+    for city, date, tmax, tmin in rows:
+        if city != current_city:
+            current_city = city
+            totals = {temp_format: initial_totals.get(temp_format, (0, 0, 0, 0))
+                      for temp_format in aggregation.TEMP_FORMATS}
+        for temp_format in aggregation.TEMP_FORMATS:
+            day_tmax, day_tmin = tmax, tmin
+            if temp_format == 'celsius':
+                day_tmax, day_tmin = models.WeatherDetail.convert_column_to_celsius((tmax, tmin))
+            tmax_total, tmin_total, tmax_days, tmin_days = totals[temp_format]
+            totals[temp_format] = (
+                tmax_total + (day_tmax or 0), tmin_total + (day_tmin or 0),
+                tmax_days + bool(day_tmax), tmin_days + bool(day_tmin)
+            )
+            yield models.WeatherPrefixSum(
+                city_id=city, temp_format=temp_format, date=date,
+                **dict(zip(TOTAL_FIELDS, totals[temp_format]))
+            )
+
+
+def merge_extremes(first, second):
+    """
+    Combines the extremes of two blocks.
+    :param first: Tuple of (tmax_min, tmax_max, tmin_min, tmin_max), with None for no temperature, or None for no block.
+    :param second: Same as first.
+    :return: Tuple of (tmax_min, tmax_max, tmin_min, tmin_max), None when both are None.
+    """
+    if first is None or second is None:
+        return first or second
+    return tuple(
+        one if other is None else other if one is None else function(one, other)
+        for function, one, other in zip((min, max, min, max), first, second)
+    )
+
+
+def get_day_extremes(rows, temp_format):
+    """
+    Reads the temperatures of the days as extremes, zero and missing temperatures being skipped.
+    :param rows: Iterable of (date, tmax, tmin) tuples.
+    :param temp_format: fahrenheit or celsius.
+    :return: Generator of (day ordinal, (tmax, tmax, tmin, tmin)), for the days with a temperature only.
+    """
+    for day, tmax, tmin in rows:
+        if temp_format == 'celsius':
+            tmax, tmin = models.WeatherDetail.convert_column_to_celsius((tmax, tmin))
+        tmax, tmin = tmax or None, tmin or None
+        if tmax is not None or tmin is not None:
+            yield day.toordinal(), (tmax, tmax, tmin, tmin)
+
+
+def get_left_blocks(first_block):
+    """
+    Lists the blocks left of the first changed block of each level, needed to compute the blocks above them.
+    :param first_block: First changed block of the lowest level.
+    :return: List of (level, block).
+    """
+    blocks = []
+    for level in range(MIN_LEVEL, MAX_LEVEL):
+        if first_block & 1:
+            blocks.append((level, first_block - 1))
+        first_block >>= 1
+    return blocks
+
+
+def iter_block_extremes(days, first_block=0, left_blocks=None):
+    """
+    Computes the extremes of the blocks of a city from a block of the lowest level onwards, level by level.
+    :param days: Iterable of (day ordinal, extremes) of every day from the start of the first block.
+    :param first_block: First block of the lowest level to compute.
+    :param left_blocks: Map of (level, block) to the extremes of the blocks listed by get_left_blocks.
+    :return: Generator of (level, block, extremes).
+    """
+    blocks = {}
+    for day, extremes in days:
+        blocks[day >> MIN_LEVEL] = merge_extremes(blocks.get(day >> MIN_LEVEL), extremes)
+    for level in range(MIN_LEVEL, MAX_LEVEL + 1):
+        for block, extremes in blocks.items():
+            yield level, block, extremes
+        parents = {}
+        for block, extremes in blocks.items():
+            parents[block >> 1] = merge_extremes(parents.get(block >> 1), extremes)
+        left = (left_blocks or {}).get((level, first_block - 1)) if first_block & 1 else None
+        if left is not None:
+            parents[first_block >> 1] = merge_extremes(parents.get(first_block >> 1), left)
+        blocks, first_block = parents, first_block >> 1
+
+
+def save_extremes(city, temp_format, block_extremes):
+    """
+    Creates the block extremes of a city.
+    :param block_extremes: Iterable of (level, block, extremes).
+    :return: Number of block extreme rows created.
+    """
+    new_extremes = (
+        models.WeatherExtreme(
+            city_id=city, temp_format=temp_format, level=level, block=block, **dict(zip(EXTREME_FIELDS, extremes))
+        ) for level, block, extremes in block_extremes
+    )
+    created, batch = 0, list(islice(new_extremes, BATCH_SIZE))
+    while batch:
+        created += len(models.WeatherExtreme.objects.bulk_create(batch))
+        batch = list(islice(new_extremes, BATCH_SIZE))
+    return created
+
+
+def create_extremes(daily):
+    """
+    Creates the block extremes of the daily weather of every city for both temperature formats.
+    :param daily: Queryset of WeatherDetail objects.
+    :return: Number of block extreme rows created.
+    """
+    created = 0
+    rows = daily.order_by('city', 'date').values_list('city', 'date', 'tmax', 'tmin').iterator()
+    for city, city_rows in groupby(rows, itemgetter(0)):
+        city_rows = [row[1:] for row in city_rows]
+        for temp_format in aggregation.TEMP_FORMATS:
+            created += save_extremes(city, temp_format, iter_block_extremes(get_day_extremes(city_rows, temp_format)))
+    return created
+
+
+def extend_extremes(city, first_date):
+    """
+    Rebuilds the block extremes of a city holding days from a changed date onwards.
+    :param city: City name.
+    :param first_date: First changed date.
+    :return: Number of block extreme rows created.
+    """
+    first_block = first_date.toordinal() >> MIN_LEVEL
+    left_blocks = get_left_blocks(first_block)
+    extremes = models.WeatherExtreme.objects.filter(city=city)
+    stored = {}
+    if left_blocks:
+        lookup = reduce(or_, (Q(level=level, block=block) for level, block in left_blocks))
+        for row in extremes.filter(lookup).values_list('temp_format', 'level', 'block', *EXTREME_FIELDS):
+            stored.setdefault(row[0], {})[row[1:3]] = row[3:]
+    extremes.filter(reduce(or_, (
+        Q(level=level, block__gte=first_block >> (level - MIN_LEVEL)) for level in range(MIN_LEVEL, MAX_LEVEL + 1)
+    ))).delete()
+    rows = list(models.WeatherDetail.objects.filter(
+        city=city, date__gte=date.fromordinal(first_block << MIN_LEVEL)
+    ).order_by('date').values_list('date', 'tmax', 'tmin'))
+    return sum(
+        save_extremes(city, temp_format, iter_block_extremes(
+            get_day_extremes(rows, temp_format), first_block, stored.get(temp_format)
+        )) for temp_format in aggregation.TEMP_FORMATS
+    )
+
+
+def get_range_blocks(first_block, end_block):
+    """
+    Splits a range of blocks of the lowest level into the fewest blocks of any level, at most two a level.
+    :param first_block: First block of the range.
+    :param end_block: Block after the last one of the range.
+    :return: List of (level, block).
+    """
+    level, blocks = MIN_LEVEL, []
+    while first_block < end_block:
+        if first_block & 1:
+            blocks.append((level, first_block))
+            first_block += 1
+        if end_block & 1:
+            end_block -= 1
+            blocks.append((level, end_block))
+        first_block, end_block, level = first_block >> 1, end_block >> 1, level + 1
+    return blocks
+
+
+def get_range_extremes(city, temp_format, first_block, end_block):
+    """
+    Reads the extremes of a range of blocks of the lowest level from at most two blocks a level.
+    :param city: City name.
+    :param temp_format: fahrenheit or celsius.
+    :param first_block: First block of the range.
+    :param end_block: Block after the last one of the range.
+    :return: Map of tmax_min, tmax_max, tmin_min and tmin_max to the temperature, None when there is none.
+    """
+    blocks = get_range_blocks(first_block, end_block)
+    if not blocks:
+        return dict.fromkeys(EXTREME_FIELDS)
+    lookup = reduce(or_, (Q(level=level, block=block) for level, block in blocks))
+    return models.WeatherExtreme.objects.filter(city=city, temp_format=temp_format).filter(lookup).aggregate(
+        tmax_min=Min('tmax_min'), tmax_max=Max('tmax_max'), tmin_min=Min('tmin_min'), tmin_max=Max('tmin_max')
+    )
+
+
+def prefix_sums_are_current(version):
+    """
+    Checks whether the running totals were built for the given dataset version.
+    :param version: Current dataset version.
+    :return: True if the running totals can answer requests, False when missing or stale.
+    """
+    return dataset.is_built_for([BUILT_NAME], version)
+
+
+def get_range_totals(city, temp_format, start_date=None, end_date=None):
+    """
+    Computes the temperature totals of a date range from the running totals on its last day and the day before it.
+    :param city: City name.
+    :param temp_format: fahrenheit or celsius.
+    :param start_date: First day of the range, None for no lower bound.
+    :param end_date: Last day of the range, None for no upper bound.
+    :return: Tuple of (total_tmax, total_tmin, days_tmax, days_tmin).
+    """
+    prefix_sums = models.WeatherPrefixSum.objects.filter(city=city, temp_format=temp_format).order_by('-date')
+    last = (prefix_sums.filter(date__lte=end_date) if end_date else prefix_sums).values_list(*TOTAL_FIELDS).first()
+    before = start_date and prefix_sums.filter(date__lt=start_date).values_list(*TOTAL_FIELDS).first()
+    return tuple(total - previous for total, previous in zip(last or (0, 0, 0, 0), before or (0, 0, 0, 0)))
+
+
+def get_summary(queryset, city, temp_format, start_date=None, end_date=None, use_prefix_sums=True):
+    """
+    Summarizes the temperatures of a city over a date range.
+    When the running totals are current, the totals come from them and the extremes from the blocks inside the range
+    and the few days at its edges, in the same time for any length of the range. Otherwise both are read from the
+    daily weather.
+    :param queryset: Queryset of WeatherDetail objects filtered on the city and date range.
+    :param city: City name.
+    :param temp_format: fahrenheit or celsius.
+    :param start_date: First day of the range, None for no lower bound.
+    :param end_date: Last day of the range, None for no upper bound.
+    :param use_prefix_sums: False to total the daily weather.
+    :return: Map of tmax and tmin to a map of the total, days, min and max temperature over the range.
+    """
+    convert = aggregation.FahrenheitToCelsius if temp_format == 'celsius' else F
+    tmax, tmin = aggregation.PresentTemperature(convert('tmax')), aggregation.PresentTemperature(convert('tmin'))
+    aggregates = {'tmax_min': Min(tmax), 'tmax_max': Max(tmax), 'tmin_min': Min(tmin), 'tmin_max': Max(tmin)}
+    if not use_prefix_sums:
+        aggregates.update(tmax_total=Sum(tmax), tmin_total=Sum(tmin), tmax_days=Count(tmax), tmin_days=Count(tmin))
+        values = queryset.order_by().aggregate(**aggregates)
+    else:
+        first_day = (start_date or date.min).toordinal()
+        first_block, end_block = (first_day + (1 << MIN_LEVEL) - 1) >> MIN_LEVEL, \
+            ((end_date or date.max).toordinal() + 1) >> MIN_LEVEL
+        if first_block < end_block:
+            queryset = queryset.filter(
+                Q(date__lt=date.fromordinal(first_block << MIN_LEVEL)) |
+                Q(date__gte=date.fromordinal(end_block << MIN_LEVEL))
+            )
+        edge_values = queryset.order_by().aggregate(**aggregates)
+        block_values = get_range_extremes(city, temp_format, first_block, end_block)
+        values = dict(zip(EXTREME_FIELDS, merge_extremes(
+            tuple(edge_values[name] for name in EXTREME_FIELDS), tuple(block_values[name] for name in EXTREME_FIELDS)
+        )))
+        values.update(zip(TOTAL_FIELDS, get_range_totals(city, temp_format, start_date, end_date)))
+    return {
+        name: {
+            'total': values['{}_total'.format(name)] or 0, 'days': values['{}_days'.format(name)],
+            'min': values['{}_min'.format(name)], 'max': values['{}_max'.format(name)],
+        } for name in ('tmax', 'tmin')
+    }
@@ -0,0 +1,84 @@
+"""Synthetic weather datasets in the load_data TSV format, the same seed always giving the same files."""
+
+import math
+import os
+import random
+from datetime import date, timedelta
+
+START_YEAR = 1970
+
+HEADER = 'STATION\tSTATION_NAME\tLATITUDE\tLONGITUDE\tELEVATION\tDATE\tTMAX\tTMIN\n'
+
+
+def get_station(index, seed):
+    """
+    Places a station at random on the sphere, with a random generator of its own.
+    :param index: Number of the station, from 0.
+    :param seed: Seed of the dataset.
+    :return: Tuple of (random.Random, station, city, latitude, longitude, elevation).
+    """
+    generator = random.Random('{}:{}'.format(seed, index))
+    latitude = math.degrees(math.asin(generator.uniform(-1, 1)))  # Uniform over the sphere, not crowding the poles.
+    longitude = generator.uniform(-180, 180)
+    elevation = generator.uniform(-10, 3000)
+    return (
+        generator, 'GHCND:SYN{:08}'.format(index), 'SYNTHETIC {:06}'.format(index),
+        '{:.6f}'.format(latitude), '{:.6f}'.format(longitude), '{:.1f}'.format(elevation)
+    )
+
+
+def iter_station_lines(index, years, start_year=START_YEAR, seed=0, missing=0.01):
+    """
+    Generates the daily weather of a station, a yearly cycle that is colder and wider away from the equator and at
+    altitude, with day to day noise and some missing temperatures.
+    :param index: Number of the station, from 0.
+    :param years: Number of years of daily weather.
+    :param start_year: Year of the first day.
+    :param seed: Seed of the dataset.
+    :param missing: Fraction of the temperatures left empty.
+    :return: Generator of TSV lines.
+    """
+    generator, station, city, latitude, longitude, elevation = get_station(index, seed)
+    prefix = '\t'.join((station, city, latitude, longitude, elevation)) + '\t'
+    mean = 80 - 0.6 * abs(float(latitude)) - 0.0035 * float(elevation)
+    amplitude = 3 + 0.4 * abs(float(latitude))
+    summer_day = 196 if float(latitude) >= 0 else 15
+    first_day = date(start_year, 1, 1)
+    for day in range((date(start_year + years, 1, 1) - first_day).days):
+        current = first_day + timedelta(days=day)
+        season = math.cos(2 * math.pi * (current.timetuple().tm_yday - summer_day) / 365.25)
+        tmax = round(mean + amplitude * season + generator.gauss(0, 5))
+        tmin = tmax - round(abs(generator.gauss(15, 5)))
+        yield '{}{}\t{}\t{}\n'.format(
+            prefix, current.isoformat(),
+            '' if generator.random() < missing else tmax, '' if generator.random() < missing else tmin
+        )
+
+
+def write_dataset(path, stations, years, start_year=START_YEAR, seed=0, missing=0.01, files=1):
+    """
+    Writes a dataset of daily weather, splitting the stations over several files so load_data can read them in
+    parallel.
+    :param path: Path of the TSV file, or of the directory of the files when files is more than 1.
+    :param stations: Number of stations.
+    :param years: Number of years of daily weather per station.
+    :param start_year: Year of the first day.
+    :param seed: Seed of the dataset.
+    :param missing: Fraction of the temperatures left empty.
+    :param files: Number of files.
+    :return: Tuple of the list of file paths written and the number of rows.
+    """
+    if files > 1:
+        os.makedirs(path, exist_ok=True)
+        paths = [os.path.join(path, 'weather_{:04}.tsv'.format(number)) for number in range(files)]
+    else:
+        paths = [path]
+    rows = 0
+    for number, file_path in enumerate(paths):
+        with open(file_path, 'w') as tsv_file:
+            tsv_file.write(HEADER)
+            for index in range(number, stations, len(paths)):
+                lines = list(iter_station_lines(index, years, start_year, seed, missing))
+                tsv_file.writelines(lines)
+                rows += len(lines)
+    return paths, rows
@@ -1,6 +1,6 @@
 import datetime
 import random
-import factory.fuzzy
+import factory
 
 
 class LocationFactory(factory.DjangoModelFactory):
@@ -19,6 +19,6 @@ class WeatherDetailFactory(factory.DjangoModelFactory):
         model = 'weather.WeatherDetail'
 
     city = factory.SubFactory(LocationFactory)
-    date = factory.fuzzy.FuzzyDate(start_date=datetime.date(2016, 9, 1), end_date=datetime.date(2017, 9, 1))
+    date = factory.Sequence(lambda n: datetime.date(2016, 9, 1) + datetime.timedelta(days=n))
     tmax = factory.Sequence(lambda n: random.randint(20, 50))
     tmin = factory.LazyAttribute(lambda o: o.tmax - random.randint(1, 20))
@@ -0,0 +1,40 @@
+"""Test runner keeping the suite away from the dataset files of the checkout."""
+
+import os
+import shutil
+import tempfile
+
+from django.db import connections
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class WeatherTestRunner(DiscoverRunner):
+    """
+    Runs the suite with the dataset version, snapshot and exports in a temporary directory and the response cache off.
+    Otherwise a checkout where load_data has run would give its dataset version to the tests, and the response cache
+    would serve the data of one test class to another. The caching tests turn the cache on for themselves.
+    The test DB is a file of the same directory, as the shared in-memory DB of SQLite fails at once on a lock held by
+    another thread instead of waiting for it like the DB file of the server.
+    """
+    def setup_test_environment(self, **kwargs):
+        super(WeatherTestRunner, self).setup_test_environment(**kwargs)
+        self.temp_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            WEATHER_DATASET_VERSION_FILE=os.path.join(self.temp_dir, 'weather_db.version'),
+            WEATHER_SNAPSHOT_FILE=os.path.join(self.temp_dir, 'weather_db.snapshot'),
+            WEATHER_EXPORT_DIR=os.path.join(self.temp_dir, 'exports'),
+            WEATHER_RESPONSE_CACHE=False,
+        )
+        self.settings_override.enable()
+
+    def setup_databases(self, **kwargs):
+        connection = connections['default']
+        if connection.vendor == 'sqlite' and not connection.settings_dict['TEST']['NAME']:
+            connection.settings_dict['TEST']['NAME'] = os.path.join(self.temp_dir, 'test_weather_db')
+        return super(WeatherTestRunner, self).setup_databases(**kwargs)
+
+    def teardown_test_environment(self, **kwargs):
+        self.settings_override.disable()
+        shutil.rmtree(self.temp_dir)
+        super(WeatherTestRunner, self).teardown_test_environment(**kwargs)
@@ -1,13 +1,18 @@
 """Unit test for API end points."""
 
-from datetime import timedelta
+from datetime import date, timedelta
 from collections import defaultdict
+from unittest import mock
 
+from django.db import connection
 from django.test import TestCase
-from rest_framework.test import APIClient
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
 from rest_framework import status
 
 from weather import models
+from weather.apis import WeatherDetailFilterSet, WeatherDetailSerializer, WeatherDetailViewSet
 from . import factories
 
 
@@ -153,3 +158,79 @@ class APITestCase(TestCase):
         self.assertIn("latitude", response_list[0])
         self.assertIn("longitude", response_list[0])
         self.assertIn("elevation", response_list[0])
+
+    def test_aggregation_matches_python_aggregation(self):
+        """GET with weekly, monthly or yearly frequency should match the per day aggregation in python"""
+        for frequency in ('weekly', 'monthly', 'yearly'):
+            for temp_format in ('fahrenheit', 'celsius'):
+                daily = self.api_client.get('/api/weather/?city=city_1&temp_format={}'.format(temp_format)).json()
+                expected = WeatherDetailViewSet().get_updated_response(daily, frequency)
+                response = self.api_client.get(
+                    '/api/weather/?city=city_1&frequency={}&temp_format={}'.format(frequency, temp_format)
+                )
+                self.assertEqual(response.json(), expected)
+
+    def test_aggregation_reports_missing_temperatures(self):
+        """GET with weekly frequency should return N/A for a period without any temperature"""
+        city = factories.LocationFactory(name='city_missing')
+        factories.WeatherDetailFactory(city=city, date=date(2017, 1, 2), tmax=40, tmin=None)
+        factories.WeatherDetailFactory(city=city, date=date(2017, 1, 3), tmax=0, tmin=None)
+        factories.WeatherDetailFactory(city=city, date=date(2017, 1, 9), tmax=None, tmin=None)
+        response = self.api_client.get('/api/weather/?city=city_missing&frequency=weekly')
+        self.assertEqual(response.json(), [
+            {'date': '2017-01-02', 'tmax': 40, 'tmin': 'N/A'},
+            {'date': '2017-01-09', 'tmax': 'N/A', 'tmin': 'N/A'},
+        ])
+
+    def test_aggregation_follows_date_ordering(self):
+        """GET with frequency and descending date ordering should return the latest period first"""
+        response = self.api_client.get('/api/weather/?city=city_2&frequency=monthly&ordering=-date')
+        dates = [row['date'] for row in response.json()]
+        self.assertEqual(dates, sorted(dates, reverse=True))
+
+    def test_city_and_date_range_query_uses_index(self):
+        """The filtered and date ordered weather query should be answered from an index without sorting"""
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN is specific to SQLite')
+        params = {'city': 'city_0', 'start_date': '2016-09-05', 'end_date': '2016-09-15'}
+        queryset = WeatherDetailFilterSet(params, queryset=models.WeatherDetail.objects.all()).qs.order_by('date')
+        sql, sql_params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, sql_params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        self.assertTrue(any(step.startswith('SEARCH') for step in plan), plan)
+        self.assertFalse([step for step in plan if step.startswith('SCAN') or 'TEMP B-TREE' in step], plan)
+
+    def test_daily_list_matches_model_serializer(self):
+        """GET daily weather should render the same bytes as the WeatherDetailSerializer output"""
+        for query in ('city=city_1', 'city=city_1&temp_format=celsius&ordering=-tmax'):
+            request = Request(APIRequestFactory().get('/api/weather/?{}'.format(query)))
+            queryset = WeatherDetailViewSet(request=request, format_kwarg=None).filter_queryset(
+                models.WeatherDetail.objects.all()
+            )
+            expected = WeatherDetailSerializer(queryset, many=True, context={'request': request}).data
+            response = self.api_client.get('/api/weather/?{}'.format(query))
+            self.assertEqual(response.content, JSONRenderer().render(expected))
+
+    def test_streaming_matches_buffered_response(self):
+        """GET with stream=true should stream the same bytes as the buffered response"""
+        queries = ('city=city_0&ordering=-date&stream=true', 'city=city_0&temp_format=celsius&stream=1')
+        for query in queries:
+            expected = self.api_client.get('/api/weather/?{}'.format(query.rsplit('&', 1)[0])).content
+            with mock.patch.object(WeatherDetailViewSet, 'stream_chunk_size', 3):
+                response = self.api_client.get('/api/weather/?{}'.format(query))
+            self.assertTrue(response.streaming)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            self.assertEqual(b''.join(response.streaming_content), expected)
+
+    def test_aggregated_list_is_not_streamed(self):
+        """GET with stream=true and a weekly frequency should send the whole list, one row per period"""
+        expected = self.api_client.get('/api/weather/?city=city_0&frequency=weekly').content
+        response = self.api_client.get('/api/weather/?city=city_0&frequency=weekly&stream=true')
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.content, expected)
+
+    def test_streaming_empty_range(self):
+        """GET with stream=true and no matching rows should stream an empty list"""
+        response = self.api_client.get('/api/weather/?city=unknown&stream=true')
+        self.assertEqual(b''.join(response.streaming_content), b'[]')
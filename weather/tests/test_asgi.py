@@ -0,0 +1,107 @@
+"""Unit test for the ASGI entry point."""
+
+import asyncio
+import json
+from datetime import date, timedelta
+
+from django.test import TransactionTestCase
+from rest_framework.test import APIClient
+
+from weather.asgi import ASGIHandler
+from . import factories
+
+
+class ASGITestCase(TransactionTestCase):
+    """Test the API served through the ASGI handler, the views running on its thread pool."""
+    def setUp(self):
+        city = factories.LocationFactory(name='city_a')
+        for day in range(300):
+            factories.WeatherDetailFactory(city=city, date=date(2017, 1, 1) + timedelta(days=day))
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.application = ASGIHandler(max_workers=2, chunk_size=1024, stream_buffer=2)
+
+    def tearDown(self):
+        self.application.executor.shutdown(wait=True)
+        self.loop.close()
+
+    async def request(self, path, query=b'', on_body=None):
+        """
+        Sends a GET through the handler.
+        :param on_body: Coroutine function called with each body message, standing for a slow client.
+        :return: Tuple of the response start message and the list of body messages.
+        """
+        scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query, 'headers': [
+            (b'host', b'testserver'), (b'accept', b'application/json')
+        ]}
+        received, messages = [{'type': 'http.request', 'body': b''}], []
+
+        async def receive():
+            return received.pop(0) if received else {'type': 'http.disconnect'}
+
+        async def send(message):
+            messages.append(message)
+            if on_body is not None and message['type'] == 'http.response.body':
+                await on_body(message)
+
+        await self.application(scope, receive, send)
+        return messages[0], messages[1:]
+
+    def test_response_matches_wsgi(self):
+        """GET through the ASGI handler should return the same response as the test client, in slices"""
+        expected = APIClient().get('/api/weather/?city=city_a&temp_format=celsius')
+        start, body = self.loop.run_until_complete(
+            self.request('/api/weather/', b'city=city_a&temp_format=celsius')
+        )
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'Content-Type', b'application/json'), start['headers'])
+        self.assertGreater(len(body), 1)
+        self.assertEqual([message.get('more_body', False) for message in body], [True] * (len(body) - 1) + [False])
+        self.assertEqual(json.loads(b''.join(message['body'] for message in body).decode()), expected.json())
+
+    def test_streamed_response(self):
+        """GET of a streamed list should send the chunks as they are produced, followed by an empty last body"""
+        expected = APIClient().get('/api/weather/?city=city_a').json()
+        with self.settings(WEATHER_RESPONSE_CACHE=False):
+            _, body = self.loop.run_until_complete(self.request('/api/weather/', b'city=city_a&stream=true'))
+        self.assertEqual(body[-1], {'type': 'http.response.body', 'body': b''})
+        self.assertEqual(json.loads(b''.join(message['body'] for message in body).decode()), expected)
+
+    def test_slow_clients_do_not_hold_threads(self):
+        """More slow clients than pool threads should be served at the same time"""
+        waiting, most_waiting = [0], [0]
+
+        async def slow_client(message):
+            waiting[0] += 1
+            most_waiting[0] = max(most_waiting[0], waiting[0])
+            await asyncio.sleep(0.02)
+            waiting[0] -= 1
+
+        requests = [self.request('/api/cities/', on_body=slow_client) for _ in range(8)]
+        responses = self.loop.run_until_complete(asyncio.gather(*requests))
+        self.assertTrue(all(start['status'] == 200 for start, _ in responses))
+        self.assertGreater(most_waiting[0], 2)
+
+    def test_client_gone_during_stream(self):
+        """A client going away during a stream should stop its producer and free the pool thread"""
+        async def gone(message):
+            raise ConnectionResetError()
+
+        with self.assertRaises(ConnectionResetError):
+            self.loop.run_until_complete(self.request('/api/weather/', b'city=city_a&stream=true', on_body=gone))
+        for _ in range(2):
+            start, _ = self.loop.run_until_complete(self.request('/api/cities/'))
+            self.assertEqual(start['status'], 200)
+
+    def test_lifespan(self):
+        """The handler should acknowledge the startup and shutdown of the server"""
+        received, sent = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}], []
+
+        async def receive():
+            return received.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        self.loop.run_until_complete(self.application({'type': 'lifespan'}, receive, send))
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
@@ -0,0 +1,51 @@
+"""Unit test for the multi city batch end point."""
+
+from datetime import date, timedelta
+
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from . import factories
+
+
+class BatchTestCase(TestCase):
+    """Test the weather API returning several cities in one request."""
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('city_a', 'city_b', 'city_c'):
+            city = factories.LocationFactory(name=name)
+            for day in range(70):
+                factories.WeatherDetailFactory(city=city, date=date(2017, 1, 1) + timedelta(days=day))
+        factories.WeatherDetailFactory(city=city, date=date(2017, 3, 20), tmax=None, tmin=0)
+
+    def setUp(self):
+        self.api_client = APIClient()
+
+    def test_batch_matches_single_city_requests(self):
+        """GET of a batch should return the same data for each city as one request per city"""
+        for query in ('frequency=daily&temp_format=celsius&start_date=2017-01-03&end_date=2017-02-10',
+                      'frequency=weekly&start_date=2017-01-03', 'frequency=monthly&temp_format=celsius',
+                      'frequency=monthly&ordering=-date', 'ordering=-date&end_date=2017-01-20'):
+            with self.assertNumQueries(1):
+                response = self.api_client.get('/api/weather/batch/?city=city_c&city=city_a&{}'.format(query))
+            self.assertEqual(list(response.json()), ['city_a', 'city_c'])
+            for city, data in response.json().items():
+                self.assertEqual(data, self.api_client.get('/api/weather/?city={}&{}'.format(city, query)).json())
+
+    def test_batch_of_all_cities(self):
+        """GET of a batch without cities should return every city"""
+        response = self.api_client.get('/api/weather/batch/?frequency=monthly')
+        self.assertEqual(list(response.json()), ['city_a', 'city_b', 'city_c'])
+
+    def test_batch_with_unknown_city(self):
+        """GET of a batch should return an empty list for a city without data"""
+        response = self.api_client.get('/api/weather/batch/?city=city_b&city=unknown')
+        self.assertEqual(response.json()['unknown'], [])
+        self.assertEqual(len(response.json()['city_b']), 70)
+
+    def test_batch_with_invalid_filters(self):
+        """GET of a batch with an invalid filter or ordering should return 400"""
+        for query in ('frequency=hourly', 'start_date=yesterday', 'ordering=tmax'):
+            response = self.api_client.get('/api/weather/batch/?city=city_a&{}'.format(query))
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, query)
@@ -0,0 +1,195 @@
+"""Unit test for the response cache and conditional GET of the API end points."""
+
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework import response, status
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from weather import caching, dataset, models
+from . import factories
+
+
+class CachingTestCase(TestCase):
+    """Test the weather API answering repeat requests without the DB."""
+    @classmethod
+    def setUpTestData(cls):
+        factories.LocationFactory.reset_sequence(force=True)
+        factories.WeatherDetailFactory.reset_sequence(force=True)
+        factories.WeatherDetailFactory.create_batch(10, city=factories.LocationFactory())
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            WEATHER_DATASET_VERSION_FILE=os.path.join(self.temp_dir, 'weather_db.version'), WEATHER_RESPONSE_CACHE=True
+        )
+        self.settings_override.enable()
+        caches[settings.WEATHER_CACHE_ALIAS].clear()
+        dataset.set_version(1)
+        self.api_client = APIClient()
+
+    def tearDown(self):
+        caches[settings.WEATHER_CACHE_ALIAS].clear()
+        self.settings_override.disable()
+        shutil.rmtree(self.temp_dir)
+
+    def test_equivalent_requests_are_served_from_cache(self):
+        """GET of an equivalent weather query should be answered from the cache with the same ETag"""
+        response = self.api_client.get('/api/weather/?city=city_0&frequency=weekly&temp_format=celsius')
+        with self.assertNumQueries(0):
+            cached = self.api_client.get('/api/weather/?temp_format=celsius&frequency=weekly&city=city_0')
+        self.assertEqual(cached.json(), response.json())
+        self.assertEqual(cached['ETag'], response['ETag'])
+        daily = self.api_client.get('/api/weather/?city=city_0')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.api_client.get('/api/weather/?city=city_0&frequency=daily').json(), daily.json())
+
+    def test_conditional_get_returns_not_modified(self):
+        """GET with the ETag of the current dataset version should return 304 without touching the DB"""
+        etag = self.api_client.get('/api/cities/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.api_client.get('/api/cities/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        dataset.set_version(2)
+        response = self.api_client.get('/api/cities/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_new_dataset_version_invalidates_cache(self):
+        """GET after a data load should not return the responses cached for the previous dataset version"""
+        self.api_client.get('/api/weather/?city=city_0')
+        models.WeatherDetail.objects.update(tmax=99)
+        self.assertNotEqual(self.api_client.get('/api/weather/?city=city_0').json()[0]['tmax'], 99)
+        dataset.set_version(2)
+        self.assertEqual(self.api_client.get('/api/weather/?city=city_0').json()[0]['tmax'], 99)
+
+    def test_nothing_is_cached_without_dataset_version(self):
+        """GET before any data load has recorded a dataset version should not be cached"""
+        dataset.set_version(0)
+        response = self.api_client.get('/api/weather/?city=city_0')
+        self.assertNotIn('ETag', response)
+        with self.assertNumQueries(1):
+            self.api_client.get('/api/weather/?city=city_0')
+
+
+class SingleFlightTestCase(SimpleTestCase):
+    """Test identical concurrent requests sharing one run of the view."""
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            WEATHER_DATASET_VERSION_FILE=os.path.join(self.temp_dir, 'weather_db.version'),
+            WEATHER_COALESCE_REQUESTS=True, WEATHER_COALESCE_TIMEOUT=5,
+        )
+        self.settings_override.enable()
+        self.release, self.started = threading.Event(), threading.Event()
+        self.runs = []
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.temp_dir)
+
+    @staticmethod
+    def count_waits(count):
+        """
+        Patches the wait of the runs in flight to set the returned event once count callers wait on them.
+        :return: Tuple of the patch and the event.
+        """
+        waiting, lock, callers = threading.Event(), threading.Lock(), []
+        wait = caching.Flight.wait
+
+        def counted_wait(flight, timeout=None):
+            with lock:
+                callers.append(threading.get_ident())
+                if len(callers) == count:
+                    waiting.set()
+            return wait(flight, timeout)
+        return mock.patch.object(caching.Flight, 'wait', counted_wait), waiting
+
+    def run_concurrently(self, function, count, key='key'):
+        """Calls the function from count threads, releasing the run in flight for the key once the others wait on it"""
+        results = [None] * count
+
+        def call(number):
+            try:
+                results[number] = function()
+            except Exception as exc:
+                results[number] = exc
+
+        threads = [threading.Thread(target=call, args=(number,)) for number in range(count)]
+        patch, waiting = self.count_waits(count - 1)
+        with patch:
+            for thread in threads:
+                thread.start()
+            if not waiting.wait(5):
+                self.fail('{} callers never waited on {}'.format(count - 1, key))
+            self.release.set()
+            for thread in threads:
+                thread.join()
+        return results
+
+    def compute(self, result=None, error=None):
+        """Returns a function recording its run, blocking until released, then returning or raising"""
+        def function():
+            self.runs.append(threading.get_ident())
+            self.started.set()
+            self.release.wait(5)
+            if error is not None:
+                raise error
+            return result
+        return function
+
+    def test_concurrent_calls_share_one_run(self):
+        """Concurrent calls of a key should run the function once and all get its result"""
+        results = self.run_concurrently(lambda: caching.SINGLE_FLIGHT.do('key', self.compute([1, 2])), 8)
+        self.assertEqual(len(self.runs), 1)
+        self.assertEqual(sorted(shared for _, shared in results), [False] + [True] * 7)
+        self.assertTrue(all(result == [1, 2] for result, _ in results))
+        self.assertEqual(caching.SINGLE_FLIGHT.flights, {})
+
+    def test_errors_are_raised_in_every_caller(self):
+        """
+        Concurrent calls of a key should all raise the exception of the shared run, the waiting callers a copy of
+        their own chained to it, and the run should not be kept
+        """
+        error = ValueError('failed')
+        results = self.run_concurrently(lambda: caching.SINGLE_FLIGHT.do('key', self.compute(error=error)), 4)
+        self.assertEqual(len({id(result) for result in results}), 4)
+        self.assertIn(error, results)
+        for result in results:
+            self.assertIsInstance(result, ValueError)
+            self.assertEqual(result.args, ('failed',))
+            if result is not error:
+                self.assertIs(result.__cause__, error)
+        self.assertEqual(caching.SINGLE_FLIGHT.do('key', lambda: 'again'), ('again', False))
+
+    def test_waiter_runs_itself_after_timeout(self):
+        """A caller waiting longer than the timeout should run the function itself"""
+        leader = threading.Thread(target=caching.SINGLE_FLIGHT.do, args=('key', self.compute('slow')))
+        leader.start()
+        self.assertTrue(self.started.wait(5))
+        self.assertEqual(caching.SINGLE_FLIGHT.do('key', lambda: 'fast', timeout=0.05), ('fast', False))
+        self.release.set()
+        leader.join()
+
+    def test_views_share_the_response_data(self):
+        """Identical concurrent requests should each get a response of their own with the data of one view run"""
+        class View(object):
+            @caching.cached_response
+            def list(view, request):
+                return response.Response(data=self.compute({'tmax': 40})())
+
+        def get_request():
+            return Request(APIRequestFactory().get('/api/weather/?city=a&frequency=monthly'))
+
+        key = 'weather:0:{}'.format(caching.get_query_key(get_request()))
+        results = self.run_concurrently(lambda: View().list(get_request()), 5, key)
+        self.assertEqual(len(self.runs), 1)
+        self.assertEqual(len({id(result) for result in results}), 5)
+        self.assertTrue(all(result.data == {'tmax': 40} for result in results))
@@ -0,0 +1,102 @@
+"""Unit test for the SQLite production profile."""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import OperationalError, connections
+from django.db.utils import ConnectionHandler
+from django.test import TestCase, override_settings
+
+from weather import database, models
+
+PRAGMAS = {'journal_mode': 'wal', 'synchronous': 'normal', 'mmap_size': 1048576, 'cache_size': -2048}
+
+
+@override_settings(WEATHER_SQLITE_PRAGMAS=PRAGMAS)
+class SQLiteProfileTestCase(TestCase):
+    """Test the pragmas and the read only connection on a DB file of their own."""
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        path = os.path.join(self.temp_dir, 'weather_db')
+        self.connections = ConnectionHandler({
+            'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path},
+            'readonly': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': 'file:{}?mode=ro'.format(path),
+                         'OPTIONS': {'uri': True}},
+        })
+        # Written without the profile, so the DB file starts in the rollback journal mode of a new SQLite file.
+        writer = sqlite3.connect(path)
+        writer.execute('CREATE TABLE day (tmax INTEGER)')
+        writer.execute('INSERT INTO day VALUES (40)')
+        writer.commit()
+        writer.close()
+        self.path = path
+
+    def tearDown(self):
+        for connection in self.connections.all():
+            connection.close()
+        shutil.rmtree(self.temp_dir)
+
+    @staticmethod
+    def query(connection, sql):
+        """Returns the first value of the first row of a query"""
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+            return cursor.fetchone()[0]
+
+    def test_pragmas(self):
+        """New connections should run in WAL mode with the memory map and page cache of the profile"""
+        for alias in ('readonly', 'default'):
+            connection = self.connections[alias]
+            self.assertEqual(self.query(connection, 'PRAGMA journal_mode'), 'wal')
+            self.assertEqual(self.query(connection, 'PRAGMA mmap_size'), 1048576)
+            self.assertEqual(self.query(connection, 'PRAGMA cache_size'), -2048)
+        self.assertFalse(database.is_read_only(self.connections['default']))
+        self.assertTrue(database.is_read_only(self.connections['readonly']))
+
+    def test_read_only_connection_sets_wal(self):
+        """A read only connection opened first on a DB file in rollback journal mode should switch the file to WAL"""
+        reader = self.connections['readonly']
+        self.assertEqual(self.query(reader, 'PRAGMA journal_mode'), 'wal')
+        self.assertEqual(self.query(reader, 'SELECT COUNT(*) FROM day'), 1)
+        writer = sqlite3.connect(self.path)
+        self.assertEqual(writer.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        writer.close()
+
+    def test_read_only_connection_refuses_other_mode(self):
+        """A read only connection should fail when the DB file cannot be switched to WAL"""
+        with mock.patch.object(database, 'set_journal_mode'):
+            with self.assertRaises(ImproperlyConfigured):
+                self.query(self.connections['readonly'], 'PRAGMA journal_mode')
+
+    def test_reads_during_a_write(self):
+        """The read only connection should read the last commit while a write transaction is open, and never write"""
+        writer, reader = self.connections['default'], self.connections['readonly']
+        with writer.cursor() as cursor:
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('INSERT INTO day VALUES (50)')
+            self.assertEqual(self.query(reader, 'SELECT COUNT(*) FROM day'), 1)
+            cursor.execute('COMMIT')
+        self.assertEqual(self.query(reader, 'SELECT COUNT(*) FROM day'), 2)
+        with self.assertRaises(OperationalError):
+            self.query(reader, 'DELETE FROM day')
+
+
+class ReadOnlyRouterTestCase(TestCase):
+    """Test the routing of the reads to the read only connection."""
+    def test_routing(self):
+        """Reads should go to the read only connection outside of a transaction, writes to the default one"""
+        router = database.ReadOnlyRouter()
+        with mock.patch.dict(settings.DATABASES, readonly={}):
+            self.assertEqual(router.db_for_read(models.WeatherDetail), 'default')
+            with mock.patch.object(connections['default'], 'in_atomic_block', False):
+                self.assertEqual(router.db_for_read(models.WeatherDetail), 'readonly')
+            self.assertEqual(router.db_for_write(models.WeatherDetail), 'default')
+            self.assertFalse(router.allow_migrate('readonly', 'weather'))
+            self.assertTrue(router.allow_migrate('default', 'weather'))
+        with mock.patch.object(connections['default'], 'in_atomic_block', False):
+            self.assertEqual(router.db_for_read(models.WeatherDetail), 'default')
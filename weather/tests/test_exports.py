@@ -0,0 +1,218 @@
+"""Unit test for the background exports of the daily weather."""
+
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from unittest import mock
+
+from django.db import connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from weather import dataset, exports, models
+from . import factories
+
+
+def get_file_content(response):
+    """Returns the decompressed text of a downloaded export"""
+    return gzip.decompress(b''.join(response.streaming_content)).decode('utf-8')
+
+
+class ExportTestCase(TestCase):
+    """Test the export API, the exports running within the request."""
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('city_a', 'city_b'):
+            city = factories.LocationFactory(name=name)
+            for day in range(40):
+                factories.WeatherDetailFactory(city=city, date=date(2017, 1, 1) + timedelta(days=day))
+        models.WeatherDetail.objects.filter(city='city_b', date=date(2017, 1, 5)).update(tmax=None)
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            WEATHER_DATASET_VERSION_FILE=os.path.join(self.temp_dir, 'weather_db.version'),
+            WEATHER_EXPORT_DIR=os.path.join(self.temp_dir, 'exports'), WEATHER_EXPORT_WORKERS=0
+        )
+        self.settings_override.enable()
+        dataset.set_version(1)
+        self.api_client = APIClient()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.temp_dir)
+
+    def submit(self, **query):
+        return self.api_client.post('/api/exports/', query, format='json')
+
+    def test_csv_export(self):
+        """A CSV export should hold the rows of the weather list, ordered by city and date"""
+        submitted = self.submit(city=['city_a'], start_date='2017-01-10', end_date='2017-01-19')
+        self.assertEqual(submitted.status_code, 200)
+        self.assertEqual(submitted.json()['status'], models.ExportJob.DONE)
+        self.assertEqual(submitted.json()['rows'], 10)
+        self.assertEqual(self.api_client.get(submitted['Location']).json(), submitted.json())
+
+        downloaded = self.api_client.get(submitted.json()['download'])
+        self.assertEqual(downloaded['Content-Type'], 'application/gzip')
+        self.assertEqual(
+            downloaded['Content-Disposition'],
+            'attachment; filename="weather_export_{}.csv.gz"'.format(submitted.json()['id'])
+        )
+        expected = self.api_client.get(
+            '/api/weather/', {'city': 'city_a', 'start_date': '2017-01-10', 'end_date': '2017-01-19'}
+        ).json()
+        rows = list(csv.DictReader(io.StringIO(get_file_content(downloaded))))
+        self.assertEqual(
+            [(row['city'], row['date'], int(row['tmax']), int(row['tmin'])) for row in rows],
+            [('city_a', row['date'], row['tmax'], row['tmin']) for row in expected]
+        )
+
+    def test_columns_export(self):
+        """A columns export should hold one array per field, in celsius when asked, with the missing values"""
+        submitted = self.submit(temp_format='celsius', format='columns').json()
+        self.assertEqual(submitted['rows'], 80)
+        data = json.loads(get_file_content(self.api_client.get(submitted['download'])))
+        self.assertEqual(list(data), list(exports.FIELDS))
+        rows = list(models.WeatherDetail.objects.order_by('city', 'date').values_list('city', 'date', 'tmax', 'tmin'))
+        self.assertEqual(data['city'], [row[0] for row in rows])
+        self.assertEqual(data['date'], [row[1].isoformat() for row in rows])
+        self.assertEqual(data['tmax'], models.WeatherDetail.convert_column_to_celsius([row[2] for row in rows]))
+        self.assertEqual(data['tmin'], models.WeatherDetail.convert_column_to_celsius([row[3] for row in rows]))
+        self.assertIn(None, data['tmax'])
+
+    def test_identical_query_reuses_export(self):
+        """An identical query should reuse the export until the dataset version changes"""
+        first = self.submit(city=['city_b', 'city_a']).json()
+        self.assertEqual(self.submit(city=['city_a', 'city_b']).json()['id'], first['id'])
+        self.assertNotEqual(self.submit(city=['city_a']).json()['id'], first['id'])
+        self.assertEqual(models.ExportJob.objects.count(), 2)
+
+        dataset.set_version(2)
+        second = self.submit(city=['city_a', 'city_b']).json()
+        self.assertNotEqual(second['id'], first['id'])
+        self.assertEqual(second['version'], 2)
+        self.assertFalse(models.ExportJob.objects.filter(version=1).exists())
+        self.assertEqual(os.listdir(os.path.join(self.temp_dir, 'exports')), ['weather_export_{}.csv.gz'.format(
+            second['id']
+        )])
+
+    def test_exports_again_without_version(self):
+        """Before any load has recorded a dataset version a query should be exported again, keeping its last file"""
+        dataset.set_version(0)
+        first = self.submit(city=['city_a']).json()
+        second = self.submit(city=['city_a']).json()
+        self.assertNotEqual(second['id'], first['id'])
+        self.assertEqual(second['version'], 0)
+        self.submit(city=['city_b'])
+        self.assertEqual(models.ExportJob.objects.count(), 2)
+        self.assertEqual(len(os.listdir(os.path.join(self.temp_dir, 'exports'))), 2)
+
+        dataset.set_version(1)
+        self.submit(city=['city_a'])
+        self.assertFalse(models.ExportJob.objects.filter(version=0).exists())
+
+    def test_lost_export(self):
+        """An export in progress for longer than the timeout should be marked as failed and exported again"""
+        query = exports.normalize_query(city=['city_a'])
+        lost = models.ExportJob.objects.create(
+            query_key=exports.get_query_key(query), query=json.dumps(query), format='csv', version=1
+        )
+        models.ExportJob.objects.filter(pk=lost.pk).update(created=timezone.now() - timedelta(days=1))
+        self.assertNotEqual(self.submit(city=['city_a']).json()['id'], lost.pk)
+        lost.refresh_from_db()
+        self.assertEqual(lost.status, models.ExportJob.FAILED)
+
+    def test_long_city_list(self):
+        """A city list longer than a query can take should be read in chunks, keeping the order of the rows"""
+        cities = ['city_{:04}'.format(number) for number in range(1200)] + ['city_a', 'city_b']
+        rows = [row for chunk in exports.iter_chunks(exports.normalize_query(city=cities)) for row in chunk]
+        self.assertEqual(rows, [
+            (city, day.isoformat(), tmax, tmin) for city, day, tmax, tmin in
+            models.WeatherDetail.objects.order_by('city', 'date').values_list('city', 'date', 'tmax', 'tmin')
+        ])
+        with mock.patch.object(exports, 'CITY_CHUNK_SIZE', 1):
+            chunks = exports.iter_chunks(exports.normalize_query(city=['city_b', 'city_a']))
+            self.assertEqual([row for chunk in chunks for row in chunk], rows)
+
+    def test_unfinished_export(self):
+        """The download of an export still in progress should be refused"""
+        job = models.ExportJob.objects.create(query_key='key', query='{}', format='csv', version=1)
+        response = self.api_client.get('/api/exports/{}/download/'.format(job.pk))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.api_client.get('/api/exports/{}/'.format(job.pk)).json()['download'], None)
+
+    def test_invalid_query(self):
+        """An invalid query should return 400 without creating a job"""
+        self.assertEqual(self.submit(format='xml').status_code, 400)
+        self.assertEqual(self.submit(start_date='2017-02-01', end_date='2017-01-01').status_code, 400)
+        self.assertFalse(models.ExportJob.objects.exists())
+
+
+class ExportWorkerTestCase(TransactionTestCase):
+    """Test the exports running on the worker pool."""
+    def setUp(self):
+        city = factories.LocationFactory(name='city_a')
+        for day in range(30):
+            factories.WeatherDetailFactory(city=city, date=date(2017, 1, 1) + timedelta(days=day))
+        self.temp_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            WEATHER_DATASET_VERSION_FILE=os.path.join(self.temp_dir, 'weather_db.version'),
+            WEATHER_EXPORT_DIR=os.path.join(self.temp_dir, 'exports'), WEATHER_EXPORT_WORKERS=1
+        )
+        self.settings_override.enable()
+        dataset.set_version(1)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.temp_dir)
+
+    def test_export_in_background(self):
+        """A submitted export should return at once and be done by a pool thread"""
+        api_client = APIClient()
+        submitted = api_client.post('/api/exports/', {'city': ['city_a']}, format='json')
+        self.assertEqual(submitted.status_code, 202)
+        for _ in range(200):
+            job = api_client.get(submitted['Location']).json()
+            if job['status'] == models.ExportJob.DONE:
+                break
+            time.sleep(0.05)
+        self.assertEqual(job['status'], models.ExportJob.DONE)
+        self.assertEqual(job['rows'], 30)
+        self.assertEqual(len(get_file_content(api_client.get(job['download'])).splitlines()), 31)
+
+    def test_concurrent_identical_queries(self):
+        """Identical queries submitted together from two threads should share one job"""
+        barrier, job_ids = threading.Barrier(2), []
+        find_reusable_job = exports.find_reusable_job
+
+        def slow_find_reusable_job(*args):
+            # Widens the window between the lookup and the creation of the job.
+            job = find_reusable_job(*args)
+            time.sleep(0.2)
+            return job
+
+        def submit():
+            try:
+                barrier.wait()
+                job_ids.append(exports.submit_export(exports.normalize_query(city=['city_a'])).pk)
+            finally:
+                connections.close_all()
+
+        with mock.patch.object(exports, 'find_reusable_job', slow_find_reusable_job):
+            threads = [threading.Thread(target=submit) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(job_ids), 2)
+        self.assertEqual(len(set(job_ids)), 1)
+        self.assertEqual(models.ExportJob.objects.count(), 1)
@@ -0,0 +1,72 @@
+"""Unit test for the generate_data management command."""
+
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+
+from weather import models, synthetic
+
+
+class GenerateDataTestCase(TestCase):
+    """Test the synthetic datasets written for load_data."""
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            WEATHER_DATASET_VERSION_FILE=os.path.join(self.temp_dir, 'weather_db.version')
+        )
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.temp_dir)
+
+    def generate(self, output, *args):
+        """Runs the generate_data command and returns its output"""
+        stdout = StringIO()
+        call_command('generate_data', '--output', os.path.join(self.temp_dir, output), *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def read(self, *names):
+        """Returns the content of the generated files"""
+        content = ''
+        for name in names:
+            with open(os.path.join(self.temp_dir, name)) as tsv_file:
+                content += tsv_file.read()
+        return content
+
+    def test_generated_data_loads(self):
+        """load_data should load every generated day of every station"""
+        output = self.generate('weather.tsv', '--stations', '3', '--years', '2', '--start-year', '2015')
+        self.assertIn('Wrote 2193 rows of 3 stations over 2 years to 1 files', output)
+        call_command('load_data', '--file', os.path.join(self.temp_dir, 'weather.tsv'), stdout=StringIO())
+        self.assertEqual(models.Location.objects.count(), 3)
+        self.assertEqual(models.WeatherDetail.objects.filter(city='SYNTHETIC 000002').count(), 731)
+        self.assertEqual(str(models.WeatherDetail.objects.latest('date').date), '2016-12-31')
+
+    def test_same_seed_same_data(self):
+        """generate_data should write the same stations and days for a seed, whatever the number of files"""
+        self.generate('one.tsv', '--stations', '4', '--years', '1', '--seed', '7')
+        self.generate('split', '--stations', '4', '--years', '1', '--seed', '7', '--files', '2')
+        self.generate('other.tsv', '--stations', '4', '--years', '1', '--seed', '8')
+        one, other = self.read('one.tsv'), self.read('other.tsv')
+        split = self.read(os.path.join('split', 'weather_0000.tsv'), os.path.join('split', 'weather_0001.tsv'))
+        self.assertEqual(sorted(one.splitlines()), sorted(set(split.splitlines())))
+        self.assertNotEqual(one, other)
+
+    def test_missing_temperatures(self):
+        """generate_data should leave the given fraction of the temperatures empty"""
+        self.generate('weather.tsv', '--stations', '2', '--years', '5', '--missing', '0.1')
+        rows = [line.split('\t') for line in self.read('weather.tsv').splitlines()[1:]]
+        empty = sum(row[6] == '' for row in rows) + sum(row[7] == '' for row in rows)
+        self.assertAlmostEqual(empty / (2 * len(rows)), 0.1, delta=0.02)
+        self.assertTrue(all(int(row[6]) >= int(row[7]) for row in rows if row[6] and row[7]))
+        self.assertEqual(self.read('weather.tsv').splitlines()[0] + '\n', synthetic.HEADER)
+
+    def test_invalid_options(self):
+        """generate_data should refuse an empty dataset"""
+        with self.assertRaises(CommandError):
+            self.generate('weather.tsv', '--stations', '0')
@@ -0,0 +1,84 @@
+"""Unit test for the per request instrumentation."""
+
+import json
+import re
+from datetime import date, timedelta
+
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from weather import instrumentation
+from . import factories
+
+
+class InstrumentationTestCase(TestCase):
+    """Test the timings of the weather API requests."""
+    @classmethod
+    def setUpTestData(cls):
+        city = factories.LocationFactory(name='city_a')
+        for day in range(40):
+            factories.WeatherDetailFactory(city=city, date=date(2017, 1, 1) + timedelta(days=day))
+
+    def setUp(self):
+        self.settings_override = override_settings(WEATHER_INSTRUMENTATION=True)
+        self.settings_override.enable()
+        instrumentation.HISTOGRAMS.clear()
+        self.api_client = APIClient()
+
+    def tearDown(self):
+        self.settings_override.disable()
+
+    @staticmethod
+    def get_metrics(api_response):
+        """Parses the Server-Timing header into a map of metric name to its duration and description"""
+        metrics = {}
+        for entry in api_response['Server-Timing'].split(', '):
+            name, duration, *description = entry.split(';')
+            metrics[name] = (float(duration[len('dur='):]), description[0][len('desc='):] if description else None)
+        return metrics
+
+    def test_server_timing(self):
+        """GET of the weather should return the phase timings and SQL counts in a Server-Timing header"""
+        with self.assertLogs('weather.instrumentation', 'INFO') as logs:
+            api_response = self.api_client.get('/api/weather/?city=city_a&frequency=monthly')
+        metrics = self.get_metrics(api_response)
+        self.assertEqual(list(metrics), ['db', 'aggregate', 'view', 'render', 'total'])
+        queries, rows = map(int, re.match(r'"(\d+) queries / (\d+) rows"', metrics['db'][1]).groups())
+        self.assertGreaterEqual(queries, 1)
+        self.assertEqual(rows, 2)
+        self.assertLessEqual(metrics['view'][0], metrics['total'][0])
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual((line['endpoint'], line['status'], line['queries']), ('weather_detail-list', 200, queries))
+
+    def test_rows_are_counted(self):
+        """GET of the daily weather should count the rows read from the DB"""
+        api_response = self.api_client.get('/api/weather/?city=city_a&start_date=2017-01-11')
+        self.assertIn('serialize', self.get_metrics(api_response))
+        self.assertIn('1 queries / 30 rows', api_response['Server-Timing'])
+
+    def test_stats(self):
+        """GET of the stats should return the percentiles of each end point"""
+        for day in range(1, 11):
+            self.api_client.get('/api/weather/?city=city_a&start_date=2017-01-{:02}'.format(day))
+        self.api_client.get('/api/cities/')
+        stats = self.api_client.get('/api/stats/').json()
+        self.assertEqual(list(stats), ['city_detail-list', 'weather_detail-list'])
+        self.assertEqual(stats['weather_detail-list']['count'], 10)
+        total = stats['weather_detail-list']['metrics']['total']
+        self.assertTrue(0 < total['p50'] <= total['p95'] <= total['p99'])
+
+    def test_percentiles(self):
+        """The percentiles should follow the nearest rank method"""
+        percentiles = instrumentation.get_percentiles(list(range(1, 201)))
+        self.assertEqual(percentiles, {'p50': 100, 'p95': 190, 'p99': 198})
+        self.assertEqual(instrumentation.get_percentiles([3.0]), {'p50': 3.0, 'p95': 3.0, 'p99': 3.0})
+
+    def test_disabled(self):
+        """Requests should not be timed and the stats not be found when the instrumentation is disabled"""
+        with override_settings(WEATHER_INSTRUMENTATION=False):
+            api_client = APIClient()
+            api_response = api_client.get('/api/weather/?city=city_a')
+            self.assertEqual(api_response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('Server-Timing', api_response)
+            self.assertEqual(api_client.get('/api/stats/').status_code, status.HTTP_404_NOT_FOUND)
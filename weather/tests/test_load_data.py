@@ -0,0 +1,208 @@
+"""Unit test for the load_data management command."""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from weather import dataset, ingest, models
+
+HEADER = 'STATION\tSTATION_NAME\tLATITUDE\tLONGITUDE\tELEVATION\tDATE\tTMAX\tTMIN\n'
+
+
+def exit_worker(path, batch_size, queue):
+    """Worker process entry point dying without a message, as on a crash"""
+    os._exit(1)
+
+
+class LoadDataTestCase(TestCase):
+    """Test the load of the weather TSV file."""
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            WEATHER_DATASET_VERSION_FILE=os.path.join(self.temp_dir, 'weather_db.version')
+        )
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.temp_dir)
+
+    def write_file(self, rows, name='weather.tsv'):
+        """Writes the rows as a weather TSV file and returns its path"""
+        path = os.path.join(self.temp_dir, name)
+        with open(path, 'w') as tsv_file:
+            tsv_file.write(HEADER)
+            for row in rows:
+                tsv_file.write('\t'.join(str(value) for value in row) + '\n')
+        return path
+
+    def load(self, *args):
+        """Runs the load_data command and returns its output"""
+        output = StringIO()
+        call_command('load_data', *args, stdout=output)
+        return output.getvalue()
+
+    def test_load_creates_locations_weather_and_rollups(self):
+        """load_data should create the cities, the daily weather and the rollups of a new dataset version"""
+        path = self.write_file([
+            ('GHCND:1', 'CITY A', '52.6', '4.7', '-2.0', '2017-01-02', '40', '30'),
+            ('GHCND:1', 'CITY A', '52.6', '4.7', '-2.0', '2017-01-03', '', '28'),
+            ('GHCND:2', 'CITY B', '40.1', '-3.2', '600.5', '2017-01-02', '60', '45'),
+        ])
+        self.load('--file', path)
+        self.assertEqual(sorted(models.Location.objects.values_list('name', flat=True)), ['CITY A', 'CITY B'])
+        self.assertEqual(models.WeatherDetail.objects.count(), 3)
+        self.assertIsNone(models.WeatherDetail.objects.get(city='CITY A', date='2017-01-03').tmax)
+        self.assertEqual(dataset.get_version(), 1)
+        weekly = models.WeatherRollup.objects.get(
+            city='CITY A', frequency='weekly', temp_format='fahrenheit', start_date='2017-01-02'
+        )
+        self.assertEqual((weekly.tmax_total, weekly.tmax_days, weekly.tmin_total, weekly.tmin_days), (40, 1, 58, 2))
+        self.assertEqual(models.BuiltVersion.objects.get(name='rollups:weekly').version, 1)
+
+    def test_load_writes_in_batches(self):
+        """load_data should write the rows in batches and report the progress after each one"""
+        path = self.write_file([
+            ('GHCND:{}'.format(day % 2), 'CITY {}'.format(day % 2), '1.0', '2.0', '3.0', '2017-01-0{}'.format(day))
+            + (day, '') for day in range(1, 6)
+        ])
+        output = self.load('--file', path, '--batch-size', '2')
+        self.assertIn('Uploaded 2 rows for 2 cities', output)
+        self.assertIn('Uploaded 5 rows for 2 cities', output)
+        self.assertEqual(models.Location.objects.count(), 2)
+        self.assertEqual(models.WeatherDetail.objects.count(), 5)
+
+    def test_invalid_batch_size(self):
+        """load_data should refuse a batch size below 1 without touching the data"""
+        path = self.write_file([('GHCND:1', 'CITY A', '52.6', '4.7', '-2.0', '2017-01-02', '40', '30')])
+        self.load('--file', path)
+        for batch_size in ('0', '-1'):
+            with self.assertRaisesRegex(CommandError, '--batch-size must be at least 1'):
+                self.load('--file', path, '--batch-size', batch_size)
+        self.assertEqual(models.WeatherDetail.objects.count(), 1)
+        self.assertEqual(dataset.get_version(), 1)
+
+    def test_incremental_load_upserts_changed_rows(self):
+        """load_data --incremental should insert new days, update changed days and keep the rest"""
+        self.load('--file', self.write_file([
+            ('GHCND:1', 'CITY A', '52.6', '4.7', '-2.0', '2016-12-30', '50', '35'),
+            ('GHCND:1', 'CITY A', '52.6', '4.7', '-2.0', '2017-01-02', '40', '30'),
+            ('GHCND:1', 'CITY A', '52.6', '4.7', '-2.0', '2017-01-03', '41', '31'),
+        ]))
+        unchanged = models.WeatherDetail.objects.get(city='CITY A', date='2017-01-02')
+        december = models.WeatherRollup.objects.get(
+            city='CITY A', frequency='monthly', temp_format='fahrenheit', start_date='2016-12-01'
+        )
+        output = self.load('--incremental', '--file', self.write_file([
+            ('GHCND:1', 'CITY A', '52.6', '4.7', '-2.0', '2017-01-02', '40', '30'),
+            ('GHCND:1', 'CITY A', '52.6', '4.7', '-2.0', '2017-01-03', '45', '31'),
+            ('GHCND:1', 'CITY A', '52.6', '4.7', '-2.0', '2017-01-04', '', '29'),
+            ('GHCND:2', 'CITY B', '40.1', '-3.2', '600.5', '2017-01-04', '60', '45'),
+        ], name='delta.tsv'))
+        self.assertIn('Inserted 2, updated 1 and skipped 1 rows, inserted 1 and updated 0 cities', output)
+        self.assertEqual(models.WeatherDetail.objects.get(pk=unchanged.pk).tmax, 40)
+        self.assertEqual(models.WeatherDetail.objects.get(city='CITY A', date='2017-01-03').tmax, 45)
+        self.assertEqual(models.WeatherDetail.objects.count(), 5)
+        self.assertEqual(dataset.get_version(), 2)
+        january = models.WeatherRollup.objects.get(
+            city='CITY A', frequency='monthly', temp_format='fahrenheit', start_date='2017-01-01'
+        )
+        self.assertEqual((january.tmax_total, january.tmax_days), (85, 2))
+        self.assertTrue(models.WeatherRollup.objects.filter(pk=december.pk).exists())
+        self.assertEqual(set(models.BuiltVersion.objects.values_list('version', flat=True)), {2})
+        last_day = models.WeatherPrefixSum.objects.get(city='CITY A', temp_format='fahrenheit', date='2017-01-04')
+        self.assertEqual((last_day.tmax_total, last_day.tmax_days, last_day.tmin_total, last_day.tmin_days),
+                         (135, 3, 125, 4))
+
+    def test_incremental_load_updates_changed_days_together(self):
+        """load_data --incremental should update the changed days of a batch with one statement"""
+        rows = [('GHCND:1', 'CITY A', '52.6', '4.7', '-2.0', '2017-01-{:02}'.format(day), '40', '30')
+                for day in range(1, 21)]
+        self.load('--file', self.write_file(rows))
+        path = self.write_file([row[:6] + ('50', '') for row in rows], name='delta.tsv')
+        with CaptureQueriesContext(connection) as queries:
+            output = self.load('--incremental', '--file', path)
+        self.assertIn('Inserted 0, updated 20 and skipped 0 rows', output)
+        updates = [query for query in queries if query['sql'].startswith('UPDATE "weather_weatherdetail"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(set(models.WeatherDetail.objects.values_list('tmax', 'tmin')), {(50, None)})
+
+    def test_incremental_load_without_changes_keeps_version(self):
+        """load_data --incremental with no new or changed rows should not move the dataset version"""
+        path = self.write_file([('GHCND:1', 'CITY A', '52.6', '4.7', '-2.0', '2017-01-02', '40', '30')])
+        self.load('--file', path)
+        output = self.load('--incremental', '--file', path)
+        self.assertIn('Inserted 0, updated 0 and skipped 1 rows', output)
+        self.assertEqual(dataset.get_version(), 1)
+
+    def test_load_directory_with_worker_processes(self):
+        """load_data should read every file of a directory in worker processes and deduplicate the cities"""
+        for year in (2015, 2016, 2017):
+            self.write_file([
+                ('GHCND:1', 'CITY A', '52.6', '4.7', '-2.0', '{}-01-02'.format(year), '40', '30'),
+                ('GHCND:{}'.format(year), 'CITY {}'.format(year), '1.0', '2.0', '3.0', '{}-01-02'.format(year), '', ''),
+            ], name='{}.tsv'.format(year))
+        output = self.load('--file', self.temp_dir, '--workers', '2', '--batch-size', '1')
+        self.assertIn('Found 3 files', output)
+        self.assertIn('Read 2 rows from `{}`'.format(os.path.join(self.temp_dir, '2016.tsv')), output)
+        self.assertEqual(models.Location.objects.count(), 4)
+        self.assertEqual(models.WeatherDetail.objects.filter(city='CITY A').count(), 3)
+
+    def test_load_glob_with_invalid_row_writes_nothing(self):
+        """load_data should stop without writing anything when a file matched by the glob has an invalid row"""
+        self.write_file([('GHCND:1', 'CITY A', '52.6', '4.7', '-2.0', '2017-01-02', '40', '30')], name='a.tsv')
+        self.write_file([('GHCND:2', 'CITY B', '52.6', '4.7', '-2.0', '2017-01-02', 'hot', '30')], name='b.tsv')
+        with self.assertRaisesRegex(CommandError, 'b.tsv:2: invalid row'):
+            self.load('--file', os.path.join(self.temp_dir, '*.tsv'), '--workers', '2')
+        self.assertEqual(models.Location.objects.count(), 0)
+        self.assertEqual(dataset.get_version(), 0)
+
+    def test_invalid_row_reports_its_line(self):
+        """load_data should name the line of the invalid row, not the last line of its batch"""
+        rows = [('GHCND:1', 'CITY A', '52.6', '4.7', '-2.0', '2017-01-{:02}'.format(day), '40', '30')
+                for day in range(1, 11)]
+        rows[3] = rows[3][:6] + ('hot', '30')
+        path = self.write_file(rows, name='w.tsv')
+        with self.assertRaisesRegex(CommandError, 'w.tsv:5: invalid row'):
+            self.load('--file', path)
+
+    def test_unreadable_file_reports_its_path(self):
+        """load_data should name a file that cannot be decoded the same with one worker as with several"""
+        self.write_file([('GHCND:1', 'CITY A', '52.6', '4.7', '-2.0', '2017-01-02', '40', '30')], name='a.tsv')
+        with open(os.path.join(self.temp_dir, 'b.tsv'), 'wb') as tsv_file:
+            tsv_file.write(HEADER.encode('ascii') + b'GHCND:2\tCITY \xff\xfe\t52.6\n')
+        for workers in ('1', '2'):
+            with self.assertRaisesRegex(CommandError, r'b\.tsv: unreadable file, .*codec'):
+                self.load('--file', self.temp_dir, '--workers', workers)
+        self.assertEqual(models.Location.objects.count(), 0)
+
+    def test_spawned_worker_processes(self):
+        """Worker processes started with the spawn method should set Django up before reading"""
+        for year in (2016, 2017):
+            self.write_file([('GHCND:1', 'CITY A', '52.6', '4.7', '-2.0', '{}-01-02'.format(year), '40', '30')],
+                            name='{}.tsv'.format(year))
+        start_method = multiprocessing.get_start_method()
+        multiprocessing.set_start_method('spawn', force=True)
+        try:
+            output = self.load('--file', self.temp_dir, '--workers', '2')
+        finally:
+            multiprocessing.set_start_method(start_method, force=True)
+        self.assertIn('Found 2 files', output)
+        self.assertEqual(models.WeatherDetail.objects.filter(city='CITY A').count(), 2)
+
+    def test_dead_worker_process_fails_the_load(self):
+        """A worker process dying without a message should fail the load instead of waiting on it"""
+        for name in ('a.tsv', 'b.tsv'):
+            self.write_file([('GHCND:1', 'CITY A', '52.6', '4.7', '-2.0', '2017-01-02', '40', '30')], name=name)
+        with mock.patch.object(ingest, 'parse_file', exit_worker), \
+                self.assertRaisesRegex(CommandError, 'worker process failed'):
+            self.load('--file', self.temp_dir, '--workers', '2')
+        self.assertEqual(models.Location.objects.count(), 0)
@@ -0,0 +1,95 @@
+"""Unit test for the keyset pagination of the API end points."""
+
+from django.db import connection
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from weather import models
+from weather.apis import WeatherDetailViewSet
+from weather.pagination import WeatherDetailPagination
+from . import factories
+
+
+class PaginationTestCase(TestCase):
+    """Test the pages of the weather and cities end points."""
+    @classmethod
+    def setUpTestData(cls):
+        factories.LocationFactory.reset_sequence(force=True)
+        factories.WeatherDetailFactory.reset_sequence(force=True)
+        for city in factories.LocationFactory.create_batch(3):
+            factories.WeatherDetailFactory.create_batch(20, city=city)
+
+    def setUp(self):
+        self.api_client = APIClient()
+
+    def get_all_pages(self, url):
+        """Follows the next links from url and returns the results of every page"""
+        results = []
+        while url:
+            response = self.api_client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            results.extend(response.json()['results'])
+            url = response.json()['next']
+        return results
+
+    def test_weather_pages_match_unpaged_list(self):
+        """GET weather with page_size should return the unpaged rows across the pages in the same order"""
+        for query in ('city=city_0', 'city=city_0&ordering=-date&temp_format=celsius',
+                      'city=city_1&start_date=2016-09-25&end_date=2016-10-08', 'city=city_2&ordering=-id'):
+            expected = self.api_client.get('/api/weather/?{}'.format(query)).json()
+            self.assertEqual(self.get_all_pages('/api/weather/?{}&page_size=6'.format(query)), expected)
+
+    def test_weather_pages_reject_nullable_ordering(self):
+        """GET weather with page_size and an ordering on a nullable field should return a bad request"""
+        response = self.api_client.get('/api/weather/?city=city_0&page_size=5&ordering=tmax')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.api_client.get('/api/weather/?city=city_0&page_size=5&cursor=invalid')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_pages_reject_tampered_cursor(self):
+        """GET with a well-formed cursor holding values of the wrong type or shape should return a bad request"""
+        for key in (['not-a-date', 1], ['2016-09-10', 'one'], {'a': 1, 'b': 2}, ['2016-09-10'], [None, 1]):
+            cursor = WeatherDetailPagination.encode_cursor(key)
+            response = self.api_client.get('/api/weather/?city=city_0&page_size=5&cursor={}'.format(cursor))
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, key)
+            self.assertEqual(response.json(), {'cursor': 'Invalid cursor.'})
+        cursor = WeatherDetailPagination.encode_cursor(['abc', 1])
+        response = self.api_client.get('/api/cities/?page_size=5&ordering=latitude&cursor={}'.format(cursor))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_weather_pages_reject_aggregated_frequency(self):
+        """GET weather with page_size and a frequency other than daily should return a bad request"""
+        for query in ('frequency=weekly&ordering=id', 'frequency=weekly', 'frequency=rolling-7-day'):
+            response = self.api_client.get('/api/weather/?city=city_0&{}&page_size=5'.format(query))
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('page_size', response.json())
+        response = self.api_client.get('/api/weather/?city=city_0&frequency=weekly&ordering=id')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsInstance(response.json(), list)
+
+    def test_cities_pages(self):
+        """GET cities with page_size should return the cities by name across the pages"""
+        self.assertEqual(
+            [city['name'] for city in self.get_all_pages('/api/cities/?page_size=2')],
+            sorted(models.Location.objects.values_list('name', flat=True))
+        )
+        self.assertEqual(len(self.api_client.get('/api/cities/').json()), 3)
+
+    def test_deep_page_query_seeks_index(self):
+        """The query of a page after a cursor should seek the index without sorting"""
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN is specific to SQLite')
+        cursor = WeatherDetailPagination.encode_cursor(['2016-09-10', 10])
+        params = {'city': 'city_0', 'cursor': cursor, 'page_size': 5}
+        request = Request(APIRequestFactory().get('/api/weather/', params))
+        view = WeatherDetailViewSet(request=request, format_kwarg=None)
+        queryset = WeatherDetailPagination().get_page_queryset(
+            view.filter_queryset(models.WeatherDetail.objects.all()), request, view
+        )
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as db_cursor:
+            db_cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = [row[-1] for row in db_cursor.fetchall()]
+        self.assertFalse([step for step in plan if step.startswith('SCAN') or 'TEMP B-TREE' in step], plan)
@@ -0,0 +1,125 @@
+"""Unit test for the CSV and columnar formats of the weather list."""
+
+import csv
+import io
+import json
+import unittest
+from datetime import date, timedelta
+from unittest import mock
+
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from weather import renderers
+from . import factories
+
+
+class ColumnarFormatsTestCase(TestCase):
+    """Test the weather API returning the daily rows as CSV, columnar JSON and msgpack."""
+    @classmethod
+    def setUpTestData(cls):
+        city = factories.LocationFactory(name='city_a')
+        for day in range(40):
+            factories.WeatherDetailFactory(city=city, date=date(2017, 1, 1) + timedelta(days=day))
+        factories.WeatherDetailFactory(city=city, date=date(2017, 3, 1), tmax=None, tmin=0)
+
+    def setUp(self):
+        self.api_client = APIClient()
+
+    def get_weather(self, query, **headers):
+        """Returns the API response for a weather query of city_a"""
+        return self.api_client.get('/api/weather/?city=city_a&{}'.format(query), **headers)
+
+    @staticmethod
+    def to_columns(rows):
+        """Converts a JSON list of rows to a map of field name to column"""
+        return {field: [row[field] for row in rows] for field in ('id', 'date', 'tmax', 'tmin')}
+
+    @staticmethod
+    def get_content(api_response):
+        """Returns the body of a response, streamed or not"""
+        if api_response.streaming:
+            return b''.join(api_response.streaming_content)
+        return api_response.content
+
+    def test_columns_match_json(self):
+        """GET in the columnar JSON format should return the same values as the JSON list"""
+        for query in ('temp_format=celsius', 'ordering=-date&start_date=2017-01-10'):
+            expected = self.to_columns(self.get_weather(query).json())
+            api_response = self.get_weather(query + '&format=columns')
+            self.assertEqual(api_response['Content-Type'], 'application/vnd.weather.columns+json')
+            self.assertEqual(json.loads(self.get_content(api_response).decode('utf-8')), expected)
+
+    def test_csv_matches_json(self):
+        """GET in the CSV format, by format param or Accept header, should return the rows of the JSON list"""
+        rows = self.get_weather('temp_format=celsius').json()
+        expected = [['id', 'date', 'tmax', 'tmin']] + [
+            ['' if row[field] is None else str(row[field]) for field in ('id', 'date', 'tmax', 'tmin')]
+            for row in rows
+        ]
+        for api_response in (self.get_weather('temp_format=celsius&format=csv'),
+                             self.get_weather('temp_format=celsius', HTTP_ACCEPT='text/csv')):
+            self.assertEqual(api_response['Content-Type'], 'text/csv; charset=utf-8')
+            content = self.get_content(api_response).decode('utf-8')
+            self.assertEqual(list(csv.reader(io.StringIO(content))), expected)
+
+    def test_csv_is_streamed_in_chunks(self):
+        """GET in the CSV format should stream the same rows whatever the chunk size"""
+        expected = self.get_content(self.get_weather('format=csv'))
+        with mock.patch('weather.apis.WeatherDetailViewSet.stream_chunk_size', 7):
+            api_response = self.get_weather('format=csv')
+            self.assertTrue(api_response.streaming)
+            self.assertEqual(self.get_content(api_response), expected)
+
+    def test_columns_are_spooled_not_gathered(self):
+        """GET in the columnar formats should spool the columns to files, the same bytes coming out in any chunks"""
+        formats = ['columns'] + (['msgpack'] if renderers.msgpack is not None else [])
+        for format_name in formats:
+            expected = self.get_content(self.get_weather('format={}'.format(format_name)))
+            with mock.patch('weather.apis.WeatherDetailViewSet.stream_chunk_size', 7), \
+                    mock.patch.object(renderers.ColumnarRenderer, 'spool_read_size', 16), \
+                    mock.patch.object(renderers.tempfile, 'TemporaryFile', wraps=renderers.tempfile.TemporaryFile) \
+                    as temporary_file:
+                api_response = self.get_weather('format={}'.format(format_name))
+                self.assertTrue(api_response.streaming)
+                self.assertEqual(self.get_content(api_response), expected)
+            self.assertEqual(temporary_file.call_count, 4)
+
+    @unittest.skipIf(renderers.msgpack is None, 'msgpack is not installed')
+    def test_msgpack_matches_json(self):
+        """GET in the msgpack format should return the same values as the JSON list"""
+        expected = self.to_columns(self.get_weather('').json())
+        api_response = self.get_weather('format=msgpack')
+        self.assertEqual(api_response['Content-Type'], 'application/msgpack')
+        self.assertEqual(renderers.msgpack.unpackb(self.get_content(api_response), raw=False), expected)
+
+    def test_paged_csv(self):
+        """GET of a page in the CSV format should return the page rows and the next page in a Link header"""
+        page = self.get_weather('page_size=10').json()
+        api_response = self.get_weather('page_size=10&format=csv')
+        lines = list(csv.reader(io.StringIO(api_response.content.decode('utf-8'))))
+        self.assertEqual([line[0] for line in lines[1:]], [str(row['id']) for row in page['results']])
+        next_page = page['next'].replace('&page_size', '&format=csv&page_size')
+        self.assertEqual(api_response['Link'], '<{}>; rel="next"'.format(next_page))
+
+    def test_aggregated_columns(self):
+        """GET of the monthly averages in the columnar JSON format should return a column per field"""
+        rows = self.get_weather('frequency=monthly').json()
+        columns = self.get_weather('frequency=monthly&format=columns').json()
+        self.assertEqual(columns, {field: [row[field] for row in rows] for field in rows[0]})
+
+    def test_error_is_json(self):
+        """GET in the CSV format of an invalid request should return the error as JSON"""
+        api_response = self.get_weather('frequency=10-day&ordering=tmax&format=csv')
+        self.assertEqual(api_response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(api_response['Content-Type'], 'application/json')
+        self.assertTrue(api_response.json())
+
+    def test_map_csv(self):
+        """GET of the map in the CSV format should return a line per city and day"""
+        rows = self.api_client.get('/api/weather/map/?date=2017-01-05').json()
+        api_response = self.api_client.get('/api/weather/map/?date=2017-01-05&format=csv')
+        lines = list(csv.reader(io.StringIO(api_response.content.decode('utf-8'))))
+        self.assertEqual(lines[0], ['date', 'city', 'latitude', 'longitude', 'tmax', 'tmin'])
+        self.assertEqual(lines[1:], [[str(value) for value in row.values()] for row in rows])
@@ -0,0 +1,84 @@
+"""Unit test for the weekly and monthly rollups."""
+
+import shutil
+import tempfile
+from datetime import date, timedelta
+import os
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from weather import dataset, models, rollups
+from . import factories
+
+
+class RollupTestCase(TestCase):
+    """Test the weather API answering from the rollups."""
+    @classmethod
+    def setUpClass(cls):
+        TestCase.setUpClass()
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.settings_override = override_settings(
+            WEATHER_DATASET_VERSION_FILE=os.path.join(cls.temp_dir, 'weather_db.version')
+        )
+        cls.settings_override.enable()
+        cls.api_client = APIClient()
+        city = factories.LocationFactory(name='rollup_city')
+        for day in range(120):
+            factories.WeatherDetailFactory(city=city, date=date(2017, 1, 1) + timedelta(days=day))
+        factories.WeatherDetailFactory(city=city, date=date(2017, 5, 2), tmax=None, tmin=None)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        shutil.rmtree(cls.temp_dir)
+        TestCase.tearDownClass()
+
+    def setUp(self):
+        caches[settings.WEATHER_CACHE_ALIAS].clear()
+
+    def get_weather(self, query):
+        """Returns the API response for the rollup city"""
+        return self.api_client.get('/api/weather/?city=rollup_city&{}'.format(query)).json()
+
+    def test_rollups_match_daily_aggregation(self):
+        """GET with weekly, monthly or yearly frequency should return the same data from rollups and daily rows"""
+        queries = [
+            'frequency={}&temp_format={}&start_date=2017-01-11&end_date=2017-04-12',
+            'frequency={}&temp_format={}&start_date=2017-01-01&end_date=2017-02-28&ordering=-date',
+            'frequency={}&temp_format={}&start_date=2017-02-07&end_date=2017-02-09',
+            'frequency={}&temp_format={}&end_date=2017-03-15',
+            'frequency={}&temp_format={}',
+        ]
+        for frequency in ('weekly', 'monthly', 'yearly'):
+            for temp_format in ('fahrenheit', 'celsius'):
+                expected = [self.get_weather(query.format(frequency, temp_format)) for query in queries]
+                rollups.build_rollups(dataset.set_version(1))
+                # The range of the first query holds no full year, so yearly totals are read from the daily rows.
+                with self.assertNumQueries(2 if frequency == 'yearly' else 4):
+                    self.get_weather(queries[0].format(frequency, temp_format))
+                actual = [self.get_weather(query.format(frequency, temp_format)) for query in queries]
+                self.assertEqual(actual, expected)
+                dataset.set_version(0)
+
+    def test_stale_rollups_are_not_used(self):
+        """GET with monthly frequency should fall back to the daily rows when the dataset version has moved on"""
+        rollups.build_rollups(dataset.set_version(1))
+        models.WeatherDetail.objects.filter(date__month=3).update(tmax=100)
+        dataset.set_version(2)
+        response = self.get_weather('frequency=monthly&start_date=2017-03-01&end_date=2017-03-31')
+        self.assertEqual(response[0]['tmax'], 100)
+        self.assertFalse(rollups.rollups_are_current(dataset.get_version()))
+
+    def test_rollups_missing_for_frequency_are_not_used(self):
+        """GET with yearly frequency should fall back to the daily rows when no yearly rollups were built"""
+        rollups.build_rollups(dataset.set_version(1))
+        expected = self.get_weather('frequency=yearly&start_date=2017-01-01')
+        models.WeatherRollup.objects.filter(frequency='yearly').update(tmax_total=0)
+        models.BuiltVersion.objects.filter(name='rollups:yearly').delete()
+        caches[settings.WEATHER_CACHE_ALIAS].clear()
+        self.assertFalse(rollups.rollups_are_current(1, 'yearly'))
+        self.assertTrue(rollups.rollups_are_current(1, 'monthly'))
+        self.assertEqual(self.get_weather('frequency=yearly&start_date=2017-01-01'), expected)
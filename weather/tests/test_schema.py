@@ -0,0 +1,59 @@
+"""Unit test for the API documentation and the lean mode."""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+# Loads the project in lean mode, printing whether the admin is installed and the Swagger views were imported.
+LEAN_SCRIPT = '''
+import json, sys
+import django
+django.setup()
+import project.urls
+from django.apps import apps
+print(json.dumps([apps.is_installed('django.contrib.admin'), 'rest_framework_swagger.views' in sys.modules]))
+'''
+
+
+class SchemaTestCase(TestCase):
+    """Test the schema served from the file written by build_schema."""
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.schema_file = os.path.join(self.temp_dir, 'weather_schema.json')
+        self.api_client = APIClient()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_lean_mode_serves_built_schema(self):
+        """GET of the schema in lean mode should return the file written by build_schema"""
+        call_command('build_schema', '--output', self.schema_file, stdout=StringIO())
+        with open(self.schema_file, 'rb') as schema_file:
+            content = schema_file.read()
+        self.assertIn('/api/weather/', json.loads(content.decode('utf-8'))['paths'])
+        with override_settings(WEATHER_LEAN=True, WEATHER_SCHEMA_FILE=self.schema_file):
+            response = self.api_client.get('/api/schema/')
+        self.assertEqual(response['Content-Type'], 'application/openapi+json')
+        self.assertEqual(response.content, content)
+
+    def test_lean_mode_without_built_schema(self):
+        """GET of the schema in lean mode should generate it when build_schema has not run"""
+        with override_settings(WEATHER_LEAN=True, WEATHER_SCHEMA_FILE=self.schema_file):
+            paths = json.loads(self.api_client.get('/api/schema/').content.decode('utf-8'))['paths']
+        expected = json.loads(self.api_client.get('/api/schema/?format=openapi').content.decode('utf-8'))['paths']
+        self.assertEqual(sorted(paths), sorted(expected))
+
+    def test_lean_mode_does_not_load_documentation(self):
+        """The lean mode should leave out the admin and not import the Swagger views until the schema is requested"""
+        environment = dict(os.environ, DJANGO_SETTINGS_MODULE='project.settings', WEATHER_LEAN='1')
+        output = subprocess.check_output([sys.executable, '-c', LEAN_SCRIPT], env=environment, cwd=settings.BASE_DIR)
+        self.assertEqual(json.loads(output.decode('utf-8')), [False, False])
@@ -0,0 +1,103 @@
+"""Unit test for the nearest cities lookup."""
+
+import math
+import os
+import random
+import shutil
+import tempfile
+
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from weather import dataset, spatial
+from . import factories
+
+
+class NearestTestCase(TestCase):
+    """Test the cities API finding the cities closest to a position."""
+    @classmethod
+    def setUpTestData(cls):
+        generator = random.Random(16)
+        for number in range(300):
+            factories.LocationFactory(
+                name='city_{:03}'.format(number), latitude=round(generator.uniform(-90, 90), 6),
+                longitude=round(generator.uniform(-180, 180), 6)
+            )
+        factories.LocationFactory(name='east_city', latitude=10, longitude=179.9)
+        factories.LocationFactory(name='west_city', latitude=10, longitude=-179.8)
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            WEATHER_DATASET_VERSION_FILE=os.path.join(self.temp_dir, 'weather_db.version')
+        )
+        self.settings_override.enable()
+        self.api_client = APIClient()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.temp_dir)
+
+    def get_nearest(self, query):
+        """Returns the API response for a nearest cities query"""
+        return self.api_client.get('/api/cities/nearest/?{}'.format(query))
+
+    @staticmethod
+    def get_distance(latitude, longitude, city):
+        """Computes the great circle distance to a city in km with the haversine formula"""
+        lat1, lon1 = math.radians(latitude), math.radians(longitude)
+        lat2, lon2 = math.radians(float(city['latitude'])), math.radians(float(city['longitude']))
+        haversine = math.sin((lat2 - lat1) / 2) ** 2 + \
+            math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+        return 2 * spatial.EARTH_RADIUS_KM * math.asin(math.sqrt(haversine))
+
+    def test_nearest_matches_full_scan(self):
+        """GET of the nearest cities should return the same cities and distances as a scan of every city"""
+        cities = self.api_client.get('/api/cities/').json()
+        for latitude, longitude in ((52.6, 4.7), (-89.9, 12), (89.5, -170), (0, 180), (-33.9, -179.99)):
+            response = self.get_nearest('lat={}&lon={}&k=5'.format(latitude, longitude)).json()
+            expected = sorted(cities, key=lambda city: self.get_distance(latitude, longitude, city))[:5]
+            self.assertEqual([city['name'] for city in response], [city['name'] for city in expected])
+            for city in response:
+                self.assertAlmostEqual(city['distance'], self.get_distance(latitude, longitude, city), places=2)
+
+    def test_nearest_across_antimeridian(self):
+        """GET of the nearest city should find a city on the other side of the antimeridian"""
+        response = self.get_nearest('lat=10&lon=-179.95').json()
+        self.assertEqual([city['name'] for city in response], ['west_city'])
+        response = self.get_nearest('lat=10&lon=-179.95&radius=20').json()
+        self.assertEqual(sorted(city['name'] for city in response), ['east_city', 'west_city'])
+
+    def test_radius_matches_full_scan(self):
+        """GET of the cities in a radius should return every city closer than the radius, closest first"""
+        cities = self.api_client.get('/api/cities/').json()
+        response = self.get_nearest('lat=20&lon=30&radius=3000').json()
+        expected = [city['name'] for city in sorted(cities, key=lambda city: self.get_distance(20, 30, city))
+                    if self.get_distance(20, 30, city) <= 3000]
+        self.assertEqual([city['name'] for city in response], expected)
+        self.assertEqual(len(self.get_nearest('lat=20&lon=30&radius=3000&k=2').json()), min(2, len(expected)))
+
+    def test_index_is_reused_until_next_load(self):
+        """GET of the nearest cities should not read the DB again until the dataset version changes"""
+        dataset.set_version(1)
+        self.get_nearest('lat=0&lon=0')
+        with self.assertNumQueries(0):
+            self.get_nearest('lat=10&lon=10&k=3')
+        dataset.set_version(2)
+        with self.assertNumQueries(1):
+            self.get_nearest('lat=10&lon=10&k=3')
+
+    def test_index_is_reused_without_version(self):
+        """Before any load has recorded a dataset version the index should be built again only when the cities change"""
+        self.get_nearest('lat=0&lon=0')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_nearest('lat=10&lon=-179.9&k=1').json()[0]['name'], 'west_city')
+        factories.LocationFactory(name='far_west_city', latitude=10, longitude=-179.9)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.get_nearest('lat=10&lon=-179.9&k=1').json()[0]['name'], 'far_west_city')
+
+    def test_invalid_position(self):
+        """GET of the nearest cities without a position or with one out of range should return 400"""
+        for query in ('lon=10', 'lat=91&lon=10', 'lat=10&lon=10&k=0', 'lat=10&lon=10&radius=-1'):
+            self.assertEqual(self.get_nearest(query).status_code, status.HTTP_400_BAD_REQUEST, query)
@@ -0,0 +1,118 @@
+"""Unit test for the date range summaries and the running totals behind them."""
+
+import os
+import shutil
+import tempfile
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from weather import dataset, models, summaries
+from . import factories
+
+
+class SummaryTestCase(TestCase):
+    """Test the weather API summarizing a date range."""
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('summary_city', 'other_city'):
+            city = factories.LocationFactory(name=name)
+            for day in range(90):
+                factories.WeatherDetailFactory(city=city, date=date(2017, 1, 1) + timedelta(days=day))
+        factories.WeatherDetailFactory(city=city, date=date(2017, 4, 1), tmax=None, tmin=0)
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            WEATHER_DATASET_VERSION_FILE=os.path.join(self.temp_dir, 'weather_db.version')
+        )
+        self.settings_override.enable()
+        caches[settings.WEATHER_CACHE_ALIAS].clear()
+        self.api_client = APIClient()
+
+    def tearDown(self):
+        caches[settings.WEATHER_CACHE_ALIAS].clear()
+        self.settings_override.disable()
+        shutil.rmtree(self.temp_dir)
+
+    def get_summary(self, query):
+        """Returns the API summary response"""
+        return self.api_client.get('/api/weather/summary/?{}'.format(query)).json()
+
+    def test_summary_matches_daily_weather(self):
+        """GET of a summary should return the same data from the running totals and the daily weather"""
+        queries = [
+            'city=summary_city&temp_format={}',
+            'city=summary_city&temp_format={}&start_date=2017-01-11&end_date=2017-03-12',
+            'city=other_city&temp_format={}&start_date=2017-03-31',
+            'city=other_city&temp_format={}&end_date=2016-12-31',
+        ]
+        for temp_format in ('fahrenheit', 'celsius'):
+            expected = [self.get_summary(query.format(temp_format)) for query in queries]
+            summaries.build_prefix_sums(dataset.set_version(1))
+            caches[settings.WEATHER_CACHE_ALIAS].clear()
+            for query, data in zip(queries, expected):
+                self.assertEqual(self.get_summary(query.format(temp_format)), data)
+            dataset.set_version(0)
+
+    def test_summary_average_matches_monthly_average(self):
+        """GET of a summary over a month should return the monthly average"""
+        summaries.build_prefix_sums(dataset.set_version(1))
+        monthly = self.api_client.get('/api/weather/?city=summary_city&frequency=monthly').json()
+        summary = self.get_summary('city=summary_city&start_date=2017-02-01&end_date=2017-02-28')
+        self.assertEqual(summary['tmax']['average'], monthly[1]['tmax'])
+        self.assertEqual(summary['tmin']['average'], monthly[1]['tmin'])
+        self.assertEqual(summary['tmax']['days'], 28)
+
+    def test_summary_cost_does_not_grow_with_range(self):
+        """GET of a summary should read two running totals and a few blocks whatever the length of the range"""
+        summaries.build_prefix_sums(dataset.set_version(1))
+        for query in ('start_date=2017-01-01&end_date=2017-01-20', 'start_date=1900-01-01&end_date=2099-12-31'):
+            with self.assertNumQueries(5):
+                self.get_summary('city=summary_city&{}'.format(query))
+        with self.assertNumQueries(4):
+            self.get_summary('city=other_city&end_date=2017-01-31&temp_format=celsius')
+        self.assertLessEqual(len(summaries.get_range_blocks(0, date.max.toordinal() >> summaries.MIN_LEVEL)),
+                             2 * (summaries.MAX_LEVEL - summaries.MIN_LEVEL + 1))
+
+    def test_block_extremes_match_daily_weather(self):
+        """The extremes of any range should be the same from the blocks and edge days as from the daily weather"""
+        queryset = models.WeatherDetail.objects.filter(city='other_city')
+        expected = {}
+        ranges = [(date(2017, 1, 1) + timedelta(days=start), date(2017, 1, 1) + timedelta(days=start + length))
+                  for start in (-3, 0, 5, 17, 40) for length in (0, 6, 9, 31, 60)]
+        for temp_format in ('fahrenheit', 'celsius'):
+            for start_date, end_date in ranges:
+                expected[temp_format, start_date, end_date] = summaries.get_summary(
+                    queryset.filter(date__gte=start_date, date__lte=end_date), 'other_city', temp_format, start_date,
+                    end_date, use_prefix_sums=False
+                )
+        summaries.build_prefix_sums(1)
+        for (temp_format, start_date, end_date), summary in expected.items():
+            actual = summaries.get_summary(queryset.filter(date__gte=start_date, date__lte=end_date), 'other_city',
+                                           temp_format, start_date, end_date)
+            self.assertEqual(actual, summary, (temp_format, start_date, end_date))
+
+    def test_extended_prefix_sums_match_full_build(self):
+        """Extending the running totals of a city from a changed day should give the same rows as a full build"""
+        summaries.build_prefix_sums(1)
+        models.WeatherDetail.objects.filter(city='summary_city', date__gte=date(2017, 2, 10)).update(tmax=70)
+        summaries.build_prefix_sums(2, since={'summary_city': date(2017, 2, 10)})
+        fields = ('city', 'temp_format', 'date') + summaries.TOTAL_FIELDS
+        extreme_fields = ('city', 'temp_format', 'level', 'block') + summaries.EXTREME_FIELDS
+        extended = sorted(models.WeatherPrefixSum.objects.values_list(*fields))
+        extended_extremes = sorted(models.WeatherExtreme.objects.values_list(*extreme_fields))
+        summaries.build_prefix_sums(2)
+        self.assertEqual(extended, sorted(models.WeatherPrefixSum.objects.values_list(*fields)))
+        self.assertEqual(extended_extremes, sorted(models.WeatherExtreme.objects.values_list(*extreme_fields)))
+
+    def test_summary_with_invalid_filters(self):
+        """GET of a summary without a city or with an invalid filter should return 400"""
+        for query in ('start_date=2017-01-01', 'city=summary_city&temp_format=kelvin',
+                      'city=summary_city&start_date=2017-03-01&end_date=2017-02-01'):
+            response = self.api_client.get('/api/weather/summary/?{}'.format(query))
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, query)
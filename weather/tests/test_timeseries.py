@@ -0,0 +1,126 @@
+"""Unit test for the in-process time series store."""
+
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from weather import dataset, models, snapshot, timeseries
+from . import factories
+
+
+@unittest.skipIf(timeseries.np is None, 'numpy is not installed')
+@override_settings(WEATHER_RESPONSE_CACHE=False)
+class TimeSeriesTestCase(TestCase):
+    """Test the weather API answering from the time series store."""
+    @classmethod
+    def setUpTestData(cls):
+        city = factories.LocationFactory(name='series_city')
+        for day in range(100):
+            factories.WeatherDetailFactory(city=city, date=date(2017, 1, 1) + timedelta(days=day))
+        factories.WeatherDetailFactory(city=city, date=date(2017, 4, 15), tmax=None, tmin=None)
+        factories.WeatherDetailFactory(city=city, date=date(2017, 4, 16), tmax=0, tmin=32)
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            WEATHER_DATASET_VERSION_FILE=os.path.join(self.temp_dir, 'weather_db.version'),
+            WEATHER_SNAPSHOT_FILE=os.path.join(self.temp_dir, 'weather_db.snapshot'),
+        )
+        self.settings_override.enable()
+        dataset.set_version(1)
+        self.api_client = APIClient()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.temp_dir)
+
+    def get_weather(self, query, store):
+        """Returns the API response for the test city with or without the store"""
+        with override_settings(WEATHER_TIMESERIES_STORE=store):
+            return self.api_client.get('/api/weather/?city=series_city&{}'.format(query)).json()
+
+    def test_store_matches_database(self):
+        """GET of any frequency and format should return the same data from the store and the DB"""
+        queries = [
+            'temp_format={}&frequency={}',
+            'temp_format={}&frequency={}&start_date=2017-01-11&end_date=2017-03-12',
+            'temp_format={}&frequency={}&start_date=2017-02-07&end_date=2017-02-07&ordering=-date',
+            'temp_format={}&frequency={}&end_date=2017-04-16&ordering=-date',
+            'temp_format={}&frequency={}&start_date=2018-01-01',
+        ]
+        for frequency in ('daily', 'weekly', 'monthly', 'yearly'):
+            for temp_format in ('fahrenheit', 'celsius'):
+                for query in queries:
+                    query = query.format(temp_format, frequency)
+                    self.assertEqual(self.get_weather(query, True), self.get_weather(query, False), query)
+
+    def test_store_answers_without_database(self):
+        """GET of a city already in the store should not touch the DB until the dataset version changes"""
+        self.get_weather('frequency=weekly', True)
+        with self.assertNumQueries(0):
+            self.get_weather('frequency=monthly&temp_format=celsius&start_date=2017-02-01', True)
+        models.WeatherDetail.objects.filter(date=date(2017, 1, 1)).update(tmax=99)
+        self.assertNotEqual(self.get_weather('end_date=2017-01-01', True)[0]['tmax'], 99)
+        dataset.set_version(2)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_weather('end_date=2017-01-01', True)[0]['tmax'], 99)
+
+    def test_store_is_not_used_without_dataset_version(self):
+        """GET before any data load has recorded a dataset version should be answered from the DB"""
+        dataset.set_version(0)
+        self.assertEqual(timeseries.get_store(), (None, None))
+        with self.assertNumQueries(1):
+            self.get_weather('', True)
+
+    def test_snapshot_matches_database(self):
+        """GET should return the same data from the memory mapped snapshot as from the DB, without touching the DB"""
+        factories.WeatherDetailFactory(city=factories.LocationFactory(name='other_city'), date=date(2017, 1, 1))
+        call_command('build_snapshot', stdout=StringIO())
+        for query in ('frequency=daily', 'frequency=weekly&temp_format=celsius', 'frequency=monthly&ordering=-date',
+                      'start_date=2017-04-10&end_date=2017-04-20&temp_format=celsius'):
+            expected = self.get_weather(query, False)
+            with self.assertNumQueries(0):
+                self.assertEqual(self.get_weather(query, True), expected, query)
+        with self.assertNumQueries(0), override_settings(WEATHER_TIMESERIES_STORE=True):
+            self.assertEqual(self.api_client.get('/api/weather/?city=unknown_city').json(), [])
+
+    def test_snapshot_of_other_version_is_ignored(self):
+        """GET after a data load not followed by a snapshot should be answered from the DB"""
+        snapshot.write_snapshot(os.path.join(self.temp_dir, 'weather_db.snapshot'), 1)
+        models.WeatherDetail.objects.filter(date=date(2017, 1, 1)).update(tmax=99)
+        dataset.set_version(2)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_weather('end_date=2017-01-01', True)[0]['tmax'], 99)
+
+    def test_missing_snapshot_is_not_mapped_again(self):
+        """Lookups of a snapshot of another version should not map the file until it is replaced"""
+        path = os.path.join(self.temp_dir, 'weather_db.snapshot')
+        snapshot.write_snapshot(path, 1)
+        with mock.patch.object(snapshot, 'Snapshot', wraps=snapshot.Snapshot) as snapshot_class:
+            for _ in range(3):
+                self.assertIsNone(snapshot.get_snapshot(2))
+            self.assertEqual(snapshot_class.call_count, 0)
+            os.remove(path)
+            self.assertIsNone(snapshot.get_snapshot(2))
+            snapshot.write_snapshot(path, 2)
+            self.assertEqual(snapshot.get_snapshot(2).version, 2)
+            self.assertEqual(snapshot_class.call_count, 1)
+
+    def test_snapshot_rejects_out_of_range_values(self):
+        """Writing a snapshot should fail on a temperature not fitting its column instead of wrapping it"""
+        path = os.path.join(self.temp_dir, 'weather_db.snapshot')
+        snapshot.write_snapshot(path, 1)
+        models.WeatherDetail.objects.filter(date=date(2017, 1, 1)).update(tmax=40000)
+        with self.assertRaisesRegex(ValueError, 'tmax values outside'):
+            snapshot.write_snapshot(path, 2)
+        self.assertEqual(snapshot.read_header(path)[0], 1)
+        with self.assertRaisesRegex(CommandError, 'tmax values outside'):
+            call_command('build_snapshot', stdout=StringIO())
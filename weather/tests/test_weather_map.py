@@ -0,0 +1,69 @@
+"""Unit test for the weather of every city over a date range."""
+
+from datetime import date, timedelta
+
+from django.db import connection
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from weather import models
+from . import factories
+
+
+class WeatherMapTestCase(TestCase):
+    """Test the weather API returning every city for a date range."""
+    @classmethod
+    def setUpTestData(cls):
+        for number in range(5):
+            city = factories.LocationFactory(latitude=50 + number, longitude=4.5 + number)
+            for day in range(10):
+                if (number + day) % 4:
+                    factories.WeatherDetailFactory(city=city, date=date(2017, 1, 1) + timedelta(days=day))
+        factories.WeatherDetailFactory(city=city, date=date(2017, 1, 20), tmax=None, tmin=40)
+
+    def setUp(self):
+        self.api_client = APIClient()
+
+    def test_map_matches_daily_weather(self):
+        """GET of the map should return every city of each day with the same temperatures as the daily list"""
+        for query in ('date=2017-01-03', 'start_date=2017-01-02&end_date=2017-01-05&temp_format=celsius'):
+            with self.assertNumQueries(1):
+                response = self.api_client.get('/api/weather/map/?{}'.format(query)).json()
+            expected = []
+            for city in models.Location.objects.order_by('name'):
+                daily = self.api_client.get('/api/weather/?city={}&{}'.format(
+                    city.name, query.replace('date=2017-01-03', 'start_date=2017-01-03&end_date=2017-01-03')
+                )).json()
+                expected.extend({
+                    'date': row['date'], 'city': city.name, 'latitude': '{:.6f}'.format(city.latitude),
+                    'longitude': '{:.6f}'.format(city.longitude), 'tmax': row['tmax'], 'tmin': row['tmin'],
+                } for row in daily)
+            self.assertEqual(response, sorted(expected, key=lambda row: (row['date'], row['city'])), query)
+
+    def test_map_reports_missing_temperatures(self):
+        """GET of the map should return null for a missing temperature and nothing for a date without data"""
+        response = self.api_client.get('/api/weather/map/?date=2017-01-20').json()
+        self.assertEqual([(row['tmax'], row['tmin']) for row in response], [(None, 40)])
+        self.assertEqual(self.api_client.get('/api/weather/map/?date=2016-01-01').json(), [])
+
+    def test_map_query_uses_date_index(self):
+        """The map query should search the date first index without reading the weather table or sorting"""
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN is specific to SQLite')
+        queryset = models.WeatherDetail.objects.filter(
+            date__gte=date(2017, 1, 2), date__lte=date(2017, 1, 5)
+        ).order_by('date', 'city').values_list('date', 'city', 'city__latitude', 'city__longitude', 'tmax', 'tmin')
+        sql, sql_params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, sql_params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        self.assertTrue(any('weather_date_city_temps_idx' in step for step in plan), plan)
+        self.assertFalse([step for step in plan if step.startswith('SCAN') or 'TEMP B-TREE' in step], plan)
+
+    def test_map_with_invalid_range(self):
+        """GET of the map without a date, with an inverted range or with a range too long should return 400"""
+        for query in ('', 'start_date=2017-01-02', 'start_date=2017-01-05&end_date=2017-01-02',
+                      'start_date=2017-01-01&end_date=2017-02-01', 'date=2017-13-01'):
+            response = self.api_client.get('/api/weather/map/?{}'.format(query))
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, query)
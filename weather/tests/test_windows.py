@@ -0,0 +1,101 @@
+"""Unit test for the N-day and rolling N-day frequencies."""
+
+from datetime import date, timedelta
+
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from weather import models
+from . import factories
+
+
+class WindowTestCase(TestCase):
+    """Test the weather API averaging N-day periods and rolling N-day windows."""
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('window_city', 'other_city'):
+            city = factories.LocationFactory(name=name)
+            for day in range(120):
+                if day % 17 != 5:
+                    factories.WeatherDetailFactory(city=city, date=date(2017, 1, 1) + timedelta(days=day))
+        factories.WeatherDetailFactory(city=city, date=date(2017, 5, 10), tmax=None, tmin=0)
+
+    def setUp(self):
+        self.api_client = APIClient()
+
+    def get_weather(self, query, path='/api/weather/'):
+        """Returns the API response for the window city"""
+        return self.api_client.get('{}?city=window_city&{}'.format(path, query)).json()
+
+    @staticmethod
+    def get_average(days, temp_format, field):
+        """Averages a field of the days the slow way, skipping zero and missing temperatures"""
+        values = [getattr(day, field) for day in days]
+        if temp_format == 'celsius':
+            values = models.WeatherDetail.convert_column_to_celsius(values)
+        values = [value for value in values if value]
+        return round(sum(values) / len(values)) if values else 'N/A'
+
+    def get_expected(self, start_date, end_date, window_days, rolling, temp_format):
+        """Recomputes each window from scratch"""
+        days = list(models.WeatherDetail.objects.filter(city='window_city').order_by('date'))
+        expected = []
+        for day in days:
+            if not start_date <= day.date <= end_date:
+                continue
+            if rolling:
+                first_day, key = day.date - timedelta(days=window_days - 1), day.date
+            else:
+                first_day = start_date + timedelta(days=(day.date - start_date).days // window_days * window_days)
+                key = first_day
+                if expected and expected[-1]['date'] == key.strftime('%Y-%m-%d'):
+                    continue
+            in_window = [other for other in days if first_day <= other.date <= first_day + timedelta(
+                days=window_days - 1) and (rolling or other.date <= end_date)]
+            expected.append({
+                'date': key.strftime('%Y-%m-%d'), 'tmax': self.get_average(in_window, temp_format, 'tmax'),
+                'tmin': self.get_average(in_window, temp_format, 'tmin'),
+            })
+        return expected
+
+    def test_windows_match_recomputed_windows(self):
+        """GET with an N-day or rolling N-day frequency should match the averages recomputed for each window"""
+        for frequency, window_days, rolling in (('rolling-7-day', 7, True), ('rolling-30-day', 30, True),
+                                                ('10-day', 10, False), ('1-day', 1, False)):
+            for temp_format in ('fahrenheit', 'celsius'):
+                query = 'frequency={}&temp_format={}&start_date=2017-02-03&end_date=2017-04-20'.format(
+                    frequency, temp_format
+                )
+                with self.assertNumQueries(1):
+                    response = self.get_weather(query)
+                expected = self.get_expected(date(2017, 2, 3), date(2017, 4, 20), window_days, rolling, temp_format)
+                self.assertEqual(response, expected, query)
+                self.assertEqual(self.get_weather(query + '&ordering=-date'), expected[::-1])
+
+    def test_windows_without_start_date(self):
+        """GET with an N-day frequency and no start date should start the periods on the first day"""
+        response = self.get_weather('frequency=30-day')
+        self.assertEqual([row['date'] for row in response], ['2017-01-01', '2017-01-31', '2017-03-02', '2017-04-01'])
+        rolling = self.get_weather('frequency=rolling-3-day&end_date=2017-01-10')
+        self.assertEqual(rolling[0]['date'], '2017-01-01')
+        self.assertEqual(len(rolling), 9)
+
+    def test_batch_windows_match_single_city(self):
+        """GET of a batch with a rolling frequency should return the same data as one request per city"""
+        query = 'frequency=rolling-14-day&start_date=2017-03-01&temp_format=celsius'
+        response = self.api_client.get('/api/weather/batch/?city=window_city&city=other_city&{}'.format(query)).json()
+        self.assertEqual(response['window_city'], self.get_weather(query))
+        self.assertEqual(
+            response['other_city'], self.api_client.get('/api/weather/?city=other_city&{}'.format(query)).json()
+        )
+
+    def test_invalid_window_frequencies(self):
+        """GET with a malformed N-day frequency should return no data, and with a non date ordering 400"""
+        for query in ('frequency=0-day', 'frequency=rolling-day', 'frequency=rolling-7-days',
+                      'frequency=rolling-7-day&start_date=yesterday'):
+            self.assertEqual(self.get_weather(query), [], query)
+            response = self.api_client.get('/api/weather/batch/?city=window_city&{}'.format(query))
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, query)
+        response = self.api_client.get('/api/weather/?city=window_city&frequency=rolling-7-day&ordering=tmax')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
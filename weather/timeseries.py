@@ -0,0 +1,194 @@
+"""
+In-process columnar store of the daily weather of each city, answering the weather list from memory.
+Needs numpy, and is only used when WEATHER_TIMESERIES_STORE is set. The arrays are views on the memory mapped snapshot
+when build_snapshot or load_data has written one for the current dataset version, and are read from the DB otherwise.
+"""
+
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from . import dataset, models, snapshot
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 1970-01-01, day 0 of the datetime64[D] arrays, was a thursday.
+EPOCH_WEEKDAY = 3
+
+
+class CitySeries(object):
+    """Dates and temperatures of a city as contiguous arrays sorted by date, with masks for the missing values."""
+
+    def __init__(self, ids, days, tmax, tmin, tmax_missing, tmin_missing):
+        """
+        :param ids: Integer array of WeatherDetail ids.
+        :param days: int32 array of dates as days since 1970-01-01, sorted.
+        :param tmax: Integer array of max temperatures in fahrenheit.
+        :param tmin: Integer array of min temperatures in fahrenheit.
+        :param tmax_missing: bool array, True where tmax is missing.
+        :param tmin_missing: bool array, True where tmin is missing.
+        """
+        self.ids, self.days = ids, days
+        self.tmax, self.tmin = tmax, tmin
+        self.tmax_missing, self.tmin_missing = tmax_missing, tmin_missing
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Builds the arrays from (id, date, tmax, tmin) rows ordered by date.
+        :param rows: List of tuples.
+        :return: CitySeries object.
+        """
+        ids, dates, tmax, tmin = zip(*rows) if rows else ((), (), (), ())
+        tmax_missing = np.array([value is None for value in tmax], dtype=bool)
+        tmin_missing = np.array([value is None for value in tmin], dtype=bool)
+        return cls(
+            np.array(ids, dtype=np.int64),
+            np.array(dates, dtype='datetime64[D]').astype(np.int32),
+            np.array([value or 0 for value in tmax], dtype=np.int32),
+            np.array([value or 0 for value in tmin], dtype=np.int32),
+            tmax_missing, tmin_missing
+        )
+
+    @classmethod
+    def from_columns(cls, columns):
+        """
+        Wraps the columns of a city in a snapshot, without copying them.
+        :param columns: Tuple of the ids, days, tmax and tmin arrays, MISSING where a temperature is missing.
+        :return: CitySeries object.
+        """
+        ids, days, tmax, tmin = columns
+        return cls(ids, days, tmax, tmin, tmax == snapshot.MISSING, tmin == snapshot.MISSING)
+
+    def get_range(self, start_date=None, end_date=None):
+        """
+        Finds the positions of a date range with a binary search.
+        :param start_date: First day of the range, None for no lower bound.
+        :param end_date: Last day of the range, None for no upper bound.
+        :return: Slice of the positions in the range.
+        """
+        start = 0 if start_date is None else np.searchsorted(self.days, np.datetime64(start_date, 'D').astype(np.int32))
+        end = len(self.days) if end_date is None else \
+            np.searchsorted(self.days, np.datetime64(end_date, 'D').astype(np.int32), side='right')
+        return slice(start, end)
+
+    @staticmethod
+    def to_celsius(values):
+        """Converts an array of fahrenheit temperatures to rounded celsius, as WeatherDetail does"""
+        return np.round((values - 32) * (5 / 9)).astype(np.int32)
+
+    def get_temperatures(self, positions, temp_format):
+        """Returns the tmax and tmin arrays of a range in the requested format"""
+        tmax, tmin = self.tmax[positions].astype(np.int32), self.tmin[positions].astype(np.int32)
+        if temp_format == 'celsius':
+            tmax, tmin = self.to_celsius(tmax), self.to_celsius(tmin)
+        return tmax, tmin
+
+    @staticmethod
+    def to_list(values, missing):
+        """Converts an array to a list with None for the missing values"""
+        return [None if is_missing else value for value, is_missing in zip(values.tolist(), missing.tolist())]
+
+    def get_daily(self, start_date=None, end_date=None, temp_format='fahrenheit', descending=False):
+        """
+        Returns the daily weather of a date range, same as WeatherDetailRowSerializer.
+        :return: List of maps with the id, date, tmax and tmin of each day.
+        """
+        positions = self.get_range(start_date, end_date)
+        tmax, tmin = self.get_temperatures(positions, temp_format)
+        columns = (
+            self.ids[positions].tolist(),
+            np.datetime_as_string(self.days[positions].astype('datetime64[D]')).tolist(),
+            self.to_list(tmax, self.tmax_missing[positions]),
+            self.to_list(tmin, self.tmin_missing[positions]),
+        )
+        data = [{'id': row[0], 'date': row[1], 'tmax': row[2], 'tmin': row[3]} for row in zip(*columns)]
+        return data[::-1] if descending else data
+
+    def get_period_starts(self, days, frequency):
+        """Returns the days of the start of the week, month or year of each day"""
+        if frequency == 'weekly':
+            return days - (days + EPOCH_WEEKDAY) % 7
+        unit = 'datetime64[Y]' if frequency == 'yearly' else 'datetime64[M]'
+        return days.astype('datetime64[D]').astype(unit).astype('datetime64[D]').astype(np.int32)
+
+    def get_totals_by_period(self, start_date=None, end_date=None, frequency='weekly', temp_format='fahrenheit',
+                             descending=False):
+        """
+        Computes the total min and max temperatures for each week, month or year of a date range.
+        Zero and missing temperatures are skipped, same as the aggregation in the database.
+        :return: Ordered map of start_date as key and (total_tmax, total_tmin, days_tmax, days_tmin) as value.
+        """
+        positions = self.get_range(start_date, end_date)
+        if positions.start >= positions.stop:
+            return OrderedDict()
+        tmax, tmin = self.get_temperatures(positions, temp_format)
+        tmax_present = ~self.tmax_missing[positions] & (tmax != 0)
+        tmin_present = ~self.tmin_missing[positions] & (tmin != 0)
+
+        period_starts = self.get_period_starts(self.days[positions], frequency)
+        periods, first_positions = np.unique(period_starts, return_index=True)
+        columns = (
+            np.datetime_as_string(periods.astype('datetime64[D]')).tolist(),
+            np.add.reduceat(np.where(tmax_present, tmax, 0), first_positions).tolist(),
+            np.add.reduceat(np.where(tmin_present, tmin, 0), first_positions).tolist(),
+            np.add.reduceat(tmax_present.astype(np.int32), first_positions).tolist(),
+            np.add.reduceat(tmin_present.astype(np.int32), first_positions).tolist(),
+        )
+        totals = [(row[0], row[1:]) for row in zip(*columns)]
+        return OrderedDict(totals[::-1] if descending else totals)
+
+
+class TimeSeriesStore(object):
+    """Lazily built map of city to CitySeries, emptied when the dataset version changes."""
+
+    def __init__(self):
+        self.version = None
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def load_series(self, city):
+        """Reads the daily weather of a city from the DB"""
+        return CitySeries.from_rows(list(
+            models.WeatherDetail.objects.filter(city=city).order_by('date').values_list('id', 'date', 'tmax', 'tmin')
+        ))
+
+    def get_series(self, city, version):
+        """
+        Returns the series of a city from the snapshot of the dataset version, or from the DB on first access.
+        :param city: City name.
+        :param version: Current dataset version.
+        :return: CitySeries object, empty for an unknown city.
+        """
+        mapped = snapshot.get_snapshot(version)
+        if mapped is not None:
+            return CitySeries.from_columns(mapped.get_columns(city))
+        with self.lock:
+            if version != self.version:
+                self.version, self.series = version, {}
+            series = self.series.get(city)
+        if series is None:
+            series = self.load_series(city)
+            with self.lock:
+                if version == self.version:
+                    self.series[city] = series
+        return series
+
+
+STORE = TimeSeriesStore()
+
+
+def get_store():
+    """
+    Returns the time series store when it is enabled and usable.
+    It is only used once load_data has recorded a dataset version, as the data may change without one.
+    :return: Tuple of the TimeSeriesStore object and dataset version, (None, None) when not usable.
+    """
+    version = dataset.get_version()
+    if np is None or not settings.WEATHER_TIMESERIES_STORE or not version:
+        return None, None
+    return STORE, version
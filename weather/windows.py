@@ -0,0 +1,87 @@
+"""N-day periods and rolling N-day averages of the daily weather, computed in one pass over the days."""
+
+import re
+from collections import OrderedDict, deque
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+
+from . import aggregation, models
+
+WINDOW_FREQUENCY = re.compile(r'^(?P<rolling>rolling-)?(?P<days>[1-9][0-9]{0,3})-day$')
+
+
+def parse_frequency(frequency):
+    """
+    Reads the window of an N-day or rolling N-day frequency.
+    :param frequency: Frequency requested e.g '10-day' or 'rolling-30-day'.
+    :return: Tuple of 'periods' or 'rolling' and the number of days, None for the other frequencies.
+    """
+    match = WINDOW_FREQUENCY.match(frequency or '')
+    if match is None:
+        return None
+    return 'rolling' if match.group('rolling') else 'periods', int(match.group('days'))
+
+
+def validate_frequency(frequency):
+    """
+    Validates the frequency filter.
+    :exception: ValidationError if the frequency is neither daily, a calendar period nor an N-day window.
+    """
+    if frequency != 'daily' and frequency not in aggregation.PERIOD_FUNCTIONS and parse_frequency(frequency) is None:
+        raise ValidationError('Select daily, weekly, monthly, yearly, N-day or rolling-N-day.')
+
+
+def get_first_date(window, start_date):
+    """Returns the first day to read for a date range, including the days before it in the first rolling window"""
+    kind, days = window
+    return start_date - timedelta(days=days - 1) if kind == 'rolling' else start_date
+
+
+def get_present_temperatures(rows, temp_format):
+    """
+    Converts the temperatures of the daily rows, zero and missing temperatures being skipped as in the other averages.
+    :param rows: Iterable of (date, tmax, tmin) tuples.
+    :param temp_format: fahrenheit or celsius.
+    :return: Generator of (date, tmax, tmin) tuples with None for a skipped temperature.
+    """
+    for date, tmax, tmin in rows:
+        if temp_format == 'celsius':
+            tmax, tmin = models.WeatherDetail.convert_column_to_celsius((tmax, tmin))
+        yield date, tmax or None, tmin or None
+
+
+def get_totals_by_window(rows, window, temp_format='fahrenheit', start_date=None, descending=False):
+    """
+    Computes the total min and max temperatures for each N-day period, or for the rolling N-day window ending on each
+    day. The rolling window is moved a day at a time, adding the new day and dropping the day leaving it.
+    :param rows: Iterable of (date, tmax, tmin) tuples ordered by date, starting N - 1 days before start_date for a
+    rolling window.
+    :param window: Tuple of 'periods' or 'rolling' and the number of days, as given by parse_frequency.
+    :param temp_format: fahrenheit or celsius.
+    :param start_date: First day of the range, periods start from it, or from the first row when None.
+    :param descending: True to return the latest period first.
+    :return: Ordered map of start_date as key and (total_tmax, total_tmin, days_tmax, days_tmin) as value, where
+    start_date is the start of the N-day period or the last day of the rolling window.
+    """
+    kind, days = window
+    totals = OrderedDict()
+    in_window, tmax_total, tmin_total, tmax_days, tmin_days = deque(), 0, 0, 0, 0
+    for date, tmax, tmin in get_present_temperatures(rows, temp_format):
+        if kind == 'periods':
+            start_date = start_date or date
+            key = (start_date + timedelta(days=(date - start_date).days // days * days)).strftime('%Y-%m-%d')
+            period_tmax, period_tmin, period_tmax_days, period_tmin_days = totals.get(key, (0, 0, 0, 0))
+            totals[key] = (period_tmax + (tmax or 0), period_tmin + (tmin or 0),
+                           period_tmax_days + (tmax is not None), period_tmin_days + (tmin is not None))
+            continue
+        in_window.append((date, tmax, tmin))
+        tmax_total, tmin_total = tmax_total + (tmax or 0), tmin_total + (tmin or 0)
+        tmax_days, tmin_days = tmax_days + (tmax is not None), tmin_days + (tmin is not None)
+        while in_window[0][0] <= date - timedelta(days=days):
+            _, old_tmax, old_tmin = in_window.popleft()
+            tmax_total, tmin_total = tmax_total - (old_tmax or 0), tmin_total - (old_tmin or 0)
+            tmax_days, tmin_days = tmax_days - (old_tmax is not None), tmin_days - (old_tmin is not None)
+        if start_date is None or date >= start_date:
+            totals[date.strftime('%Y-%m-%d')] = (tmax_total, tmin_total, tmax_days, tmin_days)
+    return OrderedDict(reversed(list(totals.items()))) if descending else totals